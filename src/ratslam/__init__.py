@@ -1,8 +1,18 @@
 x__version__ = "0.1"
 
+from .kernels import get_backend, set_backend
 from .image_generator import *
+from .frame_ring import *
+from .frozen_map import *
+from .image_sequence import *
 from .experience_map import *
+from .evaluation import *
+from .map_stream import *
+from .map_tiles import *
 from .pose_cells import *
+from .replay import *
+from .pipeline import *
+from .sharded_matcher import *
 from .view_cells import *
 from .visual_odometry import *
 
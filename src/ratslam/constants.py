@@ -109,6 +109,7 @@ def compare_segments(seg1, seg2, slen):
 PC_VT_INJECT_ENERGY     = 0.1
 PC_DIM_XY               = 61
 PC_DIM_TH               = 36
+PC_FINE_DIM_XY          = 31
 PC_W_E_VAR              = 1
 PC_W_E_DIM              = 7
 PC_W_I_VAR              = 2
@@ -128,6 +129,9 @@ PC_XY_SUM_COS_LOOKUP    = np.cos(np.multiply(range(1, PC_DIM_XY+1), (2*np.pi)/PC
 PC_TH_SUM_SIN_LOOKUP    = np.sin(np.multiply(range(1, PC_DIM_TH+1), (2*np.pi)/PC_DIM_TH))
 PC_TH_SUM_COS_LOOKUP    = np.cos(np.multiply(range(1, PC_DIM_TH+1), (2*np.pi)/PC_DIM_TH))
 PC_CELLS_TO_AVG         = 3;
+PC_PACKET_CANDIDATES    = 512
+PC_QUIESCENT_EPS        = 1e-6
+PC_QUIESCENT_STEPS      = 3
 PC_AVG_XY_WRAP          = list(range(PC_DIM_XY-PC_CELLS_TO_AVG, PC_DIM_XY)) + list(range(PC_DIM_XY)) + list(range(PC_CELLS_TO_AVG))
 PC_AVG_TH_WRAP          = list(range(PC_DIM_TH-PC_CELLS_TO_AVG, PC_DIM_TH)) + list(range(PC_DIM_TH)) + list(range(PC_CELLS_TO_AVG))
 IMAGE_Y_SIZE            = 640
@@ -144,6 +148,7 @@ VT_MATCH_THRESHOLD      = 0.09
 EXP_DELTA_PC_THRESHOLD  = 1.0
 EXP_CORRECTION          = 0.5
 EXP_LOOPS               = 100
+EXP_MOVED_EPS           = 1e-6
 VTRANS_SCALE            = 100
 VISUAL_ODO_SHIFT_MATCH  = 140
 ODO_ROT_SCALING         = np.pi/180./7.
@@ -0,0 +1,259 @@
+import sys
+import time
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import numpy as np
+
+EARTH_RADIUS = 6371000.
+
+
+@dataclass
+class Evaluation:
+    """Accuracy of a trajectory against a reference, with the cost of the run.
+
+    ate_*: absolute trajectory error after alignment, in reference units
+    rpe_rmse: relative error of the displacements over rpe_delta frames
+    precision, recall: of the frames the map places at an experience seen
+        at least min_gap frames before, see loop_closures
+    fps, peak_rss_mb: of the run that produced the trajectory, if known
+    """
+    n_frames: int
+    ate_rmse: float
+    ate_mean: float
+    ate_median: float
+    ate_max: float
+    rpe_rmse: float
+    rpe_delta: int
+    precision: float
+    recall: float
+    n_experiences: int
+    n_templates: Optional[int] = None
+    fps: Optional[float] = None
+    peak_rss_mb: Optional[float] = None
+
+    def __str__(self):
+        out = (f"{self.n_frames} frames  ATE rmse {self.ate_rmse:.3f} "
+               f"(mean {self.ate_mean:.3f}, max {self.ate_max:.3f})  "
+               f"RPE/{self.rpe_delta} rmse {self.rpe_rmse:.3f}  "
+               f"loops P {self.precision:.3f} R {self.recall:.3f}  "
+               f"{self.n_experiences} experiences")
+        if self.n_templates is not None:
+            out += f"  {self.n_templates} templates"
+        if self.fps is not None:
+            out += f"  {self.fps:.2f} frames/s"
+        if self.peak_rss_mb is not None and not np.isnan(self.peak_rss_mb):
+            out += f"  peak {self.peak_rss_mb:.0f} MB"
+        return out
+
+
+def latlon_to_xy(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """GPS fixes in degrees to metres east, north of the first fix
+    (equirectangular, fine for the extent of a route)."""
+    lat, lon = np.radians(lat), np.radians(lon)
+    x = (lon - lon[0]) * np.cos(lat[0]) * EARTH_RADIUS
+    y = (lat - lat[0]) * EARTH_RADIUS
+    return np.stack([x, y], axis=1)
+
+
+def load_reference(path: str) -> np.ndarray:
+    """
+    Load a reference trajectory, one row per frame, from a csv with a
+    header. Positions are read from x, y columns, or from lat, lon (or
+    latitude, longitude) columns converted with latlon_to_xy.
+    return an (n, 2) array.
+    """
+    data = np.genfromtxt(path, delimiter=',', names=True)
+    names = [n.lower() for n in data.dtype.names]
+
+    def column(*options):
+        for option in options:
+            if option in names:
+                return np.atleast_1d(data[data.dtype.names[names.index(option)]])
+        return None
+
+    x, y = column('x', 'x_m'), column('y', 'y_m')
+    if x is not None and y is not None:
+        return np.stack([x, y], axis=1)
+    lat, lon = column('lat', 'latitude'), column('lon', 'lng', 'longitude')
+    if lat is not None and lon is not None:
+        return latlon_to_xy(lat, lon)
+    raise Exception(f"{path} has neither x, y nor lat, lon columns")
+
+
+def umeyama(src: np.ndarray, dst: np.ndarray,
+            with_scale: bool = True) -> Tuple[float, np.ndarray, np.ndarray]:
+    """
+    Least squares similarity transform from src to dst (Umeyama 1991).
+    return scale s, rotation R and translation t, dst ~ s * R @ src + t.
+    """
+    mu_src, mu_dst = src.mean(axis=0), dst.mean(axis=0)
+    x_src, x_dst = src - mu_src, dst - mu_dst
+    cov = x_dst.T @ x_src / len(src)
+    U, D, Vt = np.linalg.svd(cov)
+    S = np.eye(src.shape[1])
+    if np.linalg.det(U) * np.linalg.det(Vt) < 0:
+        S[-1, -1] = -1
+    R = U @ S @ Vt
+    var_src = np.sum(x_src**2) / len(src)
+    s = np.sum(D * np.diag(S)) / var_src if with_scale and var_src > 0 else 1.
+    return s, R, mu_dst - s * R @ mu_src
+
+
+def align(est: np.ndarray, ref: np.ndarray, with_scale: bool = True) -> np.ndarray:
+    """est moved onto ref with umeyama. The scale is free by default,
+    experience map units are not metres."""
+    s, R, t = umeyama(est, ref, with_scale)
+    return s * est @ R.T + t
+
+
+def ate(est: np.ndarray, ref: np.ndarray) -> np.ndarray:
+    """Absolute trajectory errors of every frame of an aligned est."""
+    return np.linalg.norm(est - ref, axis=1)
+
+
+def rpe(est: np.ndarray, ref: np.ndarray, delta: int = 1) -> np.ndarray:
+    """Relative pose errors, of the displacements over delta frames."""
+    if len(est) <= delta:
+        return np.zeros(0)
+    return np.linalg.norm((est[delta:] - est[:-delta]) - (ref[delta:] - ref[:-delta]), axis=1)
+
+
+def revisits(ref: np.ndarray, radius: float, min_gap: int,
+             chunk: int = 1 << 20) -> np.ndarray:
+    """
+    Frames of ref that are within radius of a position ref was at least
+    min_gap frames earlier, the loop closures a perfect map would make.
+
+    The positions are hashed into a grid of radius/sqrt(2) wide cells, so
+    an earlier frame in the same cell is always close enough. Only the frames
+    that have none are compared with the earlier frames of the 5x5 cells
+    around them, chunk pairs at a time.
+    """
+    n = len(ref)
+    side = radius / np.sqrt(2)
+    cells = np.floor((ref - ref.min(axis=0)) / side).astype(np.int64) + 2
+    n_y = int(cells[:, 1].max()) + 3
+    code = cells[:, 0] * n_y + cells[:, 1]
+    order = np.argsort(code, kind='stable')
+    # (cell, frame) keys in ascending order
+    keys = code[order] * n + order
+    latest = np.arange(n) - min_gap
+
+    def earlier(dx, dy):
+        """first key index and number of the frames <= latest in the cell
+        at dx, dy of each frame."""
+        q = code + dx * n_y + dy
+        lo = np.searchsorted(keys, q * n, 'left')
+        hi = np.searchsorted(keys, q * n + latest, 'right')
+        return lo, np.where(latest >= 0, np.maximum(hi - lo, 0), 0)
+
+    found = earlier(0, 0)[1] > 0
+    # nearest cells first, they are the likeliest to settle a frame
+    offsets = sorted(((dx, dy) for dx in range(-2, 3) for dy in range(-2, 3)
+                      if (dx, dy) != (0, 0)), key=lambda o: o[0]**2 + o[1]**2)
+    for dx, dy in offsets:
+        lo, counts = earlier(dx, dy)
+        todo = np.flatnonzero((counts > 0) & ~found)
+        ends = np.cumsum(counts[todo])
+        start = 0
+        while start < len(todo):
+            # frames todo[start:stop] with at most chunk pairs
+            stop = max(int(np.searchsorted(ends, ends[start] - counts[todo[start]] + chunk,
+                                           'right')), start + 1)
+            rows = todo[start:stop]
+            c = counts[rows]
+            i = np.repeat(rows, c)
+            first = np.repeat(lo[rows] - np.cumsum(c) + c, c)
+            j = order[first + np.arange(len(i))]
+            near = np.sum((ref[i] - ref[j])**2, axis=1) < radius**2
+            found[i[near]] = True
+            start = stop
+    return found
+
+
+def loop_closures(exp_ids: np.ndarray, ref: np.ndarray, radius: float,
+                  min_gap: int) -> Tuple[float, float]:
+    """
+    Precision and recall of the loop closures of a run.
+
+    A frame counts as closed when its current experience was first current
+    at least min_gap frames before, and correctly closed when ref was within
+    radius of where it was then. The frames to close are revisits.
+    """
+    frames = np.arange(len(exp_ids))
+    _, first_frame, inverse = np.unique(exp_ids, return_index=True, return_inverse=True)
+    seen = first_frame[inverse]
+
+    closed = (seen <= frames - min_gap) & (exp_ids >= 0)
+    correct = closed & (np.sum((ref - ref[seen])**2, axis=1) < radius**2)
+    truth = revisits(ref, radius, min_gap)
+    precision = np.count_nonzero(correct) / max(np.count_nonzero(closed), 1)
+    recall = np.count_nonzero(correct & truth) / max(np.count_nonzero(truth), 1)
+    return precision, recall
+
+
+def evaluate(trajectory: np.ndarray, ref: np.ndarray, radius: float = 5.,
+             min_gap: int = 50, rpe_delta: int = 10, with_scale: bool = True,
+             **run) -> Evaluation:
+    """
+    Compare an experience map trajectory with a reference.
+
+    trajectory: (n, 5) rows of step, exp id, x_m, y_m, facing_rad, as
+        written by MapStream (read_trajectory), one per frame.
+    ref: (n, 2) reference positions of the same frames, see load_reference.
+        Both are cut to the shorter one.
+    radius, min_gap: what counts as a loop closure, see loop_closures.
+    run: n_templates, fps and peak_rss_mb of the run, reported as they are.
+    """
+    n = min(len(trajectory), len(ref))
+    if n < 2:
+        raise Exception("need at least 2 frames to evaluate")
+    trajectory, ref = trajectory[:n], np.asarray(ref[:n], dtype=float)
+    exp_ids = trajectory[:, 1].astype(int)
+
+    est = align(trajectory[:, 2:4], ref, with_scale)
+    errors = ate(est, ref)
+    rel = rpe(est, ref, rpe_delta)
+    precision, recall = loop_closures(exp_ids, ref, radius, min_gap)
+    return Evaluation(
+        n_frames=n,
+        ate_rmse=float(np.sqrt(np.mean(errors**2))),
+        ate_mean=float(np.mean(errors)),
+        ate_median=float(np.median(errors)),
+        ate_max=float(np.max(errors)),
+        rpe_rmse=float(np.sqrt(np.mean(rel**2))) if len(rel) else 0.,
+        rpe_delta=rpe_delta,
+        precision=precision,
+        recall=recall,
+        n_experiences=len(np.unique(exp_ids[exp_ids >= 0])),
+        **run
+    )
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process so far, in MB, nan where it
+    isn't available (windows)."""
+    try:
+        import resource
+    except ImportError:
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+def run_pipeline(pipeline, frames) -> Tuple[np.ndarray, float]:
+    """
+    Run a FusedPipeline over frames.
+    return the (n, 5) trajectory of the current experience, like MapStream
+    writes it, and the frames per second.
+    """
+    trajectory = np.zeros((len(frames), 5))
+    graph = pipeline.experience_map
+    start = time.perf_counter()
+    for k, frame in enumerate(frames):
+        pipeline.step(frame)
+        e = graph.current_exp
+        trajectory[k] = (k, -1, 0, 0, 0) if e is None else (k, e.id, e.x_m, e.y_m, e.facing_rad)
+    return trajectory, len(frames) / (time.perf_counter() - start)
@@ -1,3 +1,4 @@
+import itertools
 from typing import List, Tuple
 import numpy as np
 
@@ -12,6 +13,11 @@ from lava.magma.core.sync.protocols.loihi_protocol import LoihiProtocol
 
 from ratslam.util import *
 from ratslam.constants import *
+from ratslam.frozen_map import FrozenMap
+from ratslam.kernels import relax_map
+from ratslam.map_stream import MapStream, MapUpdate, exp_rows
+from ratslam.map_tiles import TileExporter
+from ratslam.view_cells import CELL_MSG_SIZE, UNMATCHED, decode_cell
 
 class Experience(object):
     '''A single experience.
@@ -20,24 +26,28 @@ class Experience(object):
     view cell modules.
     '''
 
-    def __init__(self, x_pc, y_pc, th_pc, x_m, y_m, facing_rad, view_cell):
+    def __init__(self, exp_id, x_pc, y_pc, th_pc, x_m, y_m, facing_rad, view_cell_id):
         '''Initializes the Experience.
+        :param exp_id: index of the experience in the experience map.
         :param x_pc: index x of the current pose cell.
         :param y_pc: index y of the current pose cell.
         :param th_pc: index th of the current pose cell.
         :param x_m: the position of axis x in the experience map.
         :param y_m: the position of axis x in the experience map.
         :param facing_rad: the orientation of the experience, in radians.
-        :param view_cell: the last most activated view cell.
+        :param view_cell_id: template id of the last most activated view cell.
         '''
+        self.id = exp_id
         self.x_pc = x_pc
         self.y_pc = y_pc
         self.th_pc = th_pc
         self.x_m = x_m
         self.y_m = y_m
         self.facing_rad = facing_rad
-        self.view_cell = view_cell
+        self.view_cell_id = view_cell_id
         self.links = []
+        # ids of the targets of links, for duplicate checks
+        self.link_targets = set()
 
     def link_to(self, target, accum_delta_x, accum_delta_y, 
                                              accum_delta_facing):
@@ -59,6 +69,8 @@ class Experience(object):
         )
         link = ExperienceLink(self, target, facing_rad, d, heading_rad)
         self.links.append(link)
+        self.link_targets.add(target.id)
+        return link
 
 class ExperienceLink(object):
     '''A representation of connection between experiences.'''
@@ -71,42 +83,158 @@ class ExperienceLink(object):
         :param d: the euclidean distance between the Experiences.
         :param heading_rad: the angle (in radians) between the Experiences.
         '''
+        self.parent = parent
         self.target = target
         self.facing_rad = facing_rad
         self.d = d
         self.heading_rad = heading_rad
 
 
+def pc_distances(pcs, x_pc, y_pc, th_pc, dim_xy, dim_th) -> np.ndarray:
+    '''Wrapped distances between the (n, 3) pose cell coordinates pcs and a
+    pose, like min_delta over each axis.'''
+    d = np.abs(np.asarray(pcs, dtype=float).reshape(-1, 3) - (x_pc, y_pc, th_pc))
+    d = np.minimum(d, np.array([dim_xy, dim_xy, dim_th]) - d)
+    return np.sqrt(d[:, 0]**2 + d[:, 1]**2 + d[:, 2]**2)
+
+
+class ExperienceIndex:
+    '''Experiences by view cell in a hash grid over their pose cell
+    coordinates.
+
+    The buckets are at least `size` wide and wrap around like the pose cells,
+    so every experience of a view cell closer than `size` to a pose is in the
+    3x3x3 buckets around it, whatever the number of experiences.
+    '''
+
+    def __init__(self, dim_xy, dim_th, size=EXP_DELTA_PC_THRESHOLD):
+        self.dims = np.array([dim_xy, dim_xy, dim_th], dtype=float)
+        self.n_buckets = np.maximum((self.dims // size).astype(int), 1)
+        self.bucket_size = self.dims / self.n_buckets
+        self.buckets = {}
+
+    def _bucket(self, x_pc, y_pc, th_pc):
+        b = (np.array([x_pc, y_pc, th_pc]) % self.dims) // self.bucket_size
+        return tuple(int(i) for i in np.minimum(b, self.n_buckets - 1))
+
+    def add(self, exp):
+        key = (exp.view_cell_id,) + self._bucket(exp.x_pc, exp.y_pc, exp.th_pc)
+        self.buckets.setdefault(key, []).append(exp)
+
+    def near(self, view_cell_id, x_pc, y_pc, th_pc):
+        '''The experiences of view_cell_id in the buckets around the pose.'''
+        bx, by, bth = self._bucket(x_pc, y_pc, th_pc)
+        nx, ny, nth = self.n_buckets
+        keys = {(view_cell_id, (bx + i) % nx, (by + j) % ny, (bth + k) % nth)
+                for i, j, k in itertools.product((-1, 0, 1), repeat=3)}
+        return [e for key in keys for e in self.buckets.get(key, ())]
+
 
 class ExperienceMap(AbstractProcess):
-    def __init__(self) -> None:
-        super().__init__()
-        self.cell_in = InPort(shape=(4,))
+    def __init__(self, stream_len: int = 256, trajectory_path: str = None,
+                 trajectory_chunk: int = 1024, pc_dim_xy: int = PC_DIM_XY,
+                 pc_dim_th: int = PC_DIM_TH, relax_every: int = 1,
+                 map_path: str = None, tiles_path: str = None,
+                 tiles_every: int = 100) -> None:
+        """
+        stream_len: number of MapUpdates kept for consumers, see MapStream.
+        trajectory_path: csv file the trajectory is appended to, in chunks of
+            trajectory_chunk rows.
+        pc_dim_xy, pc_dim_th: size of the pose range the pose cells send,
+            for wrapped distances between poses.
+        relax_every: the map is relaxed on loop closures, at most once every
+            relax_every frames. Closures in between wait for the next one.
+        map_path: a map saved with save_map. If given, the experience map
+            only localizes in it (ExperienceLocalizer) and exp_out has id -1
+            until the first experience is recognized.
+        tiles_path: directory the map is exported to as level of detail
+            tiles (TileExporter), the tiles changed since the last export are
+            rewritten every tiles_every frames.
+        """
+        super().__init__(stream_len=stream_len, trajectory_path=trajectory_path,
+                         trajectory_chunk=trajectory_chunk, pc_dim_xy=pc_dim_xy,
+                         pc_dim_th=pc_dim_th, relax_every=relax_every,
+                         map_path=map_path, tiles_path=tiles_path,
+                         tiles_every=tiles_every)
+        self.cell_in = InPort(shape=(CELL_MSG_SIZE,))
         self.vtrans_vrot_in = InPort(shape=(2,))
         self.pose_in = InPort(shape=(3,))
 
-@implements(proc=ExperienceMap, protocol=LoihiProtocol)
-@requires(CPU)
-class PyExperienceMapModel(PyLoihiProcessModel):
-    cell_in: PyInPort = LavaPyType(PyInPort.VEC_DENSE, int, precision=32)
-    vtrans_vrot_in: PyInPort = LavaPyType(PyInPort.VEC_DENSE, float, precision=32)
-    pose_in: PyInPort = LavaPyType(PyInPort.VEC_DENSE, float, precision=32)
-
-    def __init__(self, proc_params):
-        super().__init__(proc_params=proc_params)
-
+        # id, x_m, y_m, facing_rad of the current experience
+        self.exp_out = OutPort(shape=(4,))
+        # signals that a frame went all the way through the pipeline,
+        # connect to ImageGenerator.ready_in for adaptive pacing
+        self.ready_out = OutPort(shape=(1,))
+
+class ExperienceGraph:
+    """
+    The experience map, the computation of PyExperienceMapModel without the
+    ports, so the fused pipeline can run it too. step returns the MapUpdate
+    of the frame, which is also pushed to the stream.
+
+    step is integrate followed by update. A scheduler that does not update
+    the map every frame still integrates the odometry of every frame, and
+    the next update sees all of it.
+    """
+
+    def __init__(self, stream_len: int = 256, trajectory_path: str = None,
+                 trajectory_chunk: int = 1024, pc_dim_xy: int = PC_DIM_XY,
+                 pc_dim_th: int = PC_DIM_TH, relax_every: int = 1,
+                 tiles_path: str = None, tiles_every: int = 100) -> None:
+        self.dim_xy = pc_dim_xy
+        self.dim_th = pc_dim_th
         self.size = 0
         self.exps = []
-        
+        # experiences by the template id of their view cell
+        self.cell_exps = {}
+        self.index = ExperienceIndex(pc_dim_xy, pc_dim_th)
+
         self.current_exp = None
-        self.current_view_cell = None
 
         self.accum_delta_x = 0
         self.accum_delta_y = 0
         self.accum_delta_facing = np.pi/2
 
-        self.history = [] #?
-
+        # incremental output instead of keeping the whole history around
+        self.stream = MapStream(
+            maxlen=stream_len,
+            trajectory_path=trajectory_path,
+            chunk_size=trajectory_chunk
+        )
+        self.tiles = TileExporter(tiles_path) if tiles_path is not None else None
+        self.tiles_every = tiles_every
+        self.n_steps = 0
+        self.n_frames = 0
+        self.relax_every = relax_every
+        self.closure_pending = False
+        self.last_relax = None
+        self._new_exps = []
+        self._new_links = []
+
+    @classmethod
+    def from_params(cls, params):
+        if params.get('map_path') is not None:
+            frozen = FrozenMap(params['map_path'])
+            if (params.get('pc_dim_xy', frozen.pc_dim_xy) != frozen.pc_dim_xy or
+                    params.get('pc_dim_th', frozen.pc_dim_th) != frozen.pc_dim_th):
+                raise Exception(f"{params['map_path']} was built with "
+                                f"{frozen.pc_dim_xy}x{frozen.pc_dim_th} pose cells")
+            return ExperienceLocalizer(
+                frozen,
+                stream_len=params.get('stream_len', 256),
+                trajectory_path=params.get('trajectory_path'),
+                trajectory_chunk=params.get('trajectory_chunk', 1024)
+            )
+        return cls(
+            stream_len=params.get('stream_len', 256),
+            trajectory_path=params.get('trajectory_path'),
+            trajectory_chunk=params.get('trajectory_chunk', 1024),
+            pc_dim_xy=params.get('pc_dim_xy', PC_DIM_XY),
+            pc_dim_th=params.get('pc_dim_th', PC_DIM_TH),
+            relax_every=params.get('relax_every', 1),
+            tiles_path=params.get('tiles_path'),
+            tiles_every=params.get('tiles_every', 100)
+        )
 
     def _create_exp(self, x_pc, y_pc, th_pc, view_cell):
         '''Creates a new Experience object.
@@ -127,23 +255,45 @@ class PyExperienceMapModel(PyLoihiProcessModel):
             x_m += self.current_exp.x_m
             y_m += self.current_exp.y_m
 
-        exp = Experience(x_pc, y_pc, th_pc, x_m, y_m, facing_rad, view_cell)
+        exp = Experience(self.size - 1, x_pc, y_pc, th_pc, x_m, y_m, facing_rad, view_cell.id)
 
         if self.current_exp is not None:
-            self.current_exp.link_to(exp, self.accum_delta_x, self.accum_delta_y, self.accum_delta_facing)
+            self._link(self.current_exp, exp)
 
         self.exps.append(exp)
-        view_cell.exps.append(exp)
+        self._new_exps.append(exp)
+        self.cell_exps.setdefault(view_cell.id, []).append(exp)
+        self.index.add(exp)
 
         return exp
 
-    def post_guard(self):
-        return True
-
-    def run_post_mgmt(self):
-        """Post-Management phase: executed only when guard function above
-        returns True.
-        """
+    def _link(self, parent, target):
+        '''Links parent to target using the accumulated odometry.'''
+        link = parent.link_to(target, self.accum_delta_x, self.accum_delta_y, self.accum_delta_facing)
+        self._new_links.append(link)
+
+    def _publish(self, moved):
+        '''Pushes the changes of this step to the stream and the out port.'''
+        update = MapUpdate(
+            step=self.n_steps,
+            current_id=self.current_exp.id,
+            new_exps=exp_rows(self._new_exps),
+            new_links=np.array([[l.parent.id, l.target.id] for l in self._new_links],
+                               dtype=int).reshape(-1, 2),
+            moved=exp_rows(moved)
+        )
+        self._new_exps = []
+        self._new_links = []
+
+        self.stream.push(update)
+        self.stream.log_pose(self.n_steps, self.current_exp)
+        if self.tiles is not None:
+            self.tiles.update(update)
+            if self.n_steps % self.tiles_every == 0:
+                self.tiles.flush()
+        return update
+
+    def step(self, view_cell, vtrans, vrot, x_pc, y_pc, th_pc) -> MapUpdate:
         '''Run an interaction of the experience map.
         :param view_cell: the last most activated view cell.
         :param x_pc: index x of the current pose cell.
@@ -152,28 +302,39 @@ class PyExperienceMapModel(PyLoihiProcessModel):
         :param vtrans: the translation of the robot given by odometry.
         :param vrot: the rotation of the robot given by odometry.
         '''
-        view_cell = self.cell_in.recv()
-        vtrans, vrot = self.vtrans_vrot_in.recv() 
-        x_pc, y_pc, th_pc = self.pose_in.recv()
+        self.integrate(vtrans, vrot)
+        return self.update(view_cell, x_pc, y_pc, th_pc)
 
+    def integrate(self, vtrans, vrot) -> None:
+        '''Accumulate the odometry of a frame.
+        :param vtrans: the translation of the robot given by odometry.
+        :param vrot: the rotation of the robot given by odometry.
+        '''
         #% integrate the delta x, y, facing
         self.accum_delta_facing = clip_rad_180(self.accum_delta_facing + vrot)
         self.accum_delta_x += vtrans*np.cos(self.accum_delta_facing)
         self.accum_delta_y += vtrans*np.sin(self.accum_delta_facing)
+        self.n_frames += 1
 
+    def update(self, view_cell, x_pc, y_pc, th_pc) -> MapUpdate:
+        '''Create or match an experience with the odometry integrated so far.
+        :param view_cell: the last most activated view cell.
+        :param x_pc: index x of the current pose cell.
+        :param y_pc: index y of the current pose cell.
+        :param th_pc: index th of the current pose cell.
+        '''
         if self.current_exp is None:
             delta_pc = 0
         else:
-            delta_pc = np.sqrt(
-                min_delta(self.current_exp.x_pc, x_pc, PC_DIM_XY)**2 + \
-                min_delta(self.current_exp.y_pc, y_pc, PC_DIM_XY)**2 + \
-                min_delta(self.current_exp.th_pc, th_pc, PC_DIM_TH)**2
-            )
+            e = self.current_exp
+            delta_pc = pc_distances((e.x_pc, e.y_pc, e.th_pc), x_pc, y_pc, th_pc,
+                                    self.dim_xy, self.dim_th)[0]
 
         # if the vt is new or the pc x,y,th has changed enough create a new
         # experience
         adjust_map = False
-        if len(view_cell.exps) == 0 or delta_pc > EXP_DELTA_PC_THRESHOLD:
+        cell_exps = self.cell_exps.get(view_cell.id, [])
+        if len(cell_exps) == 0 or delta_pc > EXP_DELTA_PC_THRESHOLD:
             exp = self._create_exp(x_pc, y_pc, th_pc, view_cell)
 
             self.current_exp = exp
@@ -182,7 +343,7 @@ class PyExperienceMapModel(PyLoihiProcessModel):
             self.accum_delta_facing = self.current_exp.facing_rad
 
         # if the vt has changed (but isn't new) search for the matching exp
-        elif view_cell != self.current_exp.view_cell:
+        elif view_cell.id != self.current_exp.view_cell_id:
 
             # find the exp associated with the current vt and that is under the
             # threshold distance to the centre of pose cell activity
@@ -191,37 +352,23 @@ class PyExperienceMapModel(PyLoihiProcessModel):
             adjust_map = True
             matched_exp = None
 
-            delta_pcs = []
-            n_candidate_matches = 0
-            for (i, e) in enumerate(view_cell.exps):
-                delta_pc = np.sqrt(
-                    min_delta(e.x_pc, x_pc, PC_DIM_XY)**2 + \
-                    min_delta(e.y_pc, y_pc, PC_DIM_XY)**2 + \
-                    min_delta(e.th_pc, th_pc, PC_DIM_TH)**2
-                )
-                delta_pcs.append(delta_pc)
-
-                if delta_pc < EXP_DELTA_PC_THRESHOLD:
-                    n_candidate_matches += 1
+            # only the exps in the grid buckets around the pose can be under
+            # the threshold
+            candidates = self.index.near(view_cell.id, x_pc, y_pc, th_pc)
+            delta_pcs = pc_distances([(e.x_pc, e.y_pc, e.th_pc) for e in candidates],
+                                     x_pc, y_pc, th_pc, self.dim_xy, self.dim_th)
+            n_candidate_matches = np.count_nonzero(delta_pcs < EXP_DELTA_PC_THRESHOLD)
 
             if n_candidate_matches > 1:
                 pass
 
             else:
-                min_delta_id = np.argmin(delta_pcs)
-                min_delta_val = delta_pcs[min_delta_id]
-
-                if min_delta_val < EXP_DELTA_PC_THRESHOLD:
-                    matched_exp = view_cell.exps[min_delta_id]
+                if n_candidate_matches == 1:
+                    matched_exp = candidates[np.argmin(delta_pcs)]
 
                     # see if the prev exp already has a link to the current exp
-                    link_exists = False
-                    for linked_exp in [l.target for l in self.current_exp.links]:
-                        if linked_exp == matched_exp:
-                            link_exists = True
-
-                    if not link_exists:
-                        self.current_exp.link_to(matched_exp, self.accum_delta_x, self.accum_delta_y, self.accum_delta_facing)
+                    if matched_exp.id not in self.current_exp.link_targets:
+                        self._link(self.current_exp, matched_exp)
 
                 if matched_exp is None:
                     matched_exp = self._create_exp(x_pc, y_pc, th_pc, view_cell)
@@ -231,48 +378,164 @@ class PyExperienceMapModel(PyLoihiProcessModel):
                 self.accum_delta_y = 0
                 self.accum_delta_facing = self.current_exp.facing_rad
 
-        self.history.append(self.current_exp)
-
-        if not adjust_map:
-            return
-
-
-        # Iteratively update the experience map with the new information     
-        for i in range(0, EXP_LOOPS):
-            for e0 in self.exps:
-                for l in e0.links:
-                    # e0 is the experience under consideration
-                    # e1 is an experience linked from e0
-                    # l is the link object which contains additoinal heading
-                    # info
-
-                    e1 = l.target
-                    
-                    # correction factor
-                    cf = EXP_CORRECTION
-                    
-                    # work out where exp0 thinks exp1 (x,y) should be based on 
-                    # the stored link information
-                    lx = e0.x_m + l.d * np.cos(e0.facing_rad + l.heading_rad)
-                    ly = e0.y_m + l.d * np.sin(e0.facing_rad + l.heading_rad);
-
-                    # correct e0 and e1 (x,y) by equal but opposite amounts
-                    # a 0.5 correction parameter means that e0 and e1 will be 
-                    # fully corrected based on e0's link information
-                    e0.x_m = e0.x_m + (e1.x_m - lx) * cf
-                    e0.y_m = e0.y_m + (e1.y_m - ly) * cf
-                    e1.x_m = e1.x_m - (e1.x_m - lx) * cf
-                    e1.y_m = e1.y_m - (e1.y_m - ly) * cf
-
-                    # determine the angle between where e0 thinks e1's facing
-                    # should be based on the link information
-                    df = signed_delta_rad(e0.facing_rad + l.facing_rad, 
-                                          e1.facing_rad)
-
-                    # correct e0 and e1 facing by equal but opposite amounts
-                    # a 0.5 correction parameter means that e0 and e1 will be 
-                    # fully corrected based on e0's link information           
-                    e0.facing_rad = clip_rad_180(e0.facing_rad + df * cf)
-                    e1.facing_rad = clip_rad_180(e1.facing_rad - df * cf)
-    
-        return
+        self.n_steps += 1
+
+        self.closure_pending = self.closure_pending or adjust_map
+        moved = []
+        if self.closure_pending and (self.last_relax is None or
+                                     self.n_frames - self.last_relax >= self.relax_every):
+            moved = self._relax()
+            self.closure_pending = False
+            self.last_relax = self.n_frames
+        return self._publish(moved)
+
+    def close(self) -> None:
+        '''Write out what is still buffered, at the end of a run.'''
+        self.stream.close()
+        if self.tiles is not None:
+            self.tiles.flush()
+
+    def _relax(self):
+        '''Iteratively update the experience map with the new information.
+        :return: the experiences whose position or facing changed.
+        '''
+        before = exp_rows(self.exps)[:, 1:]
+        x, y, facing = before.T.copy()
+
+        # flatten the links in the order the original object loop visited them
+        links = [l for e in self.exps for l in e.links]
+        src = np.array([l.parent.id for l in links], dtype=int)
+        dst = np.array([l.target.id for l in links], dtype=int)
+        d = np.array([l.d for l in links], dtype=float)
+        heading = np.array([l.heading_rad for l in links], dtype=float)
+        link_facing = np.array([l.facing_rad for l in links], dtype=float)
+
+        relax_map(x, y, facing, src, dst, d, heading, link_facing,
+                  EXP_LOOPS, EXP_CORRECTION)
+
+        for e in self.exps:
+            e.x_m, e.y_m, e.facing_rad = x[e.id], y[e.id], facing[e.id]
+
+        after = exp_rows(self.exps)[:, 1:]
+        moved = np.any(np.abs(after - before) > EXP_MOVED_EPS, axis=1)
+        return [self.exps[i] for i in np.flatnonzero(moved)]
+
+
+class ExperienceLocalizer:
+    """
+    Localization in the experiences of a FrozenMap, the experience map of
+    localization mode, with the integrate/update/step of ExperienceGraph.
+
+    Nothing is created, linked or relaxed. When the view cell changes to one
+    with a single experience within EXP_DELTA_PC_THRESHOLD of the pose, that
+    experience becomes the current one, otherwise the current one is kept
+    and the odometry keeps integrating from it (counted in unmatched). The
+    candidates come from the prebuilt template id index of the map, so the
+    cost of a frame doesn't grow with the run.
+    """
+
+    def __init__(self, frozen: FrozenMap, stream_len: int = 256,
+                 trajectory_path: str = None, trajectory_chunk: int = 1024) -> None:
+        self.map = frozen
+        self.dim_xy = frozen.pc_dim_xy
+        self.dim_th = frozen.pc_dim_th
+        self.current_exp = None
+        self.unmatched = 0
+
+        self.accum_delta_x = 0
+        self.accum_delta_y = 0
+        self.accum_delta_facing = np.pi/2
+
+        self.stream = MapStream(
+            maxlen=stream_len,
+            trajectory_path=trajectory_path,
+            chunk_size=trajectory_chunk
+        )
+        self.n_steps = 0
+        self.n_frames = 0
+
+    def step(self, view_cell, vtrans, vrot, x_pc, y_pc, th_pc) -> MapUpdate:
+        self.integrate(vtrans, vrot)
+        return self.update(view_cell, x_pc, y_pc, th_pc)
+
+    def integrate(self, vtrans, vrot) -> None:
+        '''Accumulate the odometry of a frame.'''
+        self.accum_delta_facing = clip_rad_180(self.accum_delta_facing + vrot)
+        self.accum_delta_x += vtrans*np.cos(self.accum_delta_facing)
+        self.accum_delta_y += vtrans*np.sin(self.accum_delta_facing)
+        self.n_frames += 1
+
+    def update(self, view_cell, x_pc, y_pc, th_pc) -> MapUpdate:
+        '''Recognize the experience of view_cell at the pose, if any.'''
+        if view_cell.id != UNMATCHED and (self.current_exp is None or
+                                          view_cell.id != self.current_exp.view_cell_id):
+            ids = self.map.cell_exps(view_cell.id)
+            exps = self.map.exps[ids]
+            delta_pcs = pc_distances(exps[:, :3], x_pc, y_pc, th_pc,
+                                     self.dim_xy, self.dim_th)
+            candidates = np.flatnonzero(delta_pcs < EXP_DELTA_PC_THRESHOLD)
+            if len(candidates) == 1:
+                k = candidates[0]
+                self.current_exp = Experience(int(ids[k]), *exps[k, :6], int(exps[k, 6]))
+                self.accum_delta_x = 0
+                self.accum_delta_y = 0
+                self.accum_delta_facing = self.current_exp.facing_rad
+            else:
+                self.unmatched += 1
+
+        self.n_steps += 1
+        update = MapUpdate(
+            step=self.n_steps,
+            current_id=UNMATCHED if self.current_exp is None else self.current_exp.id,
+            new_exps=np.zeros((0, 4)),
+            new_links=np.zeros((0, 2), dtype=int),
+            moved=np.zeros((0, 4))
+        )
+        self.stream.push(update)
+        self.stream.log_pose(self.n_steps, self.current_exp)
+        return update
+
+    def close(self) -> None:
+        self.stream.close()
+
+
+@implements(proc=ExperienceMap, protocol=LoihiProtocol)
+@requires(CPU)
+class PyExperienceMapModel(PyLoihiProcessModel):
+    cell_in: PyInPort = LavaPyType(PyInPort.VEC_DENSE, float, precision=32)
+    vtrans_vrot_in: PyInPort = LavaPyType(PyInPort.VEC_DENSE, float, precision=32)
+    pose_in: PyInPort = LavaPyType(PyInPort.VEC_DENSE, float, precision=32)
+
+    exp_out: PyOutPort = LavaPyType(PyOutPort.VEC_DENSE, float, precision=32)
+    ready_out: PyOutPort = LavaPyType(PyOutPort.VEC_DENSE, float, precision=32)
+
+    def __init__(self, proc_params):
+        super().__init__(proc_params=proc_params)
+        self.graph = ExperienceGraph.from_params(proc_params)
+        self.started = False
+
+    def _stop(self):
+        # the trajectory and tiles of the last frames are still buffered
+        self.graph.close()
+        super()._stop()
+
+    def post_guard(self):
+        return True
+
+    def run_post_mgmt(self):
+        """Post-Management phase: executed only when guard function above
+        returns True.
+        """
+        if not self.started:
+            # the pose cells send their initial pose to the view cells first
+            self.pose_in.recv()
+            self.started = True
+
+        # only the template id is used here
+        view_cell = decode_cell(self.cell_in.recv())
+        vtrans, vrot = self.vtrans_vrot_in.recv()
+        x_pc, y_pc, th_pc = self.pose_in.recv()
+
+        self.graph.step(view_cell, vtrans, vrot, x_pc, y_pc, th_pc)
+        self.exp_out.send(exp_rows([self.graph.current_exp])[0])
+        self.ready_out.send(np.ones(1))
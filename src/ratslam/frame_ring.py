@@ -0,0 +1,192 @@
+import sys
+from multiprocessing import resource_tracker, shared_memory
+from typing import Optional, Tuple
+
+import numpy as np
+from lava.magma.core.decorator import implements, requires, tag
+from lava.magma.core.model.py.model import PyLoihiProcessModel
+from lava.magma.core.model.py.ports import PyInPort, PyOutPort
+from lava.magma.core.model.py.type import LavaPyType
+from lava.magma.core.process.ports.ports import OutPort
+from lava.magma.core.process.process import AbstractProcess
+from lava.magma.core.process.variable import Var
+from lava.magma.core.resources import CPU
+from lava.magma.core.sync.protocols.loihi_protocol import LoihiProtocol
+
+
+class FrameRing:
+    """Ring buffer of grayscale frames in shared memory.
+
+    One producer writes frames, any number of readers get views into the
+    buffer from read. The header holds the sequence number of the last
+    complete frame followed by one sequence number per slot. A slot's number
+    is set to -1 while it is being written, so readers can tell a torn or
+    overwritten frame apart from a valid one: a view is only good as long
+    as valid(seq) holds, so a reader that keeps a frame copies it once and
+    checks valid afterwards, like a seqlock.
+
+    frame_shape: (height, width)
+    """
+
+    # names of the rings created by this process
+    created = set()
+
+    def __init__(self, shm: shared_memory.SharedMemory,
+                 frame_shape: Tuple[int, int], n_slots: int, owner: bool) -> None:
+        self.shm = shm
+        self.frame_shape = tuple(frame_shape)
+        self.n_slots = n_slots
+        self.owner = owner
+
+        self.header = np.ndarray((1 + n_slots,), dtype=np.int64, buffer=shm.buf)
+        self.slot_seq = self.header[1:]
+        self.frames = np.ndarray(
+            (n_slots, *self.frame_shape), dtype=np.uint8,
+            buffer=shm.buf, offset=self.header.nbytes
+        )
+
+    @staticmethod
+    def nbytes(frame_shape: Tuple[int, int], n_slots: int) -> int:
+        return 8 * (1 + n_slots) + n_slots * int(np.prod(frame_shape))
+
+    @classmethod
+    def create(cls, frame_shape: Tuple[int, int], n_slots: int = 8,
+               name: Optional[str] = None) -> "FrameRing":
+        shm = shared_memory.SharedMemory(
+            name=name, create=True, size=cls.nbytes(frame_shape, n_slots))
+        ring = cls(shm, frame_shape, n_slots, owner=True)
+        ring.header[:] = -1
+        cls.created.add(shm._name)
+        return ring
+
+    @classmethod
+    def attach(cls, name: str, frame_shape: Tuple[int, int],
+               n_slots: int = 8) -> "FrameRing":
+        if sys.version_info >= (3, 13):
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            shm = shared_memory.SharedMemory(name=name)
+            if shm._name not in cls.created:
+                # the resource tracker of this process would unlink the
+                # producer's segment when the process exits
+                resource_tracker.unregister(shm._name, 'shared_memory')
+        return cls(shm, frame_shape, n_slots, owner=False)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def write_seq(self) -> int:
+        return int(self.header[0])
+
+    def write(self, frame: np.ndarray) -> int:
+        """Copy a frame into the next slot and publish it."""
+        seq = self.write_seq + 1
+        slot = seq % self.n_slots
+        self.slot_seq[slot] = -1
+        self.frames[slot] = frame
+        self.slot_seq[slot] = seq
+        self.header[0] = seq
+        return seq
+
+    def read(self, last_seq: int, latest: bool = True):
+        """Return (seq, frame view, frames skipped) of the frame after
+        last_seq, or None if there is nothing new.
+
+        With latest=True the newest frame is returned and everything between
+        is skipped, otherwise the oldest frame still in the ring.
+        """
+        write_seq = self.write_seq
+        if write_seq <= last_seq:
+            return None
+
+        if latest:
+            seq = write_seq
+        else:
+            seq = max(last_seq + 1, write_seq - self.n_slots + 1)
+
+        slot = seq % self.n_slots
+        if self.slot_seq[slot] != seq:
+            # the producer is already writing into this slot
+            return None
+        return seq, self.frames[slot], seq - last_seq - 1
+
+    def valid(self, seq: int) -> bool:
+        """Whether the frame view for seq has not been overwritten yet."""
+        return self.slot_seq[seq % self.n_slots] == seq
+
+    def close(self) -> None:
+        del self.header, self.slot_seq, self.frames
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+            self.created.discard(self.shm._name)
+
+
+class SharedFrameSource(AbstractProcess):
+    def __init__(self, video_shape: tuple, ring_name: str, n_slots: int = 8,
+                 latest: bool = True, **kwargs) -> None:
+        """
+        Reads frames written into a FrameRing by an external producer.
+
+        video_shape: (height, width)
+        ring_name: shared memory name of the FrameRing
+        latest: skip to the newest frame instead of replaying every frame
+        """
+        super().__init__(video_shape=video_shape, ring_name=ring_name,
+                         n_slots=n_slots, latest=latest, **kwargs)
+
+        self.last_seq = Var(shape=(1,), init=-1)
+        self.frames_dropped = Var(shape=(1,), init=0)
+        self.img_out = OutPort(shape=video_shape)
+
+
+@implements(proc=SharedFrameSource, protocol=LoihiProtocol)
+@requires(CPU)
+class PySharedFrameSourceModel(PyLoihiProcessModel):
+    last_seq: int = LavaPyType(int, int, precision=64)
+    frames_dropped: int = LavaPyType(int, int, precision=64)
+    img_out: PyOutPort = LavaPyType(PyOutPort.VEC_DENSE, float, precision=32)
+
+    def __init__(self, proc_params):
+        super().__init__(proc_params=proc_params)
+        self.ring = FrameRing.attach(
+            proc_params['ring_name'],
+            proc_params['video_shape'],
+            proc_params.get('n_slots', 8)
+        )
+        self.latest = proc_params.get('latest', True)
+        self._frame = None
+
+    def post_guard(self):
+        while True:
+            frame = self.ring.read(int(self.last_seq), self.latest)
+            if frame is None:
+                return False
+            seq, img, dropped = frame
+            # the one copy of the frame, the port would copy the view anyway
+            img = img.copy()
+            if self.ring.valid(seq):
+                self._frame = seq, img, dropped
+                return True
+            # the producer lapped us while copying, drop it and read again
+            self.last_seq = seq
+            self.frames_dropped += dropped + 1
+
+    def run_post_mgmt(self):
+        """Post-Management phase: executed only when guard function above
+        returns True.
+        """
+        seq, img, dropped = self._frame
+        self._frame = None
+        self.img_out.send(img)
+        self.last_seq = seq
+        self.frames_dropped += dropped
+
+    def _stop(self):
+        self.ring.close()
+        super()._stop()
+
+    def run_spk(self):
+        pass
@@ -0,0 +1,82 @@
+import json
+import os
+
+import numpy as np
+
+# files of a frozen map directory, all memory-mapped read-only by FrozenMap
+MAP_FILES = ('templates', 'cells', 'exps', 'links', 'cell_exp_start', 'cell_exp_ids')
+
+
+def save_map(path: str, matcher, graph) -> None:
+    """
+    Write the map built by a ViewCellMatcher and an ExperienceGraph to the
+    directory path, for FrozenMap.
+
+    The templates are stored decoded, in template id order, and the
+    experiences are indexed by template id, so loading does no work.
+    """
+    store = matcher.templates
+    if not hasattr(store, 'profiles'):
+        raise Exception("only maps of a TemplateStore can be saved, not of match_workers")
+    os.makedirs(path, exist_ok=True)
+
+    exps = np.array([[e.x_pc, e.y_pc, e.th_pc, e.x_m, e.y_m, e.facing_rad, e.view_cell_id]
+                     for e in graph.exps], dtype=float).reshape(-1, 7)
+    # experiences of template t are cell_exp_ids[cell_exp_start[t]:cell_exp_start[t+1]]
+    cell_ids = exps[:, 6].astype(int)
+    order = np.argsort(cell_ids, kind='stable')
+    counts = np.bincount(cell_ids, minlength=len(store))
+    arrays = {
+        'templates': store.profiles(),
+        'cells': np.array([[c.x_pc, c.y_pc, c.th_pc] for c in matcher.cells]).reshape(-1, 3),
+        'exps': exps,
+        'links': np.array([[l.parent.id, l.target.id] for e in graph.exps for l in e.links],
+                          dtype=int).reshape(-1, 2),
+        'cell_exp_start': np.concatenate([[0], np.cumsum(counts)]).astype(int),
+        'cell_exp_ids': order.astype(int),
+    }
+    for name in MAP_FILES:
+        np.save(os.path.join(path, f'{name}.npy'), arrays[name])
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump({
+            'width': store.width,
+            'template_dtype': np.dtype(store.dtype).name,
+            'template_downsample': store.downsample,
+            'pc_dim_xy': graph.dim_xy,
+            'pc_dim_th': graph.dim_th,
+        }, f)
+
+
+class FrozenMap:
+    """A map saved with save_map, for localization without mapping.
+
+    Every array is a read-only memory map, so any number of localization
+    workers can load the same directory and share one copy of it in the
+    page cache. Nothing here changes after loading.
+
+    templates: (n, cols) decoded template profiles by template id
+    cells: (n, 3) pose each view cell was created at
+    exps: (m, 7) x_pc, y_pc, th_pc, x_m, y_m, facing_rad, view cell id
+    links: (k, 2) parent and target experience ids
+    """
+
+    def __init__(self, path: str) -> None:
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        self.path = path
+        self.width = meta['width']
+        self.template_dtype = meta['template_dtype']
+        self.template_downsample = meta['template_downsample']
+        self.pc_dim_xy = meta['pc_dim_xy']
+        self.pc_dim_th = meta['pc_dim_th']
+        for name in MAP_FILES:
+            setattr(self, name, np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r'))
+
+    def __len__(self):
+        return len(self.templates)
+
+    def cell_exps(self, tid: int) -> np.ndarray:
+        """Ids of the experiences of template tid."""
+        if tid < 0 or tid >= len(self):
+            return self.cell_exp_ids[:0]
+        return self.cell_exp_ids[self.cell_exp_start[tid]:self.cell_exp_start[tid + 1]]
@@ -1,3 +1,5 @@
+import time
+from abc import abstractmethod
 from typing import List, Tuple
 
 import cv2
@@ -9,7 +11,7 @@ from lava.magma.core.model.py.model import PyLoihiProcessModel
 from lava.magma.core.model.py.ports import PyInPort, PyOutPort
 from lava.magma.core.model.py.type import LavaPyType
 from lava.magma.core.model.sub.model import AbstractSubProcessModel
-from lava.magma.core.process.ports.ports import OutPort
+from lava.magma.core.process.ports.ports import InPort, OutPort
 from lava.magma.core.process.process import AbstractProcess
 from lava.magma.core.process.variable import Var
 from lava.magma.core.resources import CPU
@@ -21,35 +23,75 @@ from lava.magma.core.sync.protocols.loihi_protocol import LoihiProtocol
 
 
 class ImageGenerator(AbstractProcess):
-    def __init__(self, video_shape: tuple, num_steps_per_image: int = 128, **kwargs) -> None:
+    def __init__(self, video_shape: tuple, num_steps_per_image: int = 128,
+                 pacing: str = 'fixed', max_in_flight: int = 2,
+                 target_fps: float = 0, **kwargs) -> None:
         """
         video_shape: (height, width)
+        pacing: 'fixed' sends a frame every num_steps_per_image steps,
+            'adaptive' sends the next frame as soon as the pipeline signals
+            on ready_in that it is done with one, keeping at most
+            max_in_flight frames in the pipeline.
+        target_fps: if > 0, frames the pipeline is too slow for are skipped
+            so that the video plays at this rate in real time. Skipped frames
+            are counted in frames_dropped.
         """
-        super().__init__(**kwargs)
+        super().__init__(pacing=pacing, max_in_flight=max_in_flight,
+                         target_fps=target_fps, **kwargs)
 
         self.num_steps_per_image = Var(shape=(1,), init=num_steps_per_image)
+        self.frames_sent = Var(shape=(1,), init=0)
+        self.frames_dropped = Var(shape=(1,), init=0)
         self.cur_img = Var(shape=video_shape)
         self.img_out = OutPort(shape=video_shape)
 
+        # connect the last stage of the pipeline here for adaptive pacing
+        self.ready_in = InPort(shape=(1,))
 
-@implements(proc=ImageGenerator, protocol=LoihiProtocol)
-@requires(CPU)
-class PyImageGeneratorModel(PyLoihiProcessModel):
+
+class AbstractPyFrameSourceModel(PyLoihiProcessModel):
+    """Pacing shared by the frame sources. Subclasses implement read_frame
+    and skip_frame. Process models are already abstract base classes, so
+    abstractmethod is enforced without a metaclass here."""
     num_steps_per_image: int = LavaPyType(int, int, precision=32)
+    frames_sent: int = LavaPyType(int, int, precision=32)
+    frames_dropped: int = LavaPyType(int, int, precision=32)
     cur_img: np.ndarray = LavaPyType(np.ndarray, float, precision=32)
     img_out: PyOutPort = LavaPyType(PyOutPort.VEC_DENSE, float, precision=32)
+    ready_in: PyInPort = LavaPyType(PyInPort.VEC_DENSE, float, precision=32)
 
     def __init__(self, proc_params):
         super().__init__(proc_params=proc_params)
-        if proc_params.get('video_path') is None:
-            raise Exception(
-                "video path wasn't passed as kwarg to the abstract process")
-        video_path = proc_params['video_path']
-        self.video_data = cv2.VideoCapture(video_path)
+        self.pacing = proc_params.get('pacing', 'fixed')
+        if self.pacing not in ('fixed', 'adaptive'):
+            raise Exception(f"unknown pacing {self.pacing}")
+        self.max_in_flight = proc_params.get('max_in_flight', 2)
+        self.target_fps = proc_params.get('target_fps', 0)
+
+        self.in_flight = 0
+        self.frame_idx = 0
+        self.start_time = None
+        self.checked_ready_in = False
+
+    @abstractmethod
+    def read_frame(self):
+        """Return the next grayscale frame, or None at the end."""
+
+    @abstractmethod
+    def skip_frame(self):
+        """Skip the next frame as cheaply as possible, False at the end."""
 
     def post_guard(self):
         """Guard function for PostManagement phase.
         """
+        if self.pacing == 'adaptive':
+            if not self.checked_ready_in:
+                # probe() of an unconnected port is always True
+                if not self.ready_in.csp_ports:
+                    raise Exception("adaptive pacing needs ready_in to be connected, "
+                                    "e.g. to experience_map.ready_out")
+                self.checked_ready_in = True
+            return self.in_flight < self.max_in_flight or self.ready_in.probe()
         if self.time_step % self.num_steps_per_image == 1:
             return True
         return False
@@ -58,9 +100,38 @@ class PyImageGeneratorModel(PyLoihiProcessModel):
         """Post-Management phase: executed only when guard function above
         returns True.
         """
-        _, frame = self.video_data.read()
-        self.cur_img = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self.pacing == 'adaptive':
+            # one ready message comes back per frame sent
+            while self.in_flight > 0 and self.ready_in.probe():
+                self.ready_in.recv()
+                self.in_flight -= 1
+            if self.in_flight >= self.max_in_flight:
+                return
+
+        self.skip_late_frames()
+        frame = self.read_frame()
+        if frame is None:
+            return
+        self.frame_idx += 1
+        self.cur_img = frame
         self.img_out.send(self.cur_img)
+        self.in_flight += 1
+        self.frames_sent += 1
+
+    def skip_late_frames(self):
+        """In real-time mode, skip the frames whose time has already passed."""
+        if self.target_fps <= 0:
+            return
+        now = time.perf_counter()
+        if self.start_time is None:
+            self.start_time = now
+            return
+        due = int((now - self.start_time) * self.target_fps)
+        while self.frame_idx < due:
+            if not self.skip_frame():
+                break
+            self.frame_idx += 1
+            self.frames_dropped += 1
 
     # we will likely need to implement the following
     # when we change to using spiking
@@ -68,3 +139,25 @@ class PyImageGeneratorModel(PyLoihiProcessModel):
     def run_spk(self):
         # print("spikee")
         pass
+
+
+@implements(proc=ImageGenerator, protocol=LoihiProtocol)
+@requires(CPU)
+class PyImageGeneratorModel(AbstractPyFrameSourceModel):
+    def __init__(self, proc_params):
+        super().__init__(proc_params=proc_params)
+        if proc_params.get('video_path') is None:
+            raise Exception(
+                "video path wasn't passed as kwarg to the abstract process")
+        video_path = proc_params['video_path']
+        self.video_data = cv2.VideoCapture(video_path)
+
+    def read_frame(self):
+        ok, frame = self.video_data.read()
+        if not ok:
+            return None
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+    def skip_frame(self):
+        # grab without decoding
+        return self.video_data.grab()
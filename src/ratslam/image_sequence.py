@@ -0,0 +1,272 @@
+import glob
+import os
+import re
+from multiprocessing import Pool
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+from lava.magma.core.decorator import implements, requires, tag
+from lava.magma.core.model.py.ports import PyInPort, PyOutPort
+from lava.magma.core.model.py.type import LavaPyType
+from lava.magma.core.process.ports.ports import InPort, OutPort
+from lava.magma.core.process.process import AbstractProcess
+from lava.magma.core.process.variable import Var
+from lava.magma.core.resources import CPU
+from lava.magma.core.sync.protocols.loihi_protocol import LoihiProtocol
+
+from ratslam.image_generator import AbstractPyFrameSourceModel
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.pgm')
+
+
+def read_metadata(path: str) -> Tuple[List[str], np.ndarray]:
+    """
+    Read a metadata file with one line per frame, the image file name first
+    and then numeric columns, separated by whitespace or commas. This is the
+    layout of the PilotNet data.txt. Columns that aren't numbers become nan.
+    return the file names and an (n_frames, n_columns) array.
+    """
+    names, rows = [], []
+    with open(path) as f:
+        for line in f:
+            tokens = re.split(r'[\s,]+', line.strip())
+            if not tokens[0]:
+                continue
+            names.append(tokens[0])
+            rows.append([_to_float(t) for t in tokens[1:]])
+
+    n_columns = max((len(r) for r in rows), default=0)
+    meta = np.full((len(rows), n_columns), np.nan)
+    for i, r in enumerate(rows):
+        meta[i, :len(r)] = r
+    return names, meta
+
+
+def _to_float(token):
+    try:
+        return float(token)
+    except ValueError:
+        return np.nan
+
+
+def decode_gray(path: str, shape: Optional[Tuple[int, int]] = None) -> np.ndarray:
+    img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        raise Exception(f"could not read image {path}")
+    if shape is not None and img.shape != tuple(shape):
+        img = cv2.resize(img, (shape[1], shape[0]), interpolation=cv2.INTER_AREA)
+    return img
+
+
+def _decode_job(path, shape, cache_path, idx):
+    """Runs in the pool. With a cache the frame is written straight into the
+    memory-mapped file so only a flag goes back through the pipe."""
+    img = decode_gray(path, shape)
+    if cache_path is None:
+        return img
+    cache = np.lib.format.open_memmap(cache_path, mode='r+')
+    cache[idx] = img
+    cache.flush()
+    return None
+
+
+class ImageSequence:
+    """Ordered frames of an image directory, decoded ahead of time.
+
+    The frames listed in the metadata file (or all images of the directory
+    sorted by name if there is none) are decoded to grayscale in a pool of
+    worker processes (or in the caller with workers=0), up to `prefetch`
+    frames ahead of the reader. Decoded frames are kept in a reorder buffer
+    until it is their turn, so they come out in sequence order whichever
+    worker finishes first.
+
+    With cache_path, decoded frames are stored in a memory-mapped .npy file
+    next to a `.done` flag file, and later runs read them from there without
+    decoding. A cache of a different number of frames or frame shape is
+    rebuilt.
+
+    Examples
+    --------
+
+    >>> seq = ImageSequence('data/driving_dataset', metadata='data.txt')
+    >>> for img, meta in seq:
+    ...     steering = meta[0]
+    """
+
+    def __init__(self, path: str, metadata: Optional[str] = 'data.txt',
+                 image_shape: Optional[Tuple[int, int]] = None,
+                 cache_path: Optional[str] = None,
+                 workers: int = 4, prefetch: int = 16) -> None:
+        self.path = path
+        meta_path = os.path.join(path, metadata) if metadata else None
+        if meta_path is not None and os.path.exists(meta_path):
+            names, self.meta = read_metadata(meta_path)
+        else:
+            names = sorted(
+                os.path.basename(f) for f in glob.glob(os.path.join(path, '*'))
+                if f.lower().endswith(IMAGE_EXTENSIONS))
+            self.meta = np.zeros((len(names), 0))
+        if len(names) == 0:
+            raise Exception(f"no frames found in {path}")
+        self.files = [os.path.join(path, n) for n in names]
+
+        if image_shape is None:
+            image_shape = decode_gray(self.files[0]).shape
+        self.image_shape = tuple(image_shape)
+
+        self.workers = workers
+        self.prefetch = max(prefetch, 1)
+
+        self.cache_path = cache_path
+        self.cache = None
+        self.cached = None
+        if cache_path is not None:
+            self._open_cache()
+
+        self._pool = None
+        self._pending = {}
+        self._next_submit = 0
+
+    def __len__(self):
+        return len(self.files)
+
+    @property
+    def n_columns(self):
+        return self.meta.shape[1]
+
+    def _open_cache(self):
+        shape = (len(self.files), *self.image_shape)
+        done_path = self.cache_path + '.done'
+        self.cache, self.cached = None, None
+        if os.path.exists(self.cache_path) and os.path.exists(done_path):
+            try:
+                cache = np.lib.format.open_memmap(self.cache_path, mode='r+')
+                cached = np.lib.format.open_memmap(done_path, mode='r+')
+            except ValueError:
+                # not a cache of this format
+                cache, cached = None, None
+            if cache is not None and cache.shape == shape and cache.dtype == np.uint8 \
+                    and cached.shape == shape[:1]:
+                self.cache, self.cached = cache, cached
+                return
+            del cache, cached
+        self.cache = np.lib.format.open_memmap(
+            self.cache_path, mode='w+', dtype=np.uint8, shape=shape)
+        self.cached = np.lib.format.open_memmap(
+            done_path, mode='w+', dtype=bool, shape=shape[:1])
+
+    def _submit(self, idx):
+        if self.workers == 0 or (self.cached is not None and self.cached[idx]):
+            return
+        if self._pool is None:
+            self._pool = Pool(self.workers)
+        self._pending[idx] = self._pool.apply_async(
+            _decode_job,
+            (self.files[idx], self.image_shape, self.cache_path, idx))
+
+    def get(self, idx: int) -> np.ndarray:
+        """Frame idx, reading ahead so that the next frames are decoding."""
+        self._next_submit = max(self._next_submit, idx)
+        while self._next_submit < min(idx + self.prefetch, len(self.files)):
+            self._submit(self._next_submit)
+            self._next_submit += 1
+
+        if self.cached is not None and self.cached[idx]:
+            self._pending.pop(idx, None)
+            return self.cache[idx]
+
+        job = self._pending.pop(idx, None)
+        img = job.get() if job is not None else None
+        if self.cache is None:
+            return img if img is not None else decode_gray(self.files[idx], self.image_shape)
+        if job is None:
+            self.cache[idx] = decode_gray(self.files[idx], self.image_shape)
+        self.cached[idx] = True
+        return self.cache[idx]
+
+    def skip(self, idx: int) -> None:
+        """Drop frame idx without waiting for it."""
+        self._pending.pop(idx, None)
+
+    def __iter__(self):
+        for idx in range(len(self.files)):
+            yield self.get(idx), self.meta[idx]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+        self._pending.clear()
+        if self.cache is not None:
+            self.cache.flush()
+            self.cached.flush()
+
+
+class ImageSequenceGenerator(AbstractProcess):
+    def __init__(self, video_shape: tuple, path: str, n_columns: int = 1,
+                 num_steps_per_image: int = 128, pacing: str = 'fixed',
+                 max_in_flight: int = 2, target_fps: float = 0,
+                 **kwargs) -> None:
+        """
+        Frame source for a directory of images, see ImageSequence for the
+        other keyword arguments (metadata, cache_path, workers, prefetch).
+        Pacing works like ImageGenerator.
+
+        video_shape: (height, width), frames are resized to it
+        n_columns: number of metadata columns sent on meta_out with each
+            frame, e.g. 1 for the PilotNet steering angle
+        """
+        super().__init__(video_shape=video_shape, path=path,
+                         n_columns=n_columns, pacing=pacing,
+                         max_in_flight=max_in_flight, target_fps=target_fps,
+                         **kwargs)
+
+        self.num_steps_per_image = Var(shape=(1,), init=num_steps_per_image)
+        self.frames_sent = Var(shape=(1,), init=0)
+        self.frames_dropped = Var(shape=(1,), init=0)
+        self.cur_img = Var(shape=video_shape)
+        self.img_out = OutPort(shape=video_shape)
+        self.meta_out = OutPort(shape=(n_columns,))
+
+        # connect the last stage of the pipeline here for adaptive pacing
+        self.ready_in = InPort(shape=(1,))
+
+
+@implements(proc=ImageSequenceGenerator, protocol=LoihiProtocol)
+@requires(CPU)
+class PyImageSequenceModel(AbstractPyFrameSourceModel):
+    meta_out: PyOutPort = LavaPyType(PyOutPort.VEC_DENSE, float, precision=32)
+
+    def __init__(self, proc_params):
+        super().__init__(proc_params=proc_params)
+        self.sequence = ImageSequence(
+            proc_params['path'],
+            metadata=proc_params.get('metadata', 'data.txt'),
+            image_shape=proc_params['video_shape'],
+            cache_path=proc_params.get('cache_path'),
+            workers=proc_params.get('workers', 4),
+            prefetch=proc_params.get('prefetch', 16)
+        )
+        self.n_columns = proc_params.get('n_columns', 1)
+
+    def _stop(self):
+        # stops the decode workers and flushes the cache
+        self.sequence.close()
+        super()._stop()
+
+    def read_frame(self):
+        if self.frame_idx >= len(self.sequence):
+            return None
+        img = self.sequence.get(self.frame_idx)
+        meta = np.zeros(self.n_columns)
+        n = min(self.n_columns, self.sequence.n_columns)
+        meta[:n] = self.sequence.meta[self.frame_idx, :n]
+        self.meta_out.send(meta)
+        return img
+
+    def skip_frame(self):
+        if self.frame_idx >= len(self.sequence):
+            return False
+        self.sequence.skip(self.frame_idx)
+        return True
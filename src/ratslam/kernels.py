@@ -0,0 +1,429 @@
+"""
+Hot loops that are dominated by interpreter overhead.
+
+Every kernel has a NumPy implementation and, when numba is installed, a
+compiled one. The backend is picked with set_backend() or the
+RATSLAM_BACKEND environment variable ('auto', 'numpy' or 'numba'), which
+is the way to select it for lava processes since they run in their own
+python processes. 'auto' uses numba when it can be imported.
+"""
+import math
+import os
+
+import numpy as np
+
+try:
+    import numba
+    import numba.extending
+except ImportError:
+    numba = None
+
+BACKENDS = ('numpy', 'numba')
+_backend = None
+
+
+def set_backend(name='auto'):
+    global _backend
+    if name == 'auto':
+        name = 'numba' if numba is not None else 'numpy'
+    if name not in BACKENDS:
+        raise Exception(f"unknown kernel backend {name}, use one of {BACKENDS}")
+    if name == 'numba' and numba is None:
+        raise Exception("the numba kernel backend needs numba to be installed")
+    _backend = name
+
+
+def get_backend():
+    if _backend is None:
+        set_backend(os.environ.get('RATSLAM_BACKEND', 'auto'))
+    return _backend
+
+
+def _jit(func):
+    """Compiled version of func, or None without numba. Compilation happens
+    on the first call."""
+    if numba is None:
+        return None
+    return numba.njit(cache=True)(func)
+
+
+def _jitable(func):
+    """func, also callable from compiled kernels when numba is installed."""
+    if numba is None:
+        return func
+    return numba.extending.register_jitable(func)
+
+
+# compare_segments ============================================================
+
+def _compare_segments_np(seg1, seg2, length):
+    # brute force
+    # best_dist = np.sum(np.abs(seg1[:length]-seg2[:length]))
+    best_dist=99999999
+    best_offset = -1
+
+    for i in range(0,len(seg1)-length):
+        # for j in range(0,len(seg2)-length):
+        j= len(seg2)-length-2-i
+        dist = np.sum(np.abs(seg1[i:][:length]-seg2[j:][:length]))
+        if dist < best_dist:
+            best_dist = dist
+            best_offset = j-i
+
+    return best_offset, best_dist
+
+
+def _compare_segments_loop(seg1, seg2, length):
+    n2 = len(seg2)
+    best_dist = 99999999.0
+    best_offset = -1
+    for i in range(len(seg1) - length):
+        j = n2 - length - 2 - i
+        # seg2[j:] with j == -1 is a single element that numpy broadcasts
+        start = j if j >= 0 else n2 + j
+        single = n2 - start < length
+        dist = 0.0
+        for t in range(length):
+            dist += abs(seg1[i+t] - seg2[start if single else start+t])
+        if dist < best_dist:
+            best_dist = dist
+            best_offset = j - i
+    return best_offset, best_dist
+
+
+_compare_segments_nb = _jit(_compare_segments_loop)
+
+
+def compare_segments(seg1, seg2, length):
+    """
+    find contiguous subsegments, one from seg1 and one from seg2,
+    with smallest l1 distance. return their offset.
+    """
+    if get_backend() == 'numba':
+        return _compare_segments_nb(
+            np.asarray(seg1, dtype=np.float64), np.asarray(seg2, dtype=np.float64), length)
+    return _compare_segments_np(seg1, seg2, length)
+
+
+def _compare_segments_many_np(seg, templates, length, chunk=32):
+    n = len(seg)
+    i = np.arange(n - length)
+    j = n - length - 2 - i
+    wins = np.lib.stride_tricks.sliding_window_view(seg, length)[i]
+    # j == -1 for the last i, see _compare_segments_loop
+    inside = j >= 0
+
+    offsets = np.empty(len(templates), dtype=int)
+    dists = np.empty(len(templates))
+    for start in range(0, len(templates), chunk):
+        rows = np.asarray(templates[start:start+chunk], dtype=np.float64)
+        t_wins = np.lib.stride_tricks.sliding_window_view(rows, length, axis=1)
+        d = np.abs(wins[inside] - t_wins[:, j[inside]]).sum(axis=2)
+        if not np.all(inside):
+            last = np.abs(wins[~inside][None, :, :] - rows[:, -1, None, None]).sum(axis=2)
+            d = np.concatenate([d, last], axis=1)
+        best = np.argmin(d, axis=1)
+        offsets[start:start+chunk] = j[best] - i[best]
+        dists[start:start+chunk] = d[np.arange(len(rows)), best]
+    return offsets, dists
+
+
+if numba is not None:
+    @numba.njit(cache=True)
+    def _compare_segments_many_nb(seg, templates, length):
+        offsets = np.empty(len(templates), dtype=np.int64)
+        dists = np.empty(len(templates))
+        for k in range(len(templates)):
+            offsets[k], dists[k] = _compare_segments_nb(seg, templates[k], length)
+        return offsets, dists
+
+
+def compare_segments_many(seg, templates, length):
+    """
+    compare_segments of seg against every row of templates.
+    return arrays with the offset and distance for each template.
+    """
+    if len(templates) == 0:
+        return np.empty(0, dtype=int), np.empty(0)
+    if get_backend() == 'numba':
+        return _compare_segments_many_nb(
+            np.asarray(seg, dtype=np.float64),
+            np.asarray(templates, dtype=np.float64), length)
+    return _compare_segments_many_np(seg, templates, length)
+
+
+# shift_distances =============================================================
+
+def _shift_distances_np(seg1, seg2, shifts):
+    n = len(seg1)
+    dists = np.empty(len(shifts))
+    for k, s in enumerate(shifts):
+        if s >= 0:
+            diff = seg1[s:] - seg2[:n-s]
+        else:
+            diff = seg1[:n+s] - seg2[-s:]
+        dists[k] = np.mean(np.abs(diff))
+    return dists
+
+
+def _shift_distances_loop(seg1, seg2, shifts):
+    n = len(seg1)
+    dists = np.empty(len(shifts))
+    for k in range(len(shifts)):
+        s = shifts[k]
+        start1 = max(s, 0)
+        start2 = max(-s, 0)
+        m = n - abs(s)
+        total = 0.0
+        for t in range(m):
+            total += abs(seg1[start1+t] - seg2[start2+t])
+        dists[k] = total / m
+    return dists
+
+
+_shift_distances_nb = _jit(_shift_distances_loop)
+
+
+def shift_distances(seg1, seg2, shifts):
+    """
+    mean l1 distance between the overlapping parts of seg1 and seg2
+    for each shift, where shift s compares seg1[i+s] with seg2[i].
+    """
+    if get_backend() == 'numba':
+        return _shift_distances_nb(
+            np.asarray(seg1, dtype=np.float64), np.asarray(seg2, dtype=np.float64),
+            np.asarray(shifts, dtype=np.int64))
+    return _shift_distances_np(seg1, seg2, shifts)
+
+
+# experience map relaxation ===================================================
+
+@_jitable
+def _clip_rad_180(angle):
+    while angle > math.pi:
+        angle -= 2*math.pi
+    while angle <= -math.pi:
+        angle += 2*math.pi
+    return angle
+
+
+@_jitable
+def _clip_rad_360(angle):
+    while angle < 0:
+        angle += 2*math.pi
+    while angle >= 2*math.pi:
+        angle -= 2*math.pi
+    return angle
+
+
+@_jitable
+def _signed_delta_rad(angle1, angle2):
+    dir = _clip_rad_180(angle2 - angle1)
+    delta_angle = abs(_clip_rad_360(angle1) - _clip_rad_360(angle2))
+    if delta_angle < 2*math.pi - delta_angle:
+        return delta_angle if dir > 0 else -delta_angle
+    return 2*math.pi - delta_angle if dir > 0 else -(2*math.pi - delta_angle)
+
+
+def _relax_map_loop(x, y, facing, src, dst, d, heading, link_facing, loops, cf):
+    for _ in range(loops):
+        for k in range(len(src)):
+            e0 = src[k]
+            e1 = dst[k]
+
+            # work out where exp0 thinks exp1 (x,y) should be based on
+            # the stored link information
+            lx = x[e0] + d[k] * math.cos(facing[e0] + heading[k])
+            ly = y[e0] + d[k] * math.sin(facing[e0] + heading[k])
+
+            # correct e0 and e1 (x,y) by equal but opposite amounts
+            x[e0] = x[e0] + (x[e1] - lx) * cf
+            y[e0] = y[e0] + (y[e1] - ly) * cf
+            x[e1] = x[e1] - (x[e1] - lx) * cf
+            y[e1] = y[e1] - (y[e1] - ly) * cf
+
+            # correct e0 and e1 facing by equal but opposite amounts
+            df = _signed_delta_rad(facing[e0] + link_facing[k], facing[e1])
+            facing[e0] = _clip_rad_180(facing[e0] + df * cf)
+            facing[e1] = _clip_rad_180(facing[e1] - df * cf)
+
+
+_relax_map_nb = _jit(_relax_map_loop)
+
+
+def relax_map(x, y, facing, src, dst, d, heading, link_facing, loops, cf):
+    """
+    Iteratively correct experience positions and facings so they agree
+    with the odometry stored in their links. Links are visited in order and
+    corrections are applied immediately, like the original object loop.
+
+    x, y, facing: float arrays with one entry per experience, updated in place.
+    src, dst: int arrays with the experience index of each link's ends.
+    d, heading, link_facing: float arrays with each link's odometry.
+    """
+    if get_backend() == 'numba':
+        _relax_map_nb(x, y, facing, np.asarray(src, dtype=np.int64),
+                      np.asarray(dst, dtype=np.int64), d, heading, link_facing,
+                      loops, cf)
+        return
+
+    # plain python floats are a lot faster than numpy scalars here
+    xs, ys, fs = x.tolist(), y.tolist(), facing.tolist()
+    _relax_map_loop(xs, ys, fs, src.tolist(), dst.tolist(), d.tolist(),
+                    heading.tolist(), link_facing.tolist(), loops, cf)
+    x[:], y[:], facing[:] = xs, ys, fs
+
+
+# pose cell path integration ==================================================
+
+def _path_integrate_xy_np(cells, vtrans):
+    dim_xy, _, dim_th = cells.shape
+    c_size_th = (2.*np.pi)/dim_th
+    for dir_pc in range(dim_th):
+        direction = np.float64(dir_pc-1) * c_size_th
+        # N,E,S,W are straightforward
+        if (direction == 0):
+            cells[:,:,dir_pc] = \
+                cells[:,:,dir_pc] * (1.0 - vtrans) + \
+                np.roll(cells[:,:,dir_pc], 1, 1)*vtrans
+
+        elif direction == np.pi/2:
+            cells[:,:,dir_pc] = \
+                cells[:,:,dir_pc]*(1.0 - vtrans) + \
+                np.roll(cells[:,:,dir_pc], 1, 0)*vtrans
+
+        elif direction == np.pi:
+            cells[:,:,dir_pc] = \
+                cells[:,:,dir_pc]*(1.0 - vtrans) + \
+                np.roll(cells[:,:,dir_pc], -1, 1)*vtrans
+
+        elif direction == 3*np.pi/2:
+            cells[:,:,dir_pc] = \
+                cells[:,:,dir_pc]*(1.0 - vtrans) + \
+                np.roll(cells[:,:,dir_pc], -1, 0)*vtrans
+
+        else:
+            pca90 = np.rot90(cells[:,:,dir_pc],
+                          int(np.floor(direction *2/np.pi)))
+            dir90 = direction - int(np.floor(direction*2/np.pi)) * np.pi/2
+
+
+            # extend the Posecells one unit in each direction (max supported at the moment)
+            # work out the weight contribution to the NE cell from the SW, NW, SE cells
+            # given vtrans and the direction
+            # weight_sw = v * cos(th) * v * sin(th)
+            # weight_se = (1 - v * cos(th)) * v * sin(th)
+            # weight_nw = (1 - v * sin(th)) * v * sin(th)
+            # weight_ne = 1 - weight_sw - weight_se - weight_nw
+            # think in terms of NE divided into 4 rectangles with the sides
+            # given by vtrans and the angle
+            pca_new = np.zeros([dim_xy+2, dim_xy+2])
+            pca_new[1:-1, 1:-1] = pca90
+
+            weight_sw = (vtrans**2) *np.cos(dir90) * np.sin(dir90)
+            weight_se = vtrans*np.sin(dir90) - \
+                        (vtrans**2) * np.cos(dir90) * np.sin(dir90)
+            weight_nw = vtrans*np.cos(dir90) - \
+                        (vtrans**2) *np.cos(dir90) * np.sin(dir90)
+            weight_ne = 1.0 - weight_sw - weight_se - weight_nw
+
+            pca_new = pca_new*weight_ne + \
+                      np.roll(pca_new, 1, 1) * weight_nw + \
+                      np.roll(pca_new, 1, 0) * weight_se + \
+                      np.roll(np.roll(pca_new, 1, 1), 1, 0) * weight_sw
+
+            pca90 = pca_new[1:-1, 1:-1]
+            pca90[1:, 0] = pca90[1:, 0] + pca_new[2:-1, -1]
+            pca90[1, 1:] = pca90[1, 1:] + pca_new[-1, 2:-1]
+            pca90[0, 0] = pca90[0, 0] + pca_new[-1, -1]
+
+            #unrotate the pose cell xy layer
+            cells[:,:,dir_pc] = np.rot90(pca90,
+                                         4 - int(np.floor(direction * 2/np.pi)))
+    return cells
+
+
+if numba is not None:
+    @numba.njit(cache=True)
+    def _rot90_nb(m, k):
+        # same as np.rot90 for square arrays
+        n = m.shape[0]
+        out = np.empty_like(m)
+        k = k % 4
+        for i in range(n):
+            for j in range(n):
+                if k == 0:
+                    out[i, j] = m[i, j]
+                elif k == 1:
+                    out[i, j] = m[j, n-1-i]
+                elif k == 2:
+                    out[i, j] = m[n-1-i, n-1-j]
+                else:
+                    out[i, j] = m[n-1-j, i]
+        return out
+
+    @numba.njit(cache=True)
+    def _path_integrate_xy_nb(cells, vtrans):
+        dim_xy, _, dim_th = cells.shape
+        c_size_th = (2.*np.pi)/dim_th
+        n = dim_xy
+        for dir_pc in range(dim_th):
+            direction = np.float64(dir_pc-1) * c_size_th
+            layer = cells[:, :, dir_pc].copy()
+            # N,E,S,W are straightforward, shift by one cell
+            if direction == 0 or direction == np.pi/2 or \
+                    direction == np.pi or direction == 3*np.pi/2:
+                for i in range(n):
+                    for j in range(n):
+                        if direction == 0:
+                            src = layer[i, (j-1) % n]
+                        elif direction == np.pi/2:
+                            src = layer[(i-1) % n, j]
+                        elif direction == np.pi:
+                            src = layer[i, (j+1) % n]
+                        else:
+                            src = layer[(i+1) % n, j]
+                        cells[i, j, dir_pc] = layer[i, j]*(1.0 - vtrans) + src*vtrans
+                continue
+
+            quarter = int(np.floor(direction*2/np.pi))
+            pca90 = _rot90_nb(layer, quarter)
+            dir90 = direction - quarter * np.pi/2
+
+            weight_sw = (vtrans**2) * np.cos(dir90) * np.sin(dir90)
+            weight_se = vtrans*np.sin(dir90) - \
+                        (vtrans**2) * np.cos(dir90) * np.sin(dir90)
+            weight_nw = vtrans*np.cos(dir90) - \
+                        (vtrans**2) * np.cos(dir90) * np.sin(dir90)
+            weight_ne = 1.0 - weight_sw - weight_se - weight_nw
+
+            m = n + 2
+            padded = np.zeros((m, m))
+            padded[1:-1, 1:-1] = pca90
+            pca_new = np.empty((m, m))
+            for i in range(m):
+                for j in range(m):
+                    pca_new[i, j] = padded[i, j]*weight_ne + \
+                                    padded[i, j-1]*weight_nw + \
+                                    padded[i-1, j]*weight_se + \
+                                    padded[i-1, j-1]*weight_sw
+
+            pca90 = pca_new[1:-1, 1:-1]
+            for i in range(1, n):
+                pca90[i, 0] += pca_new[i+1, m-1]
+            for j in range(1, n):
+                pca90[1, j] += pca_new[m-1, j+1]
+            pca90[0, 0] += pca_new[m-1, m-1]
+
+            cells[:, :, dir_pc] = _rot90_nb(pca90, 4 - quarter)
+        return cells
+
+
+def path_integrate_xy(cells, vtrans):
+    """
+    Shift the activity of every theta layer by vtrans in the direction the
+    layer stands for. cells is updated in place and returned.
+    """
+    if get_backend() == 'numba':
+        return _path_integrate_xy_nb(cells, float(vtrans))
+    return _path_integrate_xy_np(cells, vtrans)
@@ -0,0 +1,95 @@
+from collections import deque
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+
+
+@dataclass
+class MapUpdate:
+    """Everything that changed in the experience map during one step.
+
+    new_exps and moved are (n, 4) arrays of (id, x_m, y_m, facing_rad),
+    new_links is an (n, 2) array of (parent id, target id).
+    """
+    step: int
+    current_id: int
+    new_exps: np.ndarray
+    new_links: np.ndarray
+    moved: np.ndarray
+
+
+def exp_rows(exps) -> np.ndarray:
+    """Pack experiences into (n, 4) rows of (id, x_m, y_m, facing_rad).
+    None, e.g. before a localizer recognizes anything, packs as id -1."""
+    rows = np.zeros((len(exps), 4))
+    for i, e in enumerate(exps):
+        rows[i] = (-1, 0, 0, 0) if e is None else (e.id, e.x_m, e.y_m, e.facing_rad)
+    return rows
+
+
+class MapStream:
+    """Bounded sink for experience map updates.
+
+    Updates are kept in a ring buffer of `maxlen` entries, the oldest ones
+    are dropped when consumers don't drain fast enough (`dropped` counts
+    them). The trajectory (step, exp id, x_m, y_m, facing_rad) is buffered
+    and appended to `trajectory_path` as csv every `chunk_size` rows, so
+    memory stays flat no matter how long the run is.
+    """
+
+    TRAJECTORY_HEADER = "step,exp_id,x_m,y_m,facing_rad"
+
+    def __init__(self, maxlen: int = 256,
+                 trajectory_path: Optional[str] = None,
+                 chunk_size: int = 1024) -> None:
+        self.updates = deque(maxlen=maxlen)
+        self.dropped = 0
+
+        self.trajectory_path = trajectory_path
+        self.chunk_size = chunk_size
+        self._rows = np.zeros((chunk_size, 5))
+        self._n_rows = 0
+        self._header_written = False
+
+    def push(self, update: MapUpdate) -> None:
+        if len(self.updates) == self.updates.maxlen:
+            self.dropped += 1
+        self.updates.append(update)
+
+    def drain(self) -> List[MapUpdate]:
+        """Return and forget all buffered updates, oldest first."""
+        updates = list(self.updates)
+        self.updates.clear()
+        return updates
+
+    def log_pose(self, step: int, exp) -> None:
+        if self.trajectory_path is None or exp is None:
+            return
+        self._rows[self._n_rows] = step, exp.id, exp.x_m, exp.y_m, exp.facing_rad
+        self._n_rows += 1
+        if self._n_rows == self.chunk_size:
+            self.flush()
+
+    def close(self) -> None:
+        """Write the rows of the last, partial chunk. Call at the end of a run."""
+        self.flush()
+
+    def flush(self) -> None:
+        if self.trajectory_path is None or self._n_rows == 0:
+            return
+        with open(self.trajectory_path, 'a' if self._header_written else 'w') as f:
+            np.savetxt(
+                f, self._rows[:self._n_rows],
+                fmt=['%d', '%d', '%.6f', '%.6f', '%.6f'],
+                delimiter=',',
+                header='' if self._header_written else self.TRAJECTORY_HEADER,
+                comments=''
+            )
+        self._header_written = True
+        self._n_rows = 0
+
+
+def read_trajectory(path: str) -> np.ndarray:
+    """Load a trajectory written by MapStream as an (n, 5) array."""
+    return np.loadtxt(path, delimiter=',', skiprows=1, ndmin=2)
@@ -0,0 +1,234 @@
+import json
+import os
+import shutil
+from typing import Tuple
+
+import numpy as np
+
+from ratslam.map_stream import MapUpdate
+
+
+def _codes(cells: np.ndarray) -> np.ndarray:
+    """One int64 per (x, y) row of integer cells."""
+    return cells[:, 0].astype(np.int64) * (1 << 32) + (cells[:, 1].astype(np.int64) + (1 << 31))
+
+
+def _cells(codes: np.ndarray) -> np.ndarray:
+    return np.stack([codes >> 32, (codes & 0xffffffff) - (1 << 31)], axis=1)
+
+
+class TileExporter:
+    """Writes the experience map as tiles at several levels of detail.
+
+    Level 0 tiles are tile_size map units wide and hold every experience in
+    them and every link with an end in them. Level l tiles are 2**l times
+    wider and are simplified by clustering: the experiences of each cell of
+    a resolution x resolution grid over the tile become one node at their
+    mean, and links become segments between the nodes of their ends' cells,
+    so long chains turn into coarse polylines.
+
+    The exporter is fed the MapUpdates of the experience map. Tiles touched
+    by new experiences, new links or moved experiences are marked dirty, and
+    flush rewrites only those, so a relaxation that moves a few experiences
+    rewrites a few tiles. path holds z{level}/{tx}_{ty}.npz files, each with
+    'nodes' (n, 4) and 'segments' (k, 4) arrays, and index.json lists them.
+    Level 0 nodes are (id, x_m, y_m, facing_rad), coarse ones (count, x_m,
+    y_m, 0). Segments are (x0, y0, x1, y1).
+
+    path must be empty, new, or an earlier export, whose level directories
+    and index are replaced. Nothing else in it is touched.
+    """
+
+    def __init__(self, path: str, tile_size: float = 50., n_levels: int = 6,
+                 resolution: int = 64) -> None:
+        index = os.path.join(path, 'index.json')
+        if os.path.exists(index):
+            with open(index) as f:
+                old_levels = json.load(f)['n_levels']
+            for level in range(old_levels):
+                shutil.rmtree(os.path.join(path, f'z{level}'), ignore_errors=True)
+            os.remove(index)
+        elif os.path.isdir(path) and os.listdir(path):
+            raise Exception(f"{path} is not empty and not a tile export")
+        for level in range(n_levels):
+            os.makedirs(os.path.join(path, f'z{level}'), exist_ok=True)
+        self.path = path
+        self.tile_size = tile_size
+        self.n_levels = n_levels
+        self.resolution = resolution
+
+        self.exps = np.zeros((1024, 3))  # x_m, y_m, facing_rad by id
+        self.n_exps = 0
+        self.links = np.zeros((1024, 2), dtype=int)
+        self.n_links = 0
+
+        # since the last flush: experiences that are new or moved, where the
+        # moved ones were before, and links that are new
+        self.changed = set()
+        self.old_xy = []
+        self.new_links_from = 0
+        # codes of the tiles on disk, per level
+        self.tiles = [set() for _ in range(n_levels)]
+        self.written = 0
+        # marks path as an export from the start
+        self._write_index()
+
+    def update(self, update: MapUpdate) -> None:
+        if len(update.new_exps):
+            ids = update.new_exps[:, 0].astype(int)
+            n = ids.max() + 1
+            if n > len(self.exps):
+                grown = np.zeros((max(n, 2 * len(self.exps)), 3))
+                grown[:len(self.exps)] = self.exps
+                self.exps = grown
+            self.exps[ids] = update.new_exps[:, 1:]
+            self.n_exps = max(self.n_exps, n)
+            self.changed.update(ids.tolist())
+
+        if len(update.moved):
+            ids = update.moved[:, 0].astype(int)
+            self.old_xy.append(self.exps[ids, :2].copy())
+            self.exps[ids] = update.moved[:, 1:]
+            self.changed.update(ids.tolist())
+
+        if len(update.new_links):
+            n = self.n_links + len(update.new_links)
+            if n > len(self.links):
+                grown = np.zeros((max(n, 2 * len(self.links)), 2), dtype=int)
+                grown[:self.n_links] = self.links[:self.n_links]
+                self.links = grown
+            self.links[self.n_links:n] = update.new_links
+            self.n_links = n
+
+    def flush(self) -> int:
+        """Rewrite the dirty tiles, return how many were written."""
+        if not self.changed and self.new_links_from == self.n_links:
+            return 0
+        xy = self.exps[:self.n_exps, :2]
+        links = self.links[:self.n_links]
+        changed = np.fromiter(self.changed, dtype=int, count=len(self.changed))
+        old_xy = np.concatenate(self.old_xy) if self.old_xy else np.zeros((0, 2))
+
+        written = 0
+        for level in range(self.n_levels):
+            size = self.tile_size * 2**level
+            cell_size = size / self.resolution if level > 0 else None
+            tiles = _codes(np.floor(xy / size))
+            # the nodes a link is drawn between at this level
+            if level == 0:
+                node = np.arange(len(xy))
+                old_nodes = np.zeros(0, dtype=np.int64)
+                changed_nodes = changed
+            else:
+                node = _codes(np.floor(xy / cell_size))
+                old_nodes = _codes(np.floor(old_xy / cell_size))
+                changed_nodes = node[changed]
+
+            dirty = set(tiles[changed].tolist())
+            dirty.update(_codes(np.floor(old_xy / size)).tolist())
+            # links whose drawing changed: new ones, and those with an end
+            # at a node that was added, moved or, for clusters, moved into
+            touched = np.zeros(len(links), dtype=bool)
+            touched[self.new_links_from:] = True
+            if len(links):
+                moved_nodes = np.concatenate([changed_nodes, old_nodes])
+                touched |= np.isin(node[links], moved_nodes).any(axis=1)
+            dirty.update(tiles[links[touched]].ravel().tolist())
+            if not dirty:
+                continue
+
+            dirty = np.fromiter(dirty, dtype=np.int64, count=len(dirty))
+
+            # experiences and links (by either end) of the dirty tiles,
+            # grouped by tile
+            members = np.flatnonzero(np.isin(tiles, dirty))
+            members = members[np.argsort(tiles[members], kind='stable')]
+            member_tiles = tiles[members]
+            drawn = np.flatnonzero(np.isin(tiles[links], dirty).any(axis=1)) if len(links) \
+                else np.zeros(0, dtype=int)
+            link_tiles = tiles[links[drawn]].ravel()
+            link_order = np.argsort(link_tiles, kind='stable')
+            link_tiles = link_tiles[link_order]
+            link_order = drawn[link_order // 2]
+
+            clusters = None
+            if level > 0:
+                # the cells of the dirty tiles and of the far ends of their
+                # links, they are all in these tiles
+                around = np.union1d(dirty, link_tiles)
+                pool = np.flatnonzero(np.isin(tiles, around))
+                cells, inverse = np.unique(node[pool], return_inverse=True)
+                counts = np.bincount(inverse, minlength=len(cells))
+                mean = np.stack([np.bincount(inverse, xy[pool, 0], len(cells)),
+                                 np.bincount(inverse, xy[pool, 1], len(cells))], axis=1)
+                clusters = node, cells, counts, mean / counts[:, None]
+
+            for code in dirty:
+                lo, hi = np.searchsorted(member_tiles, [code, code + 1])
+                tile_members = members[lo:hi]
+                lo, hi = np.searchsorted(link_tiles, [code, code + 1])
+                tile_links = links[np.unique(link_order[lo:hi])]
+                written += self._write_tile(level, code, tile_members, tile_links, xy, clusters)
+
+        self.changed.clear()
+        self.old_xy = []
+        self.new_links_from = self.n_links
+        self._write_index()
+        self.written += written
+        return written
+
+    def _write_tile(self, level, code, members, drawn, xy, clusters) -> int:
+        name = os.path.join(self.path, f'z{level}', '{}_{}.npz'.format(*_cells(np.array([code]))[0]))
+        if len(members) == 0:
+            if code in self.tiles[level]:
+                os.remove(name)
+                self.tiles[level].discard(code)
+            return 0
+
+        if level == 0:
+            nodes = np.column_stack([members, self.exps[members]])
+            segments = np.column_stack([xy[drawn[:, 0]], xy[drawn[:, 1]]])
+        else:
+            # one node per cell, at the mean of its experiences, and one
+            # segment per pair of linked cells
+            node, cells, counts, mean = clusters
+            here = np.unique(np.searchsorted(cells, node[members]))
+            nodes = np.column_stack([counts[here], mean[here], np.zeros(len(here))])
+            ends = np.sort(np.searchsorted(cells, node[drawn]), axis=1).reshape(-1, 2)
+            ends = np.unique(ends[ends[:, 0] != ends[:, 1]], axis=0)
+            segments = np.column_stack([mean[ends[:, 0]], mean[ends[:, 1]]])
+        np.savez(name, nodes=nodes, segments=segments.reshape(-1, 4))
+        self.tiles[level].add(code)
+        return 1
+
+    def _write_index(self) -> None:
+        index = {
+            'tile_size': self.tile_size,
+            'n_levels': self.n_levels,
+            'resolution': self.resolution,
+            'tiles': [_cells(np.array(sorted(t), dtype=np.int64)).tolist() if t else []
+                      for t in self.tiles],
+        }
+        with open(os.path.join(self.path, 'index.json'), 'w') as f:
+            json.dump(index, f)
+
+
+def read_tiles(path: str, level: int, x_min: float, y_min: float,
+               x_max: float, y_max: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The nodes and segments of the tiles of level that overlap a box, from
+    a TileExporter directory, without reading the rest of the map.
+    Segments between two tiles are in both.
+    """
+    with open(os.path.join(path, 'index.json')) as f:
+        index = json.load(f)
+    size = index['tile_size'] * 2**level
+    nodes, segments = [np.zeros((0, 4))], [np.zeros((0, 4))]
+    for tx, ty in index['tiles'][level]:
+        if (tx + 1) * size < x_min or tx * size > x_max or \
+                (ty + 1) * size < y_min or ty * size > y_max:
+            continue
+        tile = np.load(os.path.join(path, f'z{level}', f'{tx}_{ty}.npz'))
+        nodes.append(tile['nodes'])
+        segments.append(tile['segments'])
+    return np.concatenate(nodes), np.concatenate(segments)
@@ -0,0 +1,314 @@
+import inspect
+from dataclasses import dataclass, replace
+from typing import Callable, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+from lava.magma.core.decorator import implements, requires, tag
+from lava.magma.core.model.py.model import PyLoihiProcessModel
+from lava.magma.core.model.py.ports import PyOutPort
+from lava.magma.core.model.py.type import LavaPyType
+from lava.magma.core.process.ports.ports import OutPort
+from lava.magma.core.process.process import AbstractProcess
+from lava.magma.core.process.variable import Var
+from lava.magma.core.resources import CPU
+from lava.magma.core.sync.protocols.loihi_protocol import LoihiProtocol
+
+from ratslam.constants import PC_DIM_XY
+from ratslam.experience_map import ExperienceGraph, ExperienceMap
+from ratslam.frozen_map import save_map
+from ratslam.image_generator import ImageGenerator
+from ratslam.image_sequence import ImageSequence, ImageSequenceGenerator
+from ratslam.map_stream import MapUpdate, exp_rows
+from ratslam.pose_cells import PoseCellNetwork, PoseCells
+from ratslam.replay import TrafficRecorder
+from ratslam.view_cells import ViewCellMatcher, ViewCells, encode_cell
+from ratslam.visual_odometry import Odometer, VisualOdometry
+
+TOPOLOGIES = ('fused', 'distributed')
+# the stages of FusedPipeline that can run less often than every frame
+SCHEDULED_STAGES = ('view_cells', 'experience_map')
+
+
+@dataclass
+class StageSchedule:
+    """When a stage of FusedPipeline runs.
+
+    every: the stage runs on frames 0, every, 2*every, ...
+    trigger: called with the pipeline on the other frames, the stage also
+        runs when it returns True. The odometry of the frame is already in
+        pipeline.vtrans_vrot.
+    """
+    every: int = 1
+    trigger: Optional[Callable[['FusedPipeline'], bool]] = None
+
+    def due(self, frame: int, pipeline: 'FusedPipeline') -> bool:
+        if frame % self.every == 0:
+            return True
+        return self.trigger is not None and bool(self.trigger(pipeline))
+
+
+
+class FusedPipeline:
+    """All RatSLAM stages run one after the other on each frame.
+
+    These are the same stage classes the distributed process models wrap,
+    so both topologies compute the same thing. The view cells see the pose
+    of the previous frame, like the pose_out -> pose_in loop of the
+    distributed network, and the first frame is taken as standing still.
+    params are the keyword arguments of the stage processes.
+
+    With a recorder, the messages the stages would exchange are logged
+    every frame for replay_pose_cells and replay_experience_map.
+
+    schedule: StageSchedule by name in SCHEDULED_STAGES, the stages left
+        out run every frame. view_cells_every and experience_map_every in
+        params are the same as StageSchedule(every=...). Odometry and the
+        pose cells always run. On frames without template matching the
+        pose cells get the last view cell without injecting energy, and on
+        frames without a map update the experience map only integrates
+        the odometry, so nothing is lost, only delayed. relax_every in
+        params limits how often loop closures relax the map.
+
+    With map_path in params the pipeline only localizes in a map written by
+    save_map, see ViewCellLocalizer and ExperienceLocalizer.
+    """
+
+    def __init__(self, recorder: Optional[TrafficRecorder] = None,
+                 schedule: Optional[Dict[str, StageSchedule]] = None, **params) -> None:
+        self.schedule = {
+            name: StageSchedule(every=params.get(f'{name}_every', 1))
+            for name in SCHEDULED_STAGES
+        }
+        for name, stage_schedule in (schedule or {}).items():
+            if name not in SCHEDULED_STAGES:
+                raise Exception(f"stage {name} can not be scheduled")
+            self.schedule[name] = stage_schedule
+        self.frame = 0
+        self.vtrans_vrot = np.zeros(2)
+        self.view_cell = None
+
+        self.odometer = Odometer.from_params(params)
+        self.view_cells = ViewCellMatcher.from_params(params)
+        self.pose_cells = PoseCellNetwork.from_params(params)
+        self.experience_map = ExperienceGraph.from_params(
+            dict(params, pc_dim_xy=self.pose_cells.dim_xy, pc_dim_th=self.pose_cells.dim_th))
+        self.pose = np.array(self.pose_cells.active, dtype=float)
+        self.recorder = recorder
+
+    def step(self, img: np.ndarray) -> Optional[MapUpdate]:
+        """Run a frame, return its MapUpdate or None if the map was not updated."""
+        vtrans_vrot = self.odometer.step(img)
+        self.vtrans_vrot = np.zeros(2) if vtrans_vrot is None else vtrans_vrot
+        vtrans, vrot = self.vtrans_vrot
+
+        if self.view_cell is None or self.schedule['view_cells'].due(self.frame, self):
+            self.view_cell = self.view_cells.step(img, self.pose)
+            view_cell, new = self.view_cell, self.view_cells.new_cell
+        else:
+            # first=True keeps the pose cells from injecting energy again
+            view_cell, new = replace(self.view_cell, first=True), False
+        first = view_cell.first
+        self.pose = np.array(self.pose_cells.step(view_cell, vtrans, vrot))
+        if self.recorder is not None:
+            self.recorder.record((vtrans, vrot),
+                                 encode_cell(view_cell, new),
+                                 first, self.pose)
+
+        self.experience_map.integrate(vtrans, vrot)
+        update = None
+        if self.schedule['experience_map'].due(self.frame, self):
+            update = self.experience_map.update(self.view_cell, *self.pose)
+        self.frame += 1
+        return update
+
+    def close(self) -> None:
+        """Write out what the stages still buffer and release their
+        resources, at the end of a run."""
+        if self.recorder is not None:
+            self.recorder.flush()
+        self.view_cells.close()
+        self.experience_map.close()
+
+    def save_map(self, path: str) -> None:
+        """Freeze the map built so far into path, for map_path."""
+        save_map(path, self.view_cells, self.experience_map)
+
+
+class RatSLAM(AbstractProcess):
+    def __init__(self, video_shape: Tuple[int, int], video_path: Optional[str] = None,
+                 path: Optional[str] = None, **kwargs) -> None:
+        """
+        The whole RatSLAM network in a single process, one frame per time
+        step, with no channels between the stages.
+
+        video_shape: (height, width)
+        video_path: video to read frames from, or
+        path: directory of images, read with ImageSequence (metadata,
+            cache_path, workers and prefetch go in kwargs)
+        record_path: if given, the messages between the stages are logged
+            there with a TrafficRecorder, flushed every flush_every frames
+            and at the end of the run.
+        view_cells_every, experience_map_every, relax_every: the schedule
+            of the stages, see FusedPipeline.
+        map_path: localize in a map saved with FusedPipeline.save_map
+            instead of mapping.
+        The other keyword arguments of VisualOdometry, ViewCells, PoseCells
+        and ExperienceMap are passed on to their stages.
+        """
+        if (video_path is None) == (path is None):
+            raise Exception("pass exactly one of video_path and path")
+        super().__init__(video_shape=video_shape, video_path=video_path,
+                         path=path, **kwargs)
+
+        self.frames_sent = Var(shape=(1,), init=0)
+        self.pose_out = OutPort(shape=(3,)) #x,y,theta
+        # id, x_m, y_m, facing_rad of the current experience
+        self.exp_out = OutPort(shape=(4,))
+
+
+@implements(proc=RatSLAM, protocol=LoihiProtocol)
+@requires(CPU)
+class PyRatSLAMModel(PyLoihiProcessModel):
+    frames_sent: int = LavaPyType(int, int, precision=32)
+    pose_out: PyOutPort = LavaPyType(PyOutPort.VEC_DENSE, float, precision=32)
+    exp_out: PyOutPort = LavaPyType(PyOutPort.VEC_DENSE, float, precision=32)
+
+    def __init__(self, proc_params):
+        super().__init__(proc_params=proc_params)
+        self.video_shape = tuple(proc_params['video_shape'])
+        self.video_data = None
+        self.sequence = None
+        if proc_params.get('video_path') is not None:
+            self.video_data = cv2.VideoCapture(proc_params['video_path'])
+        else:
+            self.sequence = ImageSequence(
+                proc_params['path'],
+                metadata=proc_params.get('metadata', 'data.txt'),
+                image_shape=self.video_shape,
+                cache_path=proc_params.get('cache_path'),
+                workers=proc_params.get('workers', 4),
+                prefetch=proc_params.get('prefetch', 16)
+            )
+        self.frame_idx = 0
+        recorder = None
+        if proc_params.get('record_path') is not None:
+            recorder = TrafficRecorder(proc_params['record_path'])
+        self.flush_every = proc_params.get('flush_every', 100)
+        self.pipeline = FusedPipeline(recorder=recorder, **proc_params)
+        self.closed = False
+
+    def close(self):
+        if not self.closed:
+            self.pipeline.close()
+            if self.sequence is not None:
+                self.sequence.close()
+            if self.video_data is not None:
+                self.video_data.release()
+            self.closed = True
+
+    def _stop(self):
+        self.close()
+        super()._stop()
+
+    def read_frame(self):
+        if self.video_data is not None:
+            ok, frame = self.video_data.read()
+            if not ok:
+                return None
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            if frame.shape != self.video_shape:
+                frame = cv2.resize(frame, self.video_shape[::-1],
+                                   interpolation=cv2.INTER_AREA)
+            return frame
+        if self.frame_idx >= len(self.sequence):
+            return None
+        return self.sequence.get(self.frame_idx)
+
+    def post_guard(self):
+        return True
+
+    def run_post_mgmt(self):
+        """Post-Management phase: executed only when guard function above
+        returns True.
+        """
+        frame = self.read_frame()
+        if frame is None:
+            # end of the stream
+            self.close()
+            return
+        self.frame_idx += 1
+
+        self.pipeline.step(frame)
+        self.frames_sent += 1
+        if self.pipeline.recorder is not None and self.frame_idx % self.flush_every == 0:
+            self.pipeline.recorder.flush()
+
+        self.pose_out.send(self.pipeline.pose)
+        self.exp_out.send(exp_rows([self.pipeline.experience_map.current_exp])[0])
+
+
+def _stage_kwargs(cls, kwargs):
+    """The keyword arguments of kwargs that the process cls takes."""
+    params = inspect.signature(cls.__init__).parameters
+    return {k: v for k, v in kwargs.items() if k in params}
+
+
+def build_pipeline(video_shape: Tuple[int, int], video_path: Optional[str] = None,
+                   path: Optional[str] = None, topology: str = 'fused',
+                   **kwargs) -> Dict[str, AbstractProcess]:
+    """
+    Create and connect the RatSLAM processes.
+
+    topology: 'fused' for a single RatSLAM process, 'distributed' for one
+        process per stage connected like in ratslam.ipynb, with adaptive
+        pacing of the source by the experience map.
+    kwargs go to the stages that take them.
+    return the processes by name, run the network through 'source'.
+    """
+    if topology not in TOPOLOGIES:
+        raise Exception(f"unknown topology {topology}")
+    if topology == 'fused':
+        ratslam = RatSLAM(video_shape, video_path=video_path, path=path, **kwargs)
+        return {'source': ratslam, 'ratslam': ratslam}
+
+    if (video_path is None) == (path is None):
+        raise Exception("pass exactly one of video_path and path")
+    # the sources keep unknown kwargs in their proc_params, which is harmless
+    source_kwargs = {k: v for k, v in kwargs.items() if k != 'pacing'}
+    if video_path is not None:
+        source = ImageGenerator(video_shape, video_path=video_path,
+                                pacing='adaptive', **source_kwargs)
+    else:
+        source = ImageSequenceGenerator(video_shape, path, pacing='adaptive',
+                                        **source_kwargs)
+
+    visual_odometry = VisualOdometry(video_shape, **_stage_kwargs(VisualOdometry, kwargs))
+    view_cells = ViewCells(video_shape, **_stage_kwargs(ViewCells, kwargs))
+    pose_cells = PoseCells(registry_name=view_cells.registry_name,
+                           **_stage_kwargs(PoseCells, kwargs))
+    if kwargs.get('pc_scale', 1) > 1:
+        kwargs['pc_dim_xy'] = PC_DIM_XY*kwargs['pc_scale']
+    experience_map = ExperienceMap(**_stage_kwargs(ExperienceMap, kwargs))
+
+    source.img_out.connect(visual_odometry.img_in)
+    source.img_out.connect(view_cells.img_in)
+
+    visual_odometry.vtrans_vrot_out.connect(pose_cells.vtrans_vrot_in)
+    visual_odometry.vtrans_vrot_out.connect(experience_map.vtrans_vrot_in)
+
+    view_cells.cell_out.connect(pose_cells.cell_in)
+    view_cells.cell_out.connect(experience_map.cell_in)
+
+    pose_cells.pose_out.connect(view_cells.pose_in)
+    pose_cells.pose_out.connect(experience_map.pose_in)
+
+    experience_map.ready_out.connect(source.ready_in)
+
+    return {
+        'source': source,
+        'visual_odometry': visual_odometry,
+        'view_cells': view_cells,
+        'pose_cells': pose_cells,
+        'experience_map': experience_map,
+    }
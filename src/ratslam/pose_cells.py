@@ -1,3 +1,5 @@
+import itertools
+from dataclasses import replace
 from typing import List, Tuple
 
 import numpy as np
@@ -7,32 +9,155 @@ from lava.magma.core.model.py.ports import PyInPort, PyOutPort
 from lava.magma.core.model.py.type import LavaPyType
 from lava.magma.core.process.ports.ports import InPort, OutPort
 from lava.magma.core.process.process import AbstractProcess
+from lava.magma.core.process.variable import Var
 from lava.magma.core.resources import CPU
 from lava.magma.core.sync.protocols.loihi_protocol import LoihiProtocol
 
 from ratslam.constants import *
+from ratslam.kernels import path_integrate_xy
+from ratslam.view_cells import CELL_MSG_SIZE, TemplateRegistry, decode_cell
 
 
 class PoseCells(AbstractProcess):
-    def __init__(self) -> None:
-        super().__init__()
-        self.cell_in = InPort(shape=(4,))
+    def __init__(self, n_packets: int = 1, registry_name: str = None,
+                 quiescent_eps: float = PC_QUIESCENT_EPS, pc_scale: int = 1,
+                 fine_dim_xy: int = PC_FINE_DIM_XY) -> None:
+        """
+        n_packets: number of activity packets decoded every step, the
+            strongest one is sent on pose_out, all of them on packets_out.
+        registry_name: ViewCells.registry_name of the view cells connected
+            to cell_in, the template ids are resolved through it.
+        quiescent_eps: once the activity changed by less than this for
+            PC_QUIESCENT_STEPS steps without motion or view cell energy, the
+            network is at its fixed point and is not updated until either
+            comes back. The steps skipped are counted in skipped_steps, with
+            pc_scale > 1 those of the coarse and fine networks added up.
+            0 always updates.
+        pc_scale: if > 1, a HierarchicalPoseCellNetwork covering pc_scale
+            times the PC_DIM_XY grid is used, with a fine grid of
+            fine_dim_xy cells following the pose. The pose is then in fine
+            cells, pass pc_dim_xy=PC_DIM_XY*pc_scale to the ExperienceMap.
+        """
+        super().__init__(n_packets=n_packets, registry_name=registry_name,
+                         quiescent_eps=quiescent_eps, pc_scale=pc_scale,
+                         fine_dim_xy=fine_dim_xy)
+        self.cell_in = InPort(shape=(CELL_MSG_SIZE,))
         self.vtrans_vrot_in = InPort(shape=(2,))
 
         self.pose_out = OutPort(shape=(3,)) #x,y,theta
-
-@implements(proc=PoseCells, protocol=LoihiProtocol)
-@requires(CPU)
-class PyPoseCellsModel(PyLoihiProcessModel):
-    cell_in: PyInPort = LavaPyType(PyInPort.VEC_DENSE, int, precision=32)
-    vtrans_vrot_in: PyInPort = LavaPyType(PyInPort.VEC_DENSE, float, precision=32)
-
-    pose_out: PyOutPort = LavaPyType(PyOutPort.VEC_DENSE, float, precision=32)
-
-    def __init__(self, proc_params):
-        super().__init__(proc_params=proc_params)
-        self.cells = np.zeros([PC_DIM_XY, PC_DIM_XY, PC_DIM_TH])
-        self.active = a, b, c = [PC_DIM_XY//2, PC_DIM_XY//2, PC_DIM_TH//2]
+        self.packets_out = OutPort(shape=(n_packets, 4)) #x,y,theta,energy
+
+        self.skipped_steps = Var(shape=(1,), init=0)
+
+
+def decode_windows(cells, centers):
+    '''Population vector decoding of the activity around each center.
+    :param cells: the pose cell activity.
+    :param centers: (k, 3) integer x, y, th indices to decode around.
+    :return: (k, 4) array with the x, y, th of each packet and its energy,
+             the activity summed over the decoded window.
+    '''
+    dim_xy, _, dim_th = cells.shape
+    offsets = np.arange(-PC_CELLS_TO_AVG, PC_CELLS_TO_AVG)
+    xs = (centers[:, 0, None] + offsets) % dim_xy
+    ys = (centers[:, 1, None] + offsets) % dim_xy
+    ths = (centers[:, 2, None] + offsets) % dim_th
+
+    # (k, 2n, 2n, 2n) wrapped neighbourhoods, no full size temporaries
+    window = cells[xs[:, :, None, None], ys[:, None, :, None], ths[:, None, None, :]]
+    x_sums = window.sum(axis=(2, 3))
+    y_sums = window.sum(axis=(1, 3))
+    th_sums = window.sum(axis=(1, 2))
+
+    # same as the PC_*_SUM_*_LOOKUP tables, indexed by cell
+    def circular_mean(idx, sums, dim):
+        angles = (idx + 1) * (2*np.pi/dim)
+        return (np.arctan2(np.sum(np.sin(angles)*sums, axis=1),
+                           np.sum(np.cos(angles)*sums, axis=1)) * \
+                dim/(2*np.pi)) % dim
+
+    packets = np.empty((len(centers), 4))
+    packets[:, 0] = circular_mean(xs, x_sums, dim_xy)
+    packets[:, 1] = circular_mean(ys, y_sums, dim_xy)
+    packets[:, 2] = circular_mean(ths, th_sums, dim_th)
+    packets[:, 3] = x_sums.sum(axis=1)
+    return packets
+
+
+def find_packets(cells, k=1):
+    '''Find the centers of the k strongest activity packets.
+    Peaks are taken among the strongest cells, a peak is a cell that is the
+    maximum of its wrapped 3x3x3 neighbourhood, and peaks closer than
+    PC_CELLS_TO_AVG to a stronger one belong to the same packet.
+    :return: (k, 4) array of x, y, th, energy, strongest packet first. Fewer
+             rows are returned if there aren't k packets.
+    '''
+    if k == 1:
+        center = np.unravel_index(np.argmax(cells), cells.shape)
+        return decode_windows(cells, np.array([center]))
+
+    # the activity is mostly zero after global inhibition
+    flat = cells.ravel()
+    cand = np.flatnonzero(flat > 0)
+    n_cand = PC_PACKET_CANDIDATES*k
+    if len(cand) > n_cand:
+        cand = cand[np.argpartition(flat[cand], -n_cand)[-n_cand:]]
+    cand = cand[np.argsort(-flat[cand], kind='stable')]
+
+    dims = np.array(cells.shape)
+    points = np.array(np.unravel_index(cand, cells.shape)).T
+    nbrs = np.ravel_multi_index(
+        np.moveaxis(points[:, None, :] + _NEIGHBOURS, 2, 0), cells.shape, mode='wrap')
+    peaks = points[flat[cand] >= flat[nbrs].max(axis=1)]
+
+    centers = []
+    for p in peaks:
+        if len(centers) == k:
+            break
+        if centers:
+            d = np.abs(np.array(centers) - p)
+            d = np.minimum(d, dims - d)
+            if np.any(np.all(d < PC_CELLS_TO_AVG, axis=1)):
+                continue
+        centers.append(p)
+    if not centers:
+        centers = [np.unravel_index(np.argmax(cells), cells.shape)]
+    return decode_windows(cells, np.array(centers))
+
+
+_NEIGHBOURS = np.array(list(itertools.product((-1, 0, 1), repeat=3)))
+
+
+def _wrap(dim, half):
+    # like PC_E_XY_WRAP for a grid of dim cells
+    return list(range(dim-half, dim)) + list(range(dim)) + list(range(half))
+
+
+class PoseCellNetwork:
+    """
+    The pose cell attractor network, the computation of PyPoseCellsModel
+    without the ports, so the fused pipeline can run it too.
+    """
+
+    def __init__(self, n_packets: int = 1, quiescent_eps: float = PC_QUIESCENT_EPS,
+                 dim_xy: int = PC_DIM_XY, dim_th: int = PC_DIM_TH) -> None:
+        self.dim_xy = dim_xy
+        self.dim_th = dim_th
+        self.c_size_th = (2.*np.pi)/dim_th
+        self.e_xy_wrap = _wrap(dim_xy, PC_W_E_DIM_HALF)
+        self.e_th_wrap = _wrap(dim_th, PC_W_E_DIM_HALF)
+        self.i_xy_wrap = _wrap(dim_xy, PC_W_I_DIM_HALF)
+        self.i_th_wrap = _wrap(dim_th, PC_W_I_DIM_HALF)
+
+        self.n_packets = n_packets
+        self.quiescent_eps = quiescent_eps
+        # steps in a row the activity has been still, and the steps skipped
+        self.quiet_steps = 0
+        self.skipped_steps = 0
+        self.packets = np.zeros((self.n_packets, 4))
+        self.confidence = 1.0
+        self.cells = np.zeros([dim_xy, dim_xy, dim_th])
+        self.active = a, b, c = [dim_xy//2, dim_xy//2, dim_th//2]
         self.cells[a, b, c] = 1
 
     def compute_activity_matrix(self, xywrap, thwrap, wdim, pcw): 
@@ -40,12 +165,12 @@ class PyPoseCellsModel(PyLoihiProcessModel):
         
         # The goal is to return an update matrix that can be added/subtracted
         # from the posecell matrix
-        pca_new = np.zeros([PC_DIM_XY, PC_DIM_XY, PC_DIM_TH])
+        pca_new = np.zeros(self.cells.shape)
         
         # for nonzero posecell values  
         indices = np.nonzero(self.cells)
 
-        for i,j,k in itertools.izip(*indices):
+        for i,j,k in zip(*indices):
             pca_new[np.ix_(xywrap[i:i+wdim], 
                            xywrap[j:j+wdim],
                            thwrap[k:k+wdim])] += self.cells[i,j,k]*pcw
@@ -53,73 +178,48 @@ class PyPoseCellsModel(PyLoihiProcessModel):
         return pca_new
 
 
-    def get_pc_max(self, xywrap, thwrap):
-        '''Find the x, y, th center of the activity in the network.'''
-        
-        x, y, z = np.unravel_index(np.argmax(self.cells), self.cells.shape)
-        
-        z_posecells = np.zeros([PC_DIM_XY, PC_DIM_XY, PC_DIM_TH]) 
-      
-        zval = self.cells[np.ix_(
-            xywrap[x:x+PC_CELLS_TO_AVG*2], 
-            xywrap[y:y+PC_CELLS_TO_AVG*2], 
-            thwrap[z:z+PC_CELLS_TO_AVG*2]
-        )]
-        z_posecells[np.ix_(
-            PC_AVG_XY_WRAP[x:x+PC_CELLS_TO_AVG*2], 
-            PC_AVG_XY_WRAP[y:y+PC_CELLS_TO_AVG*2], 
-            PC_AVG_TH_WRAP[z:z+PC_CELLS_TO_AVG*2]
-        )] = zval
-        
-        # get the sums for each axis
-        x_sums = np.sum(np.sum(z_posecells, 2), 1) 
-        y_sums = np.sum(np.sum(z_posecells, 2), 0)
-        th_sums = np.sum(np.sum(z_posecells, 1), 0)
-        th_sums = th_sums[:]
-        
-        # now find the (x, y, th) using population vector decoding to handle 
-        # the wrap around 
-        x = (np.arctan2(np.sum(PC_XY_SUM_SIN_LOOKUP*x_sums), 
-                        np.sum(PC_XY_SUM_COS_LOOKUP*x_sums)) * \
-            PC_DIM_XY/(2*np.pi)) % (PC_DIM_XY)
-            
-        y = (np.arctan2(np.sum(PC_XY_SUM_SIN_LOOKUP*y_sums), 
-                        np.sum(PC_XY_SUM_COS_LOOKUP*y_sums)) * \
-            PC_DIM_XY/(2*np.pi)) % (PC_DIM_XY)
-            
-        th = (np.arctan2(np.sum(PC_TH_SUM_SIN_LOOKUP*th_sums), 
-                         np.sum(PC_TH_SUM_COS_LOOKUP*th_sums)) * \
-             PC_DIM_TH/(2*np.pi)) % (PC_DIM_TH)
-
-        # print x, y, th
-        return (x, y, th)
-
-    def post_guard(self):
-        return True
-
-    def run_post_mgmt(self):
-        """Post-Management phase: executed only when guard function above
-        returns True.
-        """
-        # self.pose_out.send(np.array([0,0,0]))  # dummy value to unblock view_cells for now
+    def decode(self):
+        '''Find the x, y, th center of the activity in the network.
+        Also keeps the strongest packets and the share of their energy held
+        by the winner, which is low when the pose is ambiguous.
+        '''
+        packets = find_packets(self.cells, self.n_packets)
+        self.confidence = packets[0, 3] / np.sum(packets[:, 3])
+        self.packets = np.zeros((self.n_packets, 4))
+        self.packets[:len(packets)] = packets
+        return tuple(packets[0, :3])
+
+    @classmethod
+    def from_params(cls, params):
+        """The network PoseCells would run with these proc_params, a
+        HierarchicalPoseCellNetwork if pc_scale > 1."""
+        if params.get('pc_scale', 1) > 1:
+            return HierarchicalPoseCellNetwork(
+                n_packets=params.get('n_packets', 1),
+                quiescent_eps=params.get('quiescent_eps', PC_QUIESCENT_EPS),
+                scale=params['pc_scale'],
+                fine_dim_xy=params.get('fine_dim_xy', PC_FINE_DIM_XY)
+            )
+        return cls(n_packets=params.get('n_packets', 1),
+                   quiescent_eps=params.get('quiescent_eps', PC_QUIESCENT_EPS))
+
+    def step(self, view_cell, vtrans, vrot):
         '''Execute an interation of pose cells.
         :param view_cell: the last most activated view cell.
         :param vtrans: the translation of the robot given by odometry.
         :param vrot: the rotation of the robot given by odometry.
         :return: a 3D-tuple with the (x, y, th) index of most active pose cell.
         '''
-        view_cell = self.cell_in.recv()
-        vtrans, vrot = self.vtrans_vrot_in.recv()
-
+        still = vtrans == 0 and vrot == 0
         vtrans = vtrans*POSECELL_VTRANS_SCALING
 
         # if this isn't a new vt then add the energy at its associated posecell
         # location
 
         if not view_cell.first:
-            act_x = np.min([np.max([int(np.floor(view_cell.x_pc)), 1]), PC_DIM_XY]) 
-            act_y = np.min([np.max([int(np.floor(view_cell.y_pc)), 1]), PC_DIM_XY])
-            act_th = np.min([np.max([int(np.floor(view_cell.th_pc)), 1]), PC_DIM_TH])
+            act_x = np.min([np.max([int(np.floor(view_cell.x_pc)), 1]), self.dim_xy]) 
+            act_y = np.min([np.max([int(np.floor(view_cell.y_pc)), 1]), self.dim_xy])
+            act_th = np.min([np.max([int(np.floor(view_cell.th_pc)), 1]), self.dim_th])
 
             # print [act_x, act_y, act_th]
         # this decays the amount of energy that is injected at the vt's
@@ -131,20 +231,27 @@ class PyPoseCellsModel(PyLoihiProcessModel):
             energy = PC_VT_INJECT_ENERGY*(1./30.)*(30 - np.exp(1.2 * view_cell.decay))
             if energy > 0:
                 self.cells[act_x, act_y, act_th] += energy
+                still = False
         #===============================
 
+        # the attractor is at its fixed point, the update wouldn't change it
+        if still and self.quiet_steps >= PC_QUIESCENT_STEPS:
+            self.skipped_steps += 1
+            return self.active
+        before = self.cells
+
 
         # local excitation - PC_le = PC elements * PC weights
-        self.cells = self.compute_activity_matrix(PC_E_XY_WRAP, 
-                                                  PC_E_TH_WRAP, 
+        self.cells = self.compute_activity_matrix(self.e_xy_wrap, 
+                                                  self.e_th_wrap, 
                                                   PC_W_E_DIM, 
                                                   PC_W_EXCITE)
         # print np.max(self.cells)
         # raw_input()
 
         # local inhibition - PC_li = PC_le - PC_le elements * PC weights
-        self.cells = self.cells-self.compute_activity_matrix(PC_I_XY_WRAP, 
-                                                             PC_I_TH_WRAP, 
+        self.cells = self.cells-self.compute_activity_matrix(self.i_xy_wrap, 
+                                                             self.i_th_wrap, 
                                                              PC_W_I_DIM, 
                                                              PC_W_INHIB) 
 
@@ -161,81 +268,193 @@ class PyPoseCellsModel(PyLoihiProcessModel):
         # Path Integration
         # vtrans affects xy direction
         # shift in each th given by the th
-        for dir_pc in range(PC_DIM_TH): 
-            direction = np.float64(dir_pc-1) * PC_C_SIZE_TH
-            # N,E,S,W are straightforward
-            if (direction == 0):
-                self.cells[:,:,dir_pc] = \
-                    self.cells[:,:,dir_pc] * (1.0 - vtrans) + \
-                    np.roll(self.cells[:,:,dir_pc], 1, 1)*vtrans
-
-            elif direction == np.pi/2:
-                self.cells[:,:,dir_pc] = \
-                    self.cells[:,:,dir_pc]*(1.0 - vtrans) + \
-                    np.roll(self.cells[:,:,dir_pc], 1, 0)*vtrans
-
-            elif direction == np.pi:
-                self.cells[:,:,dir_pc] = \
-                    self.cells[:,:,dir_pc]*(1.0 - vtrans) + \
-                    np.roll(self.cells[:,:,dir_pc], -1, 1)*vtrans
-
-            elif direction == 3*np.pi/2:
-                self.cells[:,:,dir_pc] = \
-                    self.cells[:,:,dir_pc]*(1.0 - vtrans) + \
-                    np.roll(self.cells[:,:,dir_pc], -1, 0)*vtrans
-
-            else:
-                pca90 = np.rot90(self.cells[:,:,dir_pc], 
-                              int(np.floor(direction *2/np.pi)))
-                dir90 = direction - int(np.floor(direction*2/np.pi)) * np.pi/2
-
-
-                # extend the Posecells one unit in each direction (max supported at the moment)
-                # work out the weight contribution to the NE cell from the SW, NW, SE cells 
-                # given vtrans and the direction
-                # weight_sw = v * cos(th) * v * sin(th)
-                # weight_se = (1 - v * cos(th)) * v * sin(th)
-                # weight_nw = (1 - v * sin(th)) * v * sin(th)
-                # weight_ne = 1 - weight_sw - weight_se - weight_nw
-                # think in terms of NE divided into 4 rectangles with the sides
-                # given by vtrans and the angle
-                pca_new = np.zeros([PC_DIM_XY+2, PC_DIM_XY+2])   
-                pca_new[1:-1, 1:-1] = pca90 
-                
-                weight_sw = (vtrans**2) *np.cos(dir90) * np.sin(dir90)
-                weight_se = vtrans*np.sin(dir90) - \
-                            (vtrans**2) * np.cos(dir90) * np.sin(dir90)
-                weight_nw = vtrans*np.cos(dir90) - \
-                            (vtrans**2) *np.cos(dir90) * np.sin(dir90)
-                weight_ne = 1.0 - weight_sw - weight_se - weight_nw
-          
-                pca_new = pca_new*weight_ne + \
-                          np.roll(pca_new, 1, 1) * weight_nw + \
-                          np.roll(pca_new, 1, 0) * weight_se + \
-                          np.roll(np.roll(pca_new, 1, 1), 1, 0) * weight_sw
-
-                pca90 = pca_new[1:-1, 1:-1]
-                pca90[1:, 0] = pca90[1:, 0] + pca_new[2:-1, -1]
-                pca90[1, 1:] = pca90[1, 1:] + pca_new[-1, 2:-1]
-                pca90[0, 0] = pca90[0, 0] + pca_new[-1, -1]
-
-                #unrotate the pose cell xy layer
-                self.cells[:,:,dir_pc] = np.rot90(pca90, 
-                                                   4 - int(np.floor(direction * 2/np.pi)))
+        self.cells = path_integrate_xy(self.cells, vtrans)
 
 
         # Path Integration - Theta
         # Shift the pose cells +/- theta given by vrot
         if vrot != 0: 
-            weight = (np.abs(vrot)/PC_C_SIZE_TH)%1
+            weight = (np.abs(vrot)/self.c_size_th)%1
             if weight == 0:
                 weight = 1.0
 
-            shift1 = int(np.sign(vrot) * int(np.floor(abs(vrot)/PC_C_SIZE_TH)))
-            shift2 = int(np.sign(vrot) * int(np.ceil(abs(vrot)/PC_C_SIZE_TH)))
+            shift1 = int(np.sign(vrot) * int(np.floor(abs(vrot)/self.c_size_th)))
+            shift2 = int(np.sign(vrot) * int(np.ceil(abs(vrot)/self.c_size_th)))
             self.cells = np.roll(self.cells, shift1, 2) * (1.0 - weight) + \
                              np.roll(self.cells, shift2, 2) * (weight)
         
-        self.active = self.get_pc_max(PC_AVG_XY_WRAP, PC_AVG_TH_WRAP)
-        self.pose_out.send(np.array(self.active))
+        if still and np.max(np.abs(self.cells - before)) < self.quiescent_eps:
+            self.quiet_steps += 1
+        else:
+            self.quiet_steps = 0
+
+        self.active = self.decode()
+        return self.active
+
+
+def _wrapped_offset(a, b, dim):
+    """signed shortest offset from b to a on a ring of dim"""
+    return (a - b + dim/2) % dim - dim/2
+
+
+class HierarchicalPoseCellNetwork:
+    """
+    Pose cells for environments larger than one grid.
+
+    A coarse PoseCellNetwork with cells `scale` times larger tracks the pose
+    over PC_DIM_XY*scale fine cells, a fine network of fine_dim_xy cells is
+    a window onto that range that follows the pose. Both integrate the same
+    odometry, the coarse one at 1/scale the speed, and view cells inject
+    into the coarse network and, when their pose is in the window, into the
+    fine one. If the coarse network snaps somewhere else, e.g. on a loop
+    closure outside the window, the fine network is restarted there.
+
+    The pose comes out in fine cells, like a flat network of
+    PC_DIM_XY*scale cells, at about the cost of the coarse network plus the
+    fine window.
+    """
+
+    def __init__(self, n_packets: int = 1, quiescent_eps: float = PC_QUIESCENT_EPS,
+                 scale: int = 4, fine_dim_xy: int = PC_FINE_DIM_XY,
+                 coarse_dim_xy: int = PC_DIM_XY, dim_th: int = PC_DIM_TH) -> None:
+        self.scale = scale
+        self.dim_xy = coarse_dim_xy*scale
+        self.dim_th = dim_th
+        self.coarse = PoseCellNetwork(n_packets, quiescent_eps, coarse_dim_xy, dim_th)
+        self.fine = PoseCellNetwork(1, quiescent_eps, fine_dim_xy, dim_th)
+        # the fine window recenters once the pose is this far off its center
+        self.margin = fine_dim_xy//4
+        # and is restarted when it disagrees with the coarse pose by this much
+        self.max_disagreement = 2*scale
+        self.center = fine_dim_xy//2
+        self.origin = np.zeros(2)
+        self.restarts = 0
+        self._restart_fine(self._coarse_xy(), self.coarse.active[2])
+        self.active = self._pose()
+
+    @property
+    def packets(self):
+        packets = self.coarse.packets.copy()
+        packets[:, :2] *= self.scale
+        return packets
+
+    @property
+    def confidence(self):
+        return self.coarse.confidence
+
+    @property
+    def skipped_steps(self):
+        """network updates skipped at rest, of both networks together, see
+        coarse.skipped_steps and fine.skipped_steps for each one."""
+        return self.coarse.skipped_steps + self.fine.skipped_steps
+
+    def _coarse_xy(self):
+        return np.array(self.coarse.active[:2], dtype=float)*self.scale
+
+    def _pose(self):
+        x, y, th = self.fine.active
+        return ((self.origin[0] + x) % self.dim_xy,
+                (self.origin[1] + y) % self.dim_xy, th)
+
+    def _restart_fine(self, xy, th):
+        """a single fine packet at the window center, placed at xy"""
+        fine = self.fine
+        fine.cells[:] = 0
+        fine.cells[self.center, self.center, int(round(th)) % self.dim_th] = 1
+        fine.active = (self.center, self.center, th)
+        fine.quiet_steps = 0
+        self.origin = (xy - self.center) % self.dim_xy
+
+    def _recenter(self):
+        """move the window by whole cells so the pose is at its center"""
+        shift = np.round(np.array(self.fine.active[:2]) - self.center).astype(int)
+        if np.all(np.abs(shift) <= self.margin):
+            return
+        fine = self.fine
+        fine.cells = np.roll(fine.cells, (-shift[0], -shift[1]), axis=(0, 1))
+        # activity that wrapped around the window edge isn't in the window
+        n = fine.dim_xy
+        for axis, sh in enumerate(shift):
+            band = slice(n - sh, n) if sh > 0 else slice(0, -sh)
+            idx = [slice(None)]*3
+            idx[axis] = band
+            fine.cells[tuple(idx)] = 0
+        x, y, th = fine.active
+        fine.active = (x - shift[0], y - shift[1], th)
+        self.origin = (self.origin + shift) % self.dim_xy
+
+    def step(self, view_cell, vtrans, vrot):
+        '''Execute an interation of both networks.
+        :return: (x, y, th) of the pose, x and y in fine cells.
+        '''
+        self.coarse.step(
+            replace(view_cell, x_pc=view_cell.x_pc/self.scale,
+                    y_pc=view_cell.y_pc/self.scale),
+            vtrans/self.scale, vrot)
+
+        # inject into the fine window only if the cell's pose is inside it
+        local = (np.array([view_cell.x_pc, view_cell.y_pc]) - self.origin) % self.dim_xy
+        if np.all(local >= 1) and np.all(local < self.fine.dim_xy - 1):
+            fine_cell = replace(view_cell, x_pc=local[0], y_pc=local[1])
+        else:
+            fine_cell = replace(view_cell, first=True)
+        self.fine.step(fine_cell, vtrans, vrot)
+
+        pose = np.array(self._pose()[:2])
+        offset = _wrapped_offset(pose, self._coarse_xy(), self.dim_xy)
+        if np.any(np.abs(offset) > self.max_disagreement):
+            self._restart_fine(self._coarse_xy(), self.fine.active[2])
+            self.restarts += 1
+        else:
+            self._recenter()
+
+        self.active = self._pose()
+        return self.active
+
+
+@implements(proc=PoseCells, protocol=LoihiProtocol)
+@requires(CPU)
+class PyPoseCellsModel(PyLoihiProcessModel):
+    cell_in: PyInPort = LavaPyType(PyInPort.VEC_DENSE, float, precision=32)
+    vtrans_vrot_in: PyInPort = LavaPyType(PyInPort.VEC_DENSE, float, precision=32)
+
+    pose_out: PyOutPort = LavaPyType(PyOutPort.VEC_DENSE, float, precision=32)
+    packets_out: PyOutPort = LavaPyType(PyOutPort.VEC_DENSE, float, precision=32)
+
+    skipped_steps: int = LavaPyType(int, int, precision=32)
+
+    def __init__(self, proc_params):
+        super().__init__(proc_params=proc_params)
+        self.network = PoseCellNetwork.from_params(proc_params)
+        self.registry_name = proc_params.get('registry_name')
+        self.registry = None
+        self.started = False
+
+    def _stop(self):
+        if self.registry is not None:
+            self.registry.close()
+        super()._stop()
+
+    def post_guard(self):
+        return True
+
+    def run_post_mgmt(self):
+        """Post-Management phase: executed only when guard function above
+        returns True.
+        """
+        if not self.started:
+            # the view cells need a pose for the first frame
+            self.pose_out.send(np.array(self.network.active))
+            self.started = True
+
+        msg = self.cell_in.recv()
+        if self.registry is None and self.registry_name is not None:
+            # the view cells have created it by the time a message arrives
+            self.registry = TemplateRegistry.attach(self.registry_name)
+        view_cell = decode_cell(msg, self.registry)
+        vtrans, vrot = self.vtrans_vrot_in.recv()
 
+        active = self.network.step(view_cell, vtrans, vrot)
+        self.skipped_steps = self.network.skipped_steps
+        self.pose_out.send(np.array(active))
+        self.packets_out.send(self.network.packets)
@@ -0,0 +1,188 @@
+import glob
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from lava.magma.core.decorator import implements, requires, tag
+from lava.magma.core.model.py.model import PyLoihiProcessModel
+from lava.magma.core.model.py.ports import PyInPort
+from lava.magma.core.model.py.type import LavaPyType
+from lava.magma.core.process.ports.ports import InPort
+from lava.magma.core.process.process import AbstractProcess
+from lava.magma.core.resources import CPU
+from lava.magma.core.sync.protocols.loihi_protocol import LoihiProtocol
+
+from ratslam.view_cells import CELL_MSG_SIZE, TemplateRegistry, ViewCell, decode_cell
+
+# columns of a traffic log, with the width of one row of each
+COLUMNS = {
+    'vtrans_vrot': 2,   # odometry of the frame
+    'cell': CELL_MSG_SIZE,  # view cell message, see encode_cell
+    'first': 1,         # first flag of the view cell
+    'pose': 3,          # pose cell output after the frame
+}
+
+
+class TrafficRecorder:
+    """Writes the port messages of every frame to a columnar log.
+
+    The log is a directory of npz chunks of chunk_size frames, each holding
+    one array per column. The current chunk is rewritten by flush, so a run
+    that is killed loses at most the frames since the last flush. The
+    processes that record also flush at the end of the run and on stop.
+    """
+
+    def __init__(self, path: str, chunk_size: int = 4096) -> None:
+        os.makedirs(path, exist_ok=True)
+        for old in glob.glob(os.path.join(path, 'chunk_*.npz')):
+            os.remove(old)
+        self.path = path
+        self.chunk_size = chunk_size
+        self.chunk = 0
+        self.n_rows = 0
+        self.columns = {
+            name: np.zeros((chunk_size, width)) for name, width in COLUMNS.items()
+        }
+
+    def record(self, vtrans_vrot, cell_msg, first, pose) -> None:
+        row = self.n_rows
+        self.columns['vtrans_vrot'][row] = vtrans_vrot
+        self.columns['cell'][row] = cell_msg
+        self.columns['first'][row] = first
+        self.columns['pose'][row] = pose
+        self.n_rows += 1
+        if self.n_rows == self.chunk_size:
+            self.flush()
+            self.chunk += 1
+            self.n_rows = 0
+
+    def flush(self) -> None:
+        if self.n_rows == 0:
+            return
+        np.savez(os.path.join(self.path, f'chunk_{self.chunk:05d}.npz'),
+                 **{name: col[:self.n_rows] for name, col in self.columns.items()})
+
+
+class TrafficLog:
+    """The frames of a log written by TrafficRecorder, column by column."""
+
+    def __init__(self, columns: Dict[str, np.ndarray]) -> None:
+        self.vtrans_vrot = columns['vtrans_vrot']
+        self.cell = columns['cell']
+        self.first = columns['first'][:, 0].astype(bool)
+        self.pose = columns['pose']
+
+    @classmethod
+    def load(cls, path: str) -> "TrafficLog":
+        chunks = sorted(glob.glob(os.path.join(path, 'chunk_*.npz')))
+        if not chunks:
+            raise Exception(f"no traffic log in {path}")
+        parts = [np.load(c) for c in chunks]
+        return cls({name: np.concatenate([p[name] for p in parts]) for name in COLUMNS})
+
+    def __len__(self):
+        return len(self.pose)
+
+    def view_cell(self, k: int) -> ViewCell:
+        cell = decode_cell(self.cell[k])
+        cell.first = bool(self.first[k])
+        return cell
+
+
+def replay_pose_cells(log: TrafficLog, network) -> Tuple[np.ndarray, float]:
+    """
+    Drive a pose cell network (e.g. PoseCellNetwork) with the view cells and
+    odometry of the log.
+    return the (n, 3) poses it produced and the seconds per frame.
+    """
+    cells = [log.view_cell(k) for k in range(len(log))]
+    poses = np.zeros((len(log), 3))
+    start = time.perf_counter()
+    for k, cell in enumerate(cells):
+        vtrans, vrot = log.vtrans_vrot[k]
+        poses[k] = network.step(cell, vtrans, vrot)
+    return poses, (time.perf_counter() - start) / max(len(log), 1)
+
+
+def replay_experience_map(log: TrafficLog, graph) -> Tuple[np.ndarray, float]:
+    """
+    Drive an experience map (e.g. ExperienceGraph) with the view cells,
+    odometry and poses of the log.
+    return the (n,) current experience ids and the seconds per frame.
+    """
+    cells = [log.view_cell(k) for k in range(len(log))]
+    exp_ids = np.zeros(len(log), dtype=int)
+    start = time.perf_counter()
+    for k, cell in enumerate(cells):
+        vtrans, vrot = log.vtrans_vrot[k]
+        exp_ids[k] = graph.step(cell, vtrans, vrot, *log.pose[k]).current_id
+    return exp_ids, (time.perf_counter() - start) / max(len(log), 1)
+
+
+class Recorder(AbstractProcess):
+    def __init__(self, path: str, registry_name: Optional[str] = None,
+                 chunk_size: int = 4096, flush_every: int = 100) -> None:
+        """
+        Records the traffic of the distributed network to a TrafficRecorder
+        log. Connect view_cells.cell_out, visual_odometry.vtrans_vrot_out
+        and pose_cells.pose_out to it like to the experience map.
+
+        registry_name: ViewCells.registry_name, for the first flags. They
+            are read when the frame is recorded, if the recorder falls more
+            than a frame behind they can be a frame late. The fused RatSLAM
+            process (record_path) records them exactly.
+        flush_every: frames between rewrites of the current chunk.
+        """
+        super().__init__(path=path, registry_name=registry_name,
+                         chunk_size=chunk_size, flush_every=flush_every)
+        self.cell_in = InPort(shape=(CELL_MSG_SIZE,))
+        self.vtrans_vrot_in = InPort(shape=(2,))
+        self.pose_in = InPort(shape=(3,))
+
+
+@implements(proc=Recorder, protocol=LoihiProtocol)
+@requires(CPU)
+class PyRecorderModel(PyLoihiProcessModel):
+    cell_in: PyInPort = LavaPyType(PyInPort.VEC_DENSE, float, precision=32)
+    vtrans_vrot_in: PyInPort = LavaPyType(PyInPort.VEC_DENSE, float, precision=32)
+    pose_in: PyInPort = LavaPyType(PyInPort.VEC_DENSE, float, precision=32)
+
+    def __init__(self, proc_params):
+        super().__init__(proc_params=proc_params)
+        self.recorder = TrafficRecorder(proc_params['path'],
+                                        proc_params.get('chunk_size', 4096))
+        self.flush_every = proc_params.get('flush_every', 100)
+        self.registry_name = proc_params.get('registry_name')
+        self.registry = None
+        self.started = False
+        self.n_frames = 0
+
+    def _stop(self):
+        # the frames since the last flush_every are still buffered
+        self.recorder.flush()
+        if self.registry is not None:
+            self.registry.close()
+        super()._stop()
+
+    def post_guard(self):
+        return True
+
+    def run_post_mgmt(self):
+        """Post-Management phase: executed only when guard function above
+        returns True.
+        """
+        if not self.started:
+            # the initial pose the pose cells send to the view cells
+            self.pose_in.recv()
+            self.started = True
+
+        msg = self.cell_in.recv()
+        if self.registry is None and self.registry_name is not None:
+            self.registry = TemplateRegistry.attach(self.registry_name)
+        first = decode_cell(msg, self.registry).first
+        self.recorder.record(self.vtrans_vrot_in.recv(), msg, first, self.pose_in.recv())
+
+        self.n_frames += 1
+        if self.n_frames % self.flush_every == 0:
+            self.recorder.flush()
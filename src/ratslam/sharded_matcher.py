@@ -0,0 +1,180 @@
+"""
+View cell templates sharded across worker processes.
+
+The shards are static: a template is placed on the shard with the fewest
+templates when it is added and stays there. Templates are only ever
+added, never removed, and the number of workers is fixed, so this keeps
+the shards within one template of each other and nothing has to be moved
+between them. Rebalancing would only be needed to add or remove workers
+during a run, which is not supported.
+"""
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from ratslam.kernels import compare_segments_many
+from ratslam.util import ShiftCache
+
+
+def _attach(name, capacity, width):
+    shm = shared_memory.SharedMemory(name=name)
+    rows = np.ndarray((capacity, width), dtype=np.float64, buffer=shm.buf)
+    return shm, rows
+
+
+def _shard_worker(conn, query_name, width):
+    """Matches the query profile against the templates of one shard.
+
+    Commands from the parent:
+      ('attach', shm name, capacity)  switch to a (grown) shard buffer
+      ('match', n_rows, length)       compare the query with rows[:n_rows]
+      ('stop',)
+    """
+    query_shm = shared_memory.SharedMemory(name=query_name)
+    query = np.ndarray((width,), dtype=np.float64, buffer=query_shm.buf)
+    shm, rows = None, None
+    try:
+        while True:
+            cmd = conn.recv()
+            if cmd[0] == 'attach':
+                if shm is not None:
+                    del rows
+                    shm.close()
+                shm, rows = _attach(cmd[1], cmd[2], width)
+                conn.send(True)
+            elif cmd[0] == 'match':
+                n_rows, length = cmd[1], cmd[2]
+                if n_rows == 0:
+                    conn.send((-1, 0, np.inf))
+                    continue
+                offsets, dists = compare_segments_many(query, rows[:n_rows], length)
+                k = int(np.argmin(dists))
+                conn.send((k, int(offsets[k]), float(dists[k])))
+            else:
+                break
+    finally:
+        del query
+        query_shm.close()
+        if shm is not None:
+            del rows
+            shm.close()
+
+
+class _Shard:
+    def __init__(self, ctx, query_name, width, capacity):
+        self.width = width
+        self.ids = []
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_shard_worker, args=(child, query_name, width), daemon=True)
+        self.process.start()
+        self.shm, self.rows = None, None
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        shm = shared_memory.SharedMemory(create=True, size=capacity * self.width * 8)
+        rows = np.ndarray((capacity, self.width), dtype=np.float64, buffer=shm.buf)
+        if self.shm is not None:
+            rows[:len(self.ids)] = self.rows[:len(self.ids)]
+        self.conn.send(('attach', shm.name, capacity))
+        self.conn.recv()
+        if self.shm is not None:
+            del self.rows
+            self.shm.close()
+            self.shm.unlink()
+        self.shm, self.rows = shm, rows
+
+    def add(self, tid, profile):
+        if len(self.ids) == len(self.rows):
+            self._allocate(2 * len(self.rows))
+        self.rows[len(self.ids)] = profile
+        self.ids.append(tid)
+
+    def close(self):
+        if self.process.is_alive():
+            self.conn.send(('stop',))
+            self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.conn.close()
+        del self.rows
+        self.shm.close()
+        self.shm.unlink()
+
+
+class ShardedTemplateMatcher:
+    """View cell templates partitioned across worker processes.
+
+    Each worker holds its shard of full resolution float64 profiles in shared
+    memory. To match a frame, its profile is written once into a shared query
+    buffer, every worker searches its own shard, and the per-shard best
+    matches are reduced to the global best. New templates go to the shard
+    with the fewest templates, so shards stay balanced as the map grows.
+    Templates are never moved between shards afterwards, see above.
+
+    It has the same add/match/close interface as TemplateStore, without
+    quantization or a cold tier. close stops the workers and unlinks the
+    shared memory, it must be called at the end of a run.
+    """
+
+    def __init__(self, width: int, workers: int = 4, capacity: int = 256) -> None:
+        self.width = width
+        ctx = mp.get_context()
+        self.query_shm = shared_memory.SharedMemory(create=True, size=width * 8)
+        self.query = np.ndarray((width,), dtype=np.float64, buffer=self.query_shm.buf)
+        self.shards: List[_Shard] = [
+            _Shard(ctx, self.query_shm.name, width, capacity) for _ in range(workers)
+        ]
+        self.n_templates = 0
+
+    def __len__(self):
+        return self.n_templates
+
+    def add(self, profile: np.ndarray) -> int:
+        tid = self.n_templates
+        shard = min(self.shards, key=lambda s: len(s.ids))
+        shard.add(tid, profile)
+        self.n_templates += 1
+        return tid
+
+    def match(self, profile: np.ndarray, length: int, threshold: float = np.inf,
+              cache: Optional[ShiftCache] = None) -> Tuple[int, int, float]:
+        """Find the template closest to profile with compare_segments.
+        :param cache: a ShiftCache, like for TemplateStore.match.
+        :return: template id, offset and distance, id is -1 without templates.
+        """
+        frame_key = (cache.key(profile), len(self)) if cache is not None else None
+        hit = cache.get(*frame_key) if cache is not None else None
+        if hit is not None:
+            return hit
+        result = self._search(profile, length)
+        if cache is not None:
+            cache.put(*frame_key, result)
+        return result
+
+    def _search(self, profile, length):
+        self.query[:] = profile
+        for shard in self.shards:
+            shard.conn.send(('match', len(shard.ids), length))
+
+        best_id, best_offset, best_dist = -1, 0, np.inf
+        for shard in self.shards:
+            k, offset, dist = shard.conn.recv()
+            # ties go to the older template, like a single sequential search
+            if k >= 0 and (dist < best_dist or (dist == best_dist and shard.ids[k] < best_id)):
+                best_id, best_offset, best_dist = shard.ids[k], offset, dist
+        return best_id, best_offset, best_dist
+
+    def close(self) -> None:
+        if self.query_shm is None:
+            return
+        for shard in self.shards:
+            shard.close()
+        self.shards = []
+        del self.query
+        self.query_shm.close()
+        self.query_shm.unlink()
+        self.query_shm = None
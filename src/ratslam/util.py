@@ -1,26 +1,108 @@
-import numpy as np
 import cmath
+from collections import OrderedDict, deque
+
+import numpy as np
 
-# used by visual_odometry, view_cells
-def compare_segments(seg1, seg2, length):
+# compare_segments (used by view_cells) and shift_distances (used by
+# visual_odometry) live in kernels so they can be compiled
+from ratslam.kernels import compare_segments, shift_distances
+
+def compare_shifts(seg1, seg2, max_shift):
     """
-    find contiguous subsegments, one from seg1 and one from seg2, 
-    with smallest l1 distance. return their offset.
+    exhaustive search for the shift in [-max_shift, max_shift] that best
+    aligns seg1 with seg2. return the shift and its distance.
+    the shift has the sign of compare_segments' offset: seg2[i+shift]
+    matches seg1[i].
     """
-    # brute force
-    # best_dist = np.sum(np.abs(seg1[:length]-seg2[:length]))
-    best_dist=99999999
-    best_offset = -1
-
-    for i in range(0,len(seg1)-length):
-        # for j in range(0,len(seg2)-length):
-        j= len(seg2)-length-2-i
-        dist = np.sum(np.abs(seg1[i:][:length]-seg2[j:][:length]))
-        if dist < best_dist:
-            best_dist = dist
-            best_offset = j-i
-    
-    return best_offset, best_dist
+    shifts = np.arange(-max_shift, max_shift+1)
+    dists = shift_distances(seg2, seg1, shifts)
+    best = np.argmin(dists)
+    return int(shifts[best]), dists[best]
+
+def downsample(seg, factor=2):
+    """mean-pool a 1d segment, dropping the remainder"""
+    n = len(seg) // factor
+    return seg[:n*factor].reshape(n, factor).mean(axis=1)
+
+def compare_shifts_pyramid(seg1, seg2, max_shift, levels=3, window=2, subpixel=False):
+    """
+    coarse-to-fine version of compare_shifts. the shift is searched
+    exhaustively on segments downsampled 2**(levels-1) times, then refined
+    within +-window at every finer level. with subpixel=True a parabola is
+    fitted through the distances around the best full resolution shift.
+    """
+    pyr1, pyr2 = [seg1], [seg2]
+    for _ in range(levels-1):
+        if len(pyr1[-1]) < 4 * window:
+            break
+        pyr1.append(downsample(pyr1[-1]))
+        pyr2.append(downsample(pyr2[-1]))
+
+    top = len(pyr1) - 1
+    limit = -(-max_shift // 2**top)
+    best, _ = compare_shifts(pyr1[top], pyr2[top], limit)
+
+    for level in range(top-1, -1, -1):
+        limit = -(-max_shift // 2**level)
+        center = 2 * best
+        shifts = np.arange(max(center-window, -limit), min(center+window, limit)+1)
+        dists = shift_distances(pyr2[level], pyr1[level], shifts)
+        best = int(shifts[np.argmin(dists)])
+
+    if not subpixel:
+        return best, shift_distances(seg2, seg1, [best])[0]
+
+    d_prev, dist, d_next = shift_distances(seg2, seg1, [best-1, best, best+1])
+    denom = d_prev - 2*dist + d_next
+    if denom <= 0 or abs(best) == max_shift:
+        return float(best), dist
+    delta = np.clip(0.5 * (d_prev - d_next) / denom, -0.5, 0.5)
+    return best + delta, dist
+
+class ShiftCache:
+    """
+    bounded LRU cache of shift comparison results, keyed on a frame and
+    what it was compared with: the previous frame, or the number of
+    templates of the TemplateStore it was matched against.
+
+    a frame takes the key of a recently keyed frame if no column differs
+    from it by more than `tolerance` times the mean column value, so the
+    nearly identical frames of a stationary camera share cache entries.
+    otherwise the key is a hash of the profile quantized to that tolerance.
+    """
+
+    def __init__(self, maxsize=4096, tolerance=0.01, recent=8):
+        self.maxsize = maxsize
+        self.tolerance = tolerance
+        self.entries = OrderedDict()
+        self.recent = deque(maxlen=recent)
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, profile):
+        profile = profile * (len(profile) / np.sum(profile))
+        for seen, k in self.recent:
+            if np.max(np.abs(profile - seen)) <= self.tolerance:
+                return k
+        k = hash(np.round(profile / self.tolerance).astype(np.int64).tobytes())
+        self.recent.append((profile, k))
+        return k
+
+    def get(self, frame_key, other):
+        """return the cached (offset, dist), or None"""
+        value = self.entries.get((frame_key, other))
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end((frame_key, other))
+        self.hits += 1
+        return value
+
+    def put(self, frame_key, other, value):
+        self.entries[(frame_key, other)] = value
+        self.entries.move_to_end((frame_key, other))
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
 
 def wrapped_avg_idx(arr):
     n = len(arr)
@@ -1,6 +1,10 @@
 
+import os
+import tempfile
+import uuid
 from dataclasses import dataclass
-from typing import List, Tuple
+from multiprocessing import shared_memory
+from typing import List, Optional, Tuple
 
 import numpy as np
 from lava.magma.core.decorator import implements, requires, tag
@@ -9,66 +13,463 @@ from lava.magma.core.model.py.ports import PyInPort, PyOutPort
 from lava.magma.core.model.py.type import LavaPyType
 from lava.magma.core.process.ports.ports import InPort, OutPort
 from lava.magma.core.process.process import AbstractProcess
+from lava.magma.core.process.variable import Var
 from lava.magma.core.resources import CPU
 from lava.magma.core.sync.protocols.loihi_protocol import LoihiProtocol
 
-from ratslam.util import compare_segments
+from ratslam.frozen_map import FrozenMap
+from ratslam.kernels import compare_segments_many
+from ratslam.sharded_matcher import ShardedTemplateMatcher
+from ratslam.util import ShiftCache, compare_segments, downsample
 
 
-@dataclass
+@dataclass(eq=False)
 class ViewCell:
-    img_1d: np.ndarray
+    id: int
     x_pc: float
     y_pc: float
     th_pc: float
     decay: float
+    # false once the cell is recognized again after other cells
+    first: bool = True
+
+
+# cell_out message: template id, 1 if the template is new, the pose the cell
+# was created at and its decay
+CELL_MSG_SIZE = 6
+# template id of frames that match no template in localization mode
+UNMATCHED = -1
+
+
+def encode_cell(cell: ViewCell, new: bool) -> np.ndarray:
+    return np.array([cell.id, float(new), cell.x_pc, cell.y_pc, cell.th_pc, cell.decay])
+
+
+def decode_cell(msg: np.ndarray, registry: Optional["TemplateRegistry"] = None) -> ViewCell:
+    """The ViewCell of a cell_out message. The first flag isn't in the
+    message, it is read from the registry, or taken to be the new flag
+    without one. UNMATCHED cells are always first, they inject nothing."""
+    tid = int(msg[0])
+    if tid == UNMATCHED:
+        first = True
+    else:
+        first = registry.first(tid) if registry is not None else bool(msg[1])
+    return ViewCell(tid, x_pc=msg[2], y_pc=msg[3], th_pc=msg[4], decay=msg[5],
+                    first=first)
+
+
+class TemplateRegistry:
+    """View cell records by template id, in shared memory.
+
+    The view cells process is the only writer, the pose cells and anything
+    else that gets template ids over a port attach to it by name and read
+    the records, so ViewCell objects never have to cross a port. The header
+    holds the number of templates and the capacity, followed by one (x_pc,
+    y_pc, th_pc, decay, first) row per template.
+    """
+
+    ROW = 5
+
+    def __init__(self, shm: shared_memory.SharedMemory, capacity: int, owner: bool) -> None:
+        self.shm = shm
+        self.capacity = capacity
+        self.owner = owner
+        self.header = np.ndarray((2,), dtype=np.int64, buffer=shm.buf)
+        self.rows = np.ndarray((capacity, self.ROW), dtype=np.float64,
+                               buffer=shm.buf, offset=self.header.nbytes)
+
+    @classmethod
+    def nbytes(cls, capacity: int) -> int:
+        return 16 + capacity * cls.ROW * 8
+
+    @classmethod
+    def create(cls, name: Optional[str] = None, capacity: int = 65536) -> "TemplateRegistry":
+        shm = shared_memory.SharedMemory(name=name, create=True, size=cls.nbytes(capacity))
+        registry = cls(shm, capacity, owner=True)
+        registry.header[:] = 0, capacity
+        return registry
+
+    @classmethod
+    def attach(cls, name: str) -> "TemplateRegistry":
+        shm = shared_memory.SharedMemory(name=name)
+        capacity = int(np.ndarray((2,), dtype=np.int64, buffer=shm.buf)[1])
+        return cls(shm, capacity, owner=False)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def __len__(self):
+        return int(self.header[0])
+
+    def put(self, cell: ViewCell) -> None:
+        if cell.id >= self.capacity:
+            raise Exception(f"template registry is full ({self.capacity} templates)")
+        self.rows[cell.id] = cell.x_pc, cell.y_pc, cell.th_pc, cell.decay, cell.first
+        # publish the count after the row
+        self.header[0] = max(len(self), cell.id + 1)
+
+    def first(self, tid: int) -> bool:
+        return bool(self.rows[tid, 4])
+
+    def get(self, tid: int) -> ViewCell:
+        if tid >= len(self):
+            raise Exception(f"unknown template {tid}")
+        x_pc, y_pc, th_pc, decay, first = self.rows[tid]
+        return ViewCell(tid, x_pc, y_pc, th_pc, decay, bool(first))
+
+    def close(self) -> None:
+        del self.header, self.rows
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class TemplateStore:
+    """Compact storage for view cell templates.
+
+    Profiles are kept downsampled and quantized: 'float64' stores them as
+    they are, 'float16' halves the size again and 'uint8' stores each profile
+    as bytes with its own scale. Templates that weren't matched for
+    `cold_after` frames are moved to a memory-mapped cold tier on disk. The
+    cold tier is only searched when no hot template is within the match
+    threshold, and a cold template that matches moves back to the hot tier.
+
+    width: number of columns of the full resolution profiles
+    """
+
+    DTYPES = {'float64': np.float64, 'float16': np.float16, 'uint8': np.uint8}
+
+    def __init__(self, width: int, dtype: str = 'float64', downsample: int = 1,
+                 cold_after: int = 0, cold_path: Optional[str] = None,
+                 capacity: int = 256) -> None:
+        if dtype not in self.DTYPES:
+            raise Exception(f"unknown template dtype {dtype}, use one of {list(self.DTYPES)}")
+        self.width = width
+        self.dtype = self.DTYPES[dtype]
+        self.downsample = downsample
+        self.n_cols = width // downsample
+        self.cold_after = cold_after
+
+        # hot tier: rows [0, n_hot) are in use
+        self.hot = np.zeros((capacity, self.n_cols), dtype=self.dtype)
+        self.hot_scale = np.ones(capacity)
+        self.hot_ids = np.zeros(capacity, dtype=int)
+        self.n_hot = 0
+
+        # cold tier: rows [0, n_cold_rows) have been used, cold_ids of -1
+        # mark free rows, which are in cold_free to be used again
+        self.cold_path = cold_path
+        # a temporary file is deleted on close, a given cold_path is kept
+        self.cold_temp = False
+        self.cold = None
+        self.cold_scale = np.ones(0)
+        self.cold_ids = np.zeros(0, dtype=int)
+        self.cold_free = []
+        self.n_cold_rows = 0
+
+        # per template id: tier (0 hot, 1 cold), row in the tier, last match
+        self.tier = np.zeros(capacity, dtype=np.int8)
+        self.row = np.zeros(capacity, dtype=int)
+        self.last_match = np.zeros(capacity, dtype=int)
+        self.n_templates = 0
+        self.step = 0
+
+    def __len__(self):
+        return self.n_templates
+
+    def profiles(self) -> np.ndarray:
+        """The decoded profiles of all templates, by template id."""
+        out = np.zeros((len(self), self.n_cols))
+        for tier, rows, scales in ((0, self.hot, self.hot_scale),
+                                   (1, self.cold, self.cold_scale)):
+            ids = np.flatnonzero(self.tier[:len(self)] == tier)
+            if len(ids) > 0:
+                r = self.row[ids]
+                out[ids] = self.decode(np.asarray(rows[r]), scales[r])
+        return out
+
+    @property
+    def nbytes(self):
+        """Memory held by the hot tier profiles."""
+        return self.n_hot * self.hot.itemsize * self.n_cols
+
+    def encode(self, profile: np.ndarray) -> Tuple[np.ndarray, float]:
+        """Downsample and quantize a profile, return the row and its scale."""
+        small = downsample(profile, self.downsample) if self.downsample > 1 else profile
+        small = small / np.sum(small)
+        if self.dtype == np.uint8:
+            scale = max(np.max(small), 1e-12) / 255.
+            return np.round(small / scale).astype(np.uint8), scale
+        return small.astype(self.dtype), 1.0
+
+    @staticmethod
+    def decode(rows: np.ndarray, scales: np.ndarray) -> np.ndarray:
+        out = rows.astype(np.float64, copy=False)
+        if rows.dtype == np.uint8:
+            out = out * scales[:, None]
+        return out
+
+    def add(self, profile: np.ndarray) -> int:
+        """Store a new template in the hot tier and return its id."""
+        row, scale = self.encode(profile)
+        tid = self.n_templates
+        if tid == len(self.tier):
+            self.tier = np.concatenate([self.tier, np.zeros_like(self.tier)])
+            self.row = np.concatenate([self.row, np.zeros_like(self.row)])
+            self.last_match = np.concatenate([self.last_match, np.zeros_like(self.last_match)])
+        self.last_match[tid] = self.step
+        self.n_templates += 1
+        self._put_hot(tid, row, scale)
+        return tid
+
+    def match(self, profile: np.ndarray, length: int, threshold: float = np.inf,
+              cache: Optional[ShiftCache] = None) -> Tuple[int, int, float]:
+        """Find the template closest to profile with compare_segments.
+        :param length: compare_segments length at full resolution.
+        :param threshold: the cold tier is searched when no hot template is
+            closer than this.
+        :param cache: the result for a frame already matched against the
+            same number of templates is taken from here without matching.
+        :return: template id, offset and distance, id is -1 without templates.
+        """
+        self.step += 1
+        # keyed on the number of templates too, adding one invalidates it
+        frame_key = (cache.key(profile), len(self)) if cache is not None else None
+        hit = cache.get(*frame_key) if cache is not None else None
+        if hit is not None:
+            best_id, best_offset, best_dist = hit
+            if best_id >= 0 and self.tier[best_id] == 1:
+                self._promote(best_id)
+        else:
+            best_id, best_offset, best_dist = self._search(profile, length, threshold)
+            if cache is not None:
+                cache.put(*frame_key, (best_id, best_offset, best_dist))
+
+        if best_id >= 0:
+            self.last_match[best_id] = self.step
+        self._spill()
+        return best_id, best_offset, best_dist
+
+    def _search(self, profile, length, threshold):
+        row, scale = self.encode(profile)
+        query = self.decode(row[None], np.array([scale]))[0]
+        length = max(length // self.downsample, 1)
+
+        best_id, best_offset, best_dist = -1, 0, np.inf
+        if self.n_hot > 0:
+            ids = self.hot_ids[:self.n_hot]
+            offsets, dists = compare_segments_many(
+                query, self.decode(self.hot[:self.n_hot], self.hot_scale[:self.n_hot]), length)
+            k = np.argmin(dists)
+            best_id, best_offset, best_dist = ids[k], offsets[k], dists[k]
+
+        if best_dist >= threshold and self.n_cold_rows > 0:
+            live = np.flatnonzero(self.cold_ids[:self.n_cold_rows] >= 0)
+            if len(live) > 0:
+                offsets, dists = compare_segments_many(
+                    query, self.decode(self.cold[live], self.cold_scale[live]), length)
+                k = np.argmin(dists)
+                if dists[k] < best_dist:
+                    best_id = self.cold_ids[live[k]]
+                    best_offset, best_dist = offsets[k], dists[k]
+                    self._promote(best_id)
+        return int(best_id), int(best_offset) * self.downsample, float(best_dist)
+
+    def _put_hot(self, tid, row, scale):
+        if self.n_hot == len(self.hot):
+            self.hot = np.concatenate([self.hot, np.zeros_like(self.hot)])
+            self.hot_scale = np.concatenate([self.hot_scale, np.ones(len(self.hot_scale))])
+            self.hot_ids = np.concatenate([self.hot_ids, np.zeros_like(self.hot_ids)])
+        r = self.n_hot
+        self.hot[r], self.hot_scale[r], self.hot_ids[r] = row, scale, tid
+        self.tier[tid], self.row[tid] = 0, r
+        self.n_hot += 1
+
+    def _remove_hot(self, r):
+        # move the last hot row into the hole
+        last = self.n_hot - 1
+        if r != last:
+            self.hot[r] = self.hot[last]
+            self.hot_scale[r] = self.hot_scale[last]
+            self.hot_ids[r] = self.hot_ids[last]
+            self.row[self.hot_ids[r]] = r
+        self.n_hot -= 1
+
+    def _promote(self, tid):
+        r = self.row[tid]
+        self._put_hot(tid, np.array(self.cold[r]), self.cold_scale[r])
+        self.cold_ids[r] = -1
+        self.cold_free.append(r)
+
+    def _spill(self):
+        if self.cold_after <= 0 or self.n_hot == 0:
+            return
+        ids = self.hot_ids[:self.n_hot]
+        stale = ids[self.step - self.last_match[ids] > self.cold_after]
+        for tid in stale:
+            r = self.row[tid]
+            row, scale = self.hot[r].copy(), self.hot_scale[r]
+            self._remove_hot(r)
+            self._put_cold(tid, row, scale)
+
+    def _put_cold(self, tid, row, scale):
+        if self.cold_free:
+            r = self.cold_free.pop()
+        else:
+            if self.cold is None or self.n_cold_rows == len(self.cold):
+                self._grow_cold()
+            r = self.n_cold_rows
+            self.n_cold_rows += 1
+        self.cold[r], self.cold_scale[r], self.cold_ids[r] = row, scale, tid
+        self.tier[tid], self.row[tid] = 1, r
+
+    def _grow_cold(self):
+        capacity = max(2 * len(self.cold_ids), len(self.hot))
+        if self.cold_path is None:
+            fd, self.cold_path = tempfile.mkstemp(suffix='.templates')
+            os.close(fd)
+            self.cold_temp = True
+        if self.cold is not None:
+            self.cold.flush()
+            del self.cold
+        with open(self.cold_path, 'ab') as f:
+            f.truncate(capacity * self.n_cols * np.dtype(self.dtype).itemsize)
+        self.cold = np.memmap(self.cold_path, dtype=self.dtype, mode='r+',
+                              shape=(capacity, self.n_cols))
+        self.cold_scale = np.concatenate([self.cold_scale, np.ones(capacity - len(self.cold_scale))])
+        self.cold_ids = np.concatenate([self.cold_ids, -np.ones(capacity - len(self.cold_ids), dtype=int)])
+
+    def close(self) -> None:
+        """Release the cold tier, deleting its file if it is a temporary one."""
+        if self.cold is not None:
+            self.cold.flush()
+            self.cold = None
+        if self.cold_temp:
+            os.remove(self.cold_path)
+            self.cold_temp = False
 
 
 class ViewCells(AbstractProcess):
-    def __init__(self, image_shape: Tuple[int, int]) -> None:
-        super().__init__()
+    def __init__(self, image_shape: Tuple[int, int], template_dtype: str = 'float64',
+                 template_downsample: int = 1, cold_after: int = 0,
+                 cold_path: Optional[str] = None, match_workers: int = 0,
+                 cache_size: int = 0, cache_tolerance: float = 0.01,
+                 registry_name: Optional[str] = None,
+                 registry_capacity: int = 65536,
+                 map_path: Optional[str] = None) -> None:
+        """
+        template_dtype, template_downsample, cold_after, cold_path: how
+            templates are stored, see TemplateStore.
+        match_workers: if > 0, templates are sharded across this many worker
+            processes with ShardedTemplateMatcher instead, for very large
+            template sets. The storage options above don't apply then.
+        cache_size: if > 0, the match result of each frame is memoized in an
+            LRU ShiftCache of this many entries until a template is added, so
+            near-duplicate frames (equal within cache_tolerance of the mean
+            column value) skip matching.
+        registry_name: shared memory name of the TemplateRegistry the cells
+            are published in, a fresh one by default. Pass registry_name to
+            the PoseCells reading cell_out.
+        map_path: a map saved with save_map. If given, frames are only
+            recognized against its templates (ViewCellLocalizer), frames that
+            match none are sent as UNMATCHED and counted in unmatched_frames.
+        """
+        if registry_name is None:
+            registry_name = f"ratslam_vt_{uuid.uuid4().hex[:12]}"
+        self.registry_name = registry_name
+        super().__init__(template_dtype=template_dtype,
+                         template_downsample=template_downsample,
+                         cold_after=cold_after, cold_path=cold_path,
+                         match_workers=match_workers, cache_size=cache_size,
+                         cache_tolerance=cache_tolerance,
+                         registry_name=registry_name,
+                         registry_capacity=registry_capacity,
+                         map_path=map_path)
         self.img_in = InPort(shape=image_shape)
         self.pose_in = InPort(shape=(3,))
 
-        self.cell_out = OutPort(shape=(4,))
+        # see encode_cell
+        self.cell_out = OutPort(shape=(CELL_MSG_SIZE,))
 
+        self.cache_hits = Var(shape=(1,), init=0)
+        self.cache_misses = Var(shape=(1,), init=0)
+        self.unmatched_frames = Var(shape=(1,), init=0)
 
-@implements(proc=ViewCells, protocol=LoihiProtocol)
-@requires(CPU)
-class PyViewCellsModel(PyLoihiProcessModel):
-    img_in: PyInPort = LavaPyType(PyInPort.VEC_DENSE, int, precision=32)
-    pose_in: PyInPort = LavaPyType(PyInPort.VEC_DENSE, float, precision=32)
 
-    cell_out: PyOutPort = LavaPyType(PyOutPort.VEC_DENSE, float, precision=32)
+class ViewCellMatcher:
+    """
+    Recognizes frames as view cells, the computation of PyViewCellsModel
+    without the ports, so the fused pipeline can run it too. Takes the same
+    options as ViewCells.
+    """
 
-    cells = []
+    MATCH_THRESHOLD = .3 # 0.054
+    ACTIVE_DECAY = 1.0
+    SHIFT_MATCH = 25
 
-    def __init__(self, proc_params):
-        super().__init__(proc_params=proc_params)
+    def __init__(self, template_dtype: str = 'float64', template_downsample: int = 1,
+                 cold_after: int = 0, cold_path: Optional[str] = None,
+                 match_workers: int = 0, cache_size: int = 0,
+                 cache_tolerance: float = 0.01) -> None:
+        self.cells: List[ViewCell] = []
+        self.prev_cell = None
+        self.new_cell = False
+        self.templates = None
+        self.match_workers = match_workers
+        self.cache = None
+        if cache_size > 0:
+            self.cache = ShiftCache(cache_size, cache_tolerance)
+        self.template_params = dict(
+            dtype=template_dtype,
+            downsample=template_downsample,
+            cold_after=cold_after,
+            cold_path=cold_path
+        )
 
-    def post_guard(self):
-        return self.img_in.probe() and self.pose_in.probe()
+    @classmethod
+    def from_params(cls, params):
+        if params.get('map_path') is not None:
+            return ViewCellLocalizer(FrozenMap(params['map_path']))
+        return cls(
+            template_dtype=params.get('template_dtype', 'float64'),
+            template_downsample=params.get('template_downsample', 1),
+            cold_after=params.get('cold_after', 0),
+            cold_path=params.get('cold_path'),
+            match_workers=params.get('match_workers', 0),
+            cache_size=params.get('cache_size', 0),
+            cache_tolerance=params.get('cache_tolerance', 0.01)
+        )
 
-    def run_post_mgmt(self):
-        """Post-Management phase: executed only when guard function above
-        returns True.
-        """
-        VT_MATCH_THRESHOLD = .3 # 0.054
-        VT_ACTIVE_DECAY = 1.0
+    def close(self) -> None:
+        """Release the template storage, at the end of a run."""
+        if self.templates is not None:
+            self.templates.close()
+            self.templates = None
+
+    def step(self, img: np.ndarray, pose: np.ndarray) -> ViewCell:
+        """The view cell of img, a new one at pose if no template is close."""
+        VT_MATCH_THRESHOLD = self.MATCH_THRESHOLD
+        VT_ACTIVE_DECAY = self.ACTIVE_DECAY
+        VT_SHIFT_MATCH = self.SHIFT_MATCH
 
-        img = self.img_in.recv()
         img_1d = create_template(img)
-        pose = self.pose_in.recv()
 
-        cell_similarities = np.zeros(len(self.cells))
-        for idx, cell in enumerate(self.cells):
-            cell_similarities[idx] = get_similarity(img_1d, cell.img_1d)
-        # if len(self.cells) != 0:
-        #     print(np.min(cell_similarities)*img_1d.size)
+        if self.templates is None and self.match_workers > 0:
+            self.templates = ShardedTemplateMatcher(img_1d.size, self.match_workers)
+        elif self.templates is None:
+            self.templates = TemplateStore(img_1d.size, **self.template_params)
+
+        i, _, dist = self.templates.match(
+            img_1d, VT_SHIFT_MATCH, threshold=VT_MATCH_THRESHOLD/img_1d.size,
+            cache=self.cache)
+        # if i >= 0:
+        #     print(dist*img_1d.size)
 
-        if len(self.cells) == 0 or np.min(cell_similarities)*img_1d.size > VT_MATCH_THRESHOLD:
+        self.new_cell = i < 0 or dist*img_1d.size > VT_MATCH_THRESHOLD
+        if self.new_cell:
             new_cell = ViewCell(
-                img_1d,
+                self.templates.add(img_1d),
                 x_pc=pose[0],
                 y_pc=pose[1],
                 th_pc=pose[2],
@@ -76,18 +477,113 @@ class PyViewCellsModel(PyLoihiProcessModel):
             )
             self.cells.append(new_cell)
             self.prev_cell = new_cell
-            print("new cell")
             return new_cell
 
-        i = np.argmin(cell_similarities)
         cell = self.cells[i]
         cell.decay += VT_ACTIVE_DECAY
+        if cell is not self.prev_cell:
+            cell.first = False
 
-        print("old cell")
         self.prev_cell = cell
         return cell
 
 
+class ViewCellLocalizer:
+    """
+    Recognizes frames against the templates of a FrozenMap, the view cells
+    of localization mode. No template is ever added: frames that match none
+    give an UNMATCHED cell and are counted in unmatched. The search is one
+    compare_segments_many over the prebuilt template matrix, so its cost is
+    the same on every frame. Only the decay and first flags of the cells
+    are kept per localizer.
+    """
+
+    def __init__(self, frozen: FrozenMap) -> None:
+        self.map = frozen
+        # encodes queries like the TemplateStore the map was built with
+        self.encoder = TemplateStore(frozen.width, frozen.template_dtype,
+                                     frozen.template_downsample, capacity=1)
+        self.decay = np.full(len(frozen), ViewCellMatcher.ACTIVE_DECAY)
+        self.first = np.ones(len(frozen), dtype=bool)
+        self.prev_id = UNMATCHED
+        self.new_cell = False
+        self.unmatched = 0
+        self.cache = None
+
+    def close(self) -> None:
+        pass
+
+    def step(self, img: np.ndarray, pose: np.ndarray) -> ViewCell:
+        """The view cell of img, UNMATCHED if no template is close."""
+        img_1d = create_template(img)
+        row, scale = self.encoder.encode(img_1d)
+        query = TemplateStore.decode(row[None], np.array([scale]))[0]
+        length = max(ViewCellMatcher.SHIFT_MATCH // self.encoder.downsample, 1)
+
+        i, dist = UNMATCHED, np.inf
+        if len(self.map) > 0:
+            _, dists = compare_segments_many(query, self.map.templates, length)
+            i = int(np.argmin(dists))
+            dist = dists[i]
+        if dist*img_1d.size > ViewCellMatcher.MATCH_THRESHOLD:
+            self.unmatched += 1
+            self.prev_id = UNMATCHED
+            return ViewCell(UNMATCHED, 0., 0., 0., 0.)
+
+        self.decay[i] += ViewCellMatcher.ACTIVE_DECAY
+        if i != self.prev_id:
+            self.first[i] = False
+        self.prev_id = i
+        x_pc, y_pc, th_pc = self.map.cells[i]
+        return ViewCell(i, x_pc, y_pc, th_pc, self.decay[i], bool(self.first[i]))
+
+
+@implements(proc=ViewCells, protocol=LoihiProtocol)
+@requires(CPU)
+class PyViewCellsModel(PyLoihiProcessModel):
+    img_in: PyInPort = LavaPyType(PyInPort.VEC_DENSE, int, precision=32)
+    pose_in: PyInPort = LavaPyType(PyInPort.VEC_DENSE, float, precision=32)
+
+    cell_out: PyOutPort = LavaPyType(PyOutPort.VEC_DENSE, float, precision=32)
+
+    cache_hits: int = LavaPyType(int, int, precision=32)
+    cache_misses: int = LavaPyType(int, int, precision=32)
+    unmatched_frames: int = LavaPyType(int, int, precision=32)
+
+    def __init__(self, proc_params):
+        super().__init__(proc_params=proc_params)
+        self.matcher = ViewCellMatcher.from_params(proc_params)
+        self.registry = TemplateRegistry.create(
+            proc_params['registry_name'], proc_params.get('registry_capacity', 65536))
+
+    def _stop(self):
+        # stops the match_workers and removes the cold tier file
+        self.matcher.close()
+        self.registry.close()
+        super()._stop()
+
+    def post_guard(self):
+        return self.img_in.probe() and self.pose_in.probe()
+
+    def run_post_mgmt(self):
+        """Post-Management phase: executed only when guard function above
+        returns True.
+        """
+        img = self.img_in.recv()
+        pose = self.pose_in.recv()
+
+        cell = self.matcher.step(img, pose)
+        if self.matcher.cache is not None:
+            self.cache_hits = self.matcher.cache.hits
+            self.cache_misses = self.matcher.cache.misses
+
+        if cell.id == UNMATCHED:
+            self.unmatched_frames += 1
+        else:
+            self.registry.put(cell)
+        self.cell_out.send(encode_cell(cell, self.matcher.new_cell))
+
+
 def create_template(img: np.ndarray) -> np.ndarray:
     img_1d = np.sum(img, axis=0)
     return img_1d / np.sum(img_1d)
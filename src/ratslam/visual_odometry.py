@@ -1,4 +1,4 @@
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 import numpy as np
 from lava.magma.core.decorator import implements, requires, tag
@@ -7,32 +7,130 @@ from lava.magma.core.model.py.ports import PyInPort, PyOutPort
 from lava.magma.core.model.py.type import LavaPyType
 from lava.magma.core.process.ports.ports import InPort, OutPort
 from lava.magma.core.process.process import AbstractProcess
+from lava.magma.core.process.variable import Var
 from lava.magma.core.resources import CPU
 from lava.magma.core.sync.protocols.loihi_protocol import LoihiProtocol
 
 # note: you can't use "from .util import *" because lava will have an aneurysm
-from ratslam.util import compare_segments
+from ratslam.util import ShiftCache, compare_shifts, compare_shifts_pyramid
 
 
 class VisualOdometry(AbstractProcess):
-    def __init__(self, image_shape: Tuple[int, int]) -> None:
-        super().__init__()
+    def __init__(self, image_shape: Tuple[int, int], search: str = 'pyramid',
+                 levels: int = 3, subpixel: bool = False,
+                 cache_size: int = 0, cache_tolerance: float = 0.01) -> None:
+        """
+        search: 'pyramid' for the coarse-to-fine shift search, 'exhaustive'
+            to try every shift at full resolution. Both score a shift by the
+            mean l1 distance over the whole overlap of the two profiles, not
+            by the sum over an 80 column window at every other offset like
+            compare_segments did, so vtrans is scaled from that mean and is
+            close to, not equal to, what compare_segments gave. vrot keeps
+            its sign.
+        levels: number of pyramid levels, including full resolution.
+        subpixel: refine the shift with a parabola fit.
+        cache_size: if > 0, the shift search of each pair of consecutive
+            frames is memoized in an LRU ShiftCache of this many entries,
+            frames equal within cache_tolerance of the mean column value
+            count as the same frame. This pays off when the camera stands
+            still or the video loops.
+        """
+        super().__init__(search=search, levels=levels, subpixel=subpixel,
+                         cache_size=cache_size, cache_tolerance=cache_tolerance)
         self.img_in = InPort(shape=image_shape)
+        self.cache_hits = Var(shape=(1,), init=0)
+        self.cache_misses = Var(shape=(1,), init=0)
 
         self.vtrans_vrot_out = OutPort(shape=(2,))
 
 
+class Odometer:
+    """
+    Visual odometry from the column profiles of consecutive frames, without
+    the ports, so the fused pipeline can run it too. step returns
+    (vtrans, vrot), or None for the first frame.
+    """
+
+    def __init__(self, search: str = 'pyramid', levels: int = 3,
+                 subpixel: bool = False, cache_size: int = 0,
+                 cache_tolerance: float = 0.01) -> None:
+        if search not in ('pyramid', 'exhaustive'):
+            raise Exception(f"unknown odometry search {search}")
+        self.search = search
+        self.levels = levels
+        self.subpixel = subpixel
+        self.cache = ShiftCache(cache_size, cache_tolerance) if cache_size > 0 else None
+        self.prev_img_1d = None
+        self.prev_key = None
+
+    @classmethod
+    def from_params(cls, params):
+        return cls(
+            search=params.get('search', 'pyramid'),
+            levels=params.get('levels', 3),
+            subpixel=params.get('subpixel', False),
+            cache_size=params.get('cache_size', 0),
+            cache_tolerance=params.get('cache_tolerance', 0.01)
+        )
+
+    def step(self, img: np.ndarray) -> Optional[np.ndarray]:
+        VISUAL_ODO_SHIFT_MATCH = 80
+        # diff is the mean column difference times the profile width,
+        # this keeps vtrans close to the old 80 column window sums
+        VTRANS_SCALE = 0.4
+        VROT_SCALE = 1  # (CAMERA_FOV_DEG/img.shape[1])*np.pi/180.0
+
+        img_1d = np.sum(img, axis=0)
+        img_1d = img_1d / np.sum(img_1d)
+
+        key = self.cache.key(img_1d) if self.cache is not None else None
+        if self.prev_img_1d is None:
+            self.prev_img_1d = img_1d
+            self.prev_key = key
+            return None
+
+        hit = self.cache.get(key, self.prev_key) if self.cache is not None else None
+        if hit is not None:
+            offset, diff = hit
+        elif self.search == 'pyramid':
+            offset, diff = compare_shifts_pyramid(
+                img_1d,
+                self.prev_img_1d,
+                VISUAL_ODO_SHIFT_MATCH,
+                levels=self.levels,
+                subpixel=self.subpixel
+            )
+        else:
+            offset, diff = compare_shifts(
+                img_1d,
+                self.prev_img_1d,
+                VISUAL_ODO_SHIFT_MATCH
+            )
+        if self.cache is not None and hit is None:
+            self.cache.put(key, self.prev_key, (offset, diff))
+
+        vtrans = diff*img_1d.size*VTRANS_SCALE
+        vrot = offset*VROT_SCALE
+
+        self.prev_img_1d = img_1d
+        self.prev_key = key
+        return np.array([vtrans, vrot])
+
+
 @implements(proc=VisualOdometry, protocol=LoihiProtocol)
 @requires(CPU)
 class PyVisualOdometryModel(PyLoihiProcessModel):
     img_in: PyInPort = LavaPyType(PyInPort.VEC_DENSE, int, precision=32)
-    prev_img_1d = None
 
     vtrans_vrot_out: PyOutPort = LavaPyType(
         PyOutPort.VEC_DENSE, float, precision=32)
 
+    cache_hits: int = LavaPyType(int, int, precision=32)
+    cache_misses: int = LavaPyType(int, int, precision=32)
+
     def __init__(self, proc_params):
         super().__init__(proc_params=proc_params)
+        self.odometer = Odometer.from_params(proc_params)
 
     def post_guard(self):
         return self.img_in.probe()
@@ -41,32 +139,15 @@ class PyVisualOdometryModel(PyLoihiProcessModel):
         """Post-Management phase: executed only when guard function above
         returns True.
         """
-
-        VISUAL_ODO_SHIFT_MATCH = 80
-        VTRANS_SCALE = 10
-        VROT_SCALE = 1  # (CAMERA_FOV_DEG/img.shape[1])*np.pi/180.0
-
-        img = self.img_in.recv()
-        img_1d = np.sum(img, axis=0)
-        img_1d = img_1d / np.sum(img_1d)
-
-        if self.prev_img_1d is None:
-            self.prev_img_1d = img_1d
-            return
-
-        offset, diff = compare_segments(
-            img_1d,
-            self.prev_img_1d,
-            VISUAL_ODO_SHIFT_MATCH
-        )
-        vtrans = diff*VTRANS_SCALE
-        vrot = offset*VROT_SCALE
-
-        arr_out = np.array([vtrans, vrot])
+        arr_out = self.odometer.step(self.img_in.recv())
+        if self.odometer.cache is not None:
+            self.cache_hits = self.odometer.cache.hits
+            self.cache_misses = self.odometer.cache.misses
+        if arr_out is None:
+            # standing still on the first frame keeps the stages in step
+            arr_out = np.zeros(2)
         self.vtrans_vrot_out.send(arr_out)
 
-        self.prev_img_1d = img_1d
-
     def run_spk(self):
         # print("visual_odometry spike")
         pass
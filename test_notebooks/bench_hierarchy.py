@@ -0,0 +1,58 @@
+"""Time per step of flat and hierarchical pose cell networks.
+
+    python test_notebooks/bench_hierarchy.py --scale 4 --steps 150
+
+Drives a flat PC_DIM_XY grid, a flat grid covering PC_DIM_XY*scale cells
+and a HierarchicalPoseCellNetwork of the same extent with the same
+synthetic odometry, and checks that the hierarchical pose follows the
+large flat grid.
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, './src')
+from ratslam.constants import PC_DIM_XY
+from ratslam.pose_cells import HierarchicalPoseCellNetwork, PoseCellNetwork
+from ratslam.view_cells import ViewCell
+
+
+def run(network, odometry):
+    # a cell that is never recognized again, so nothing is injected
+    cell = ViewCell(0, 0, 0, 0, 1.0, first=True)
+    poses = []
+    start = time.perf_counter()
+    for vtrans, vrot in odometry:
+        poses.append(network.step(cell, vtrans, vrot))
+    return np.array(poses), (time.perf_counter() - start) / len(odometry)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', type=int, default=4)
+    parser.add_argument('--steps', type=int, default=150)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    odometry = [(rng.uniform(0.2, 0.6), rng.normal(0, 0.08)) for _ in range(args.steps)]
+    dim = PC_DIM_XY*args.scale
+
+    _, t_small = run(PoseCellNetwork(), odometry)
+    big, t_big = run(PoseCellNetwork(dim_xy=dim), odometry)
+    hier_net = HierarchicalPoseCellNetwork(scale=args.scale)
+    hier, t_hier = run(hier_net, odometry)
+
+    print(f"flat {PC_DIM_XY:4d}        {t_small*1e3:8.2f} ms/step")
+    print(f"flat {dim:4d}        {t_big*1e3:8.2f} ms/step")
+    print(f"hierarchical {dim:4d} {t_hier*1e3:8.2f} ms/step, "
+          f"{hier_net.restarts} fine restarts")
+
+    # the networks start a couple of cells apart, compare the tracks
+    d = (hier[:, :2] - big[:, :2] + dim/2) % dim - dim/2
+    print(f"max deviation from the flat {dim} track: {np.abs(d - d[0]).max():.4f} cells")
+
+
+if __name__ == '__main__':
+    main()
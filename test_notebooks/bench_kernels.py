@@ -0,0 +1,99 @@
+"""Cross-checks the numpy and numba kernel backends and times each kernel.
+
+    python test_notebooks/bench_kernels.py
+
+Fails if the backends disagree. Needs numba for the compiled backend, the
+numpy timings are reported either way.
+"""
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, './src')
+from ratslam import kernels
+from ratslam.constants import PC_DIM_TH, PC_DIM_XY
+
+
+def timed(func, *args, repeat=5):
+    func(*args)  # warm up, compiles with numba
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(*args)
+    return result, (time.perf_counter() - start) / repeat
+
+
+def segments(rng, width=2048):
+    base = np.convolve(rng.random(width + 200), np.ones(15)/15, 'same')
+    seg1 = base[:width] / np.sum(base[:width])
+    seg2 = base[40:width+40] / np.sum(base[40:width+40])
+    return (seg1, seg2)
+
+
+def compare_segments_case(rng):
+    return segments(rng) + (25,)
+
+
+def shift_distances_case(rng):
+    return segments(rng) + (np.arange(-80, 81),)
+
+
+def relax_map_case(rng, n_exps=2000, n_loops=50):
+    x = np.cumsum(rng.normal(size=n_exps))
+    y = np.cumsum(rng.normal(size=n_exps))
+    facing = rng.uniform(-np.pi, np.pi, n_exps)
+    src = np.concatenate([np.arange(n_exps-1), rng.integers(0, n_exps, n_loops)])
+    dst = np.concatenate([np.arange(1, n_exps), rng.integers(0, n_exps, n_loops)])
+    n_links = len(src)
+    d = rng.uniform(0, 2, n_links)
+    heading = rng.uniform(-np.pi, np.pi, n_links)
+    link_facing = rng.uniform(-0.3, 0.3, n_links)
+    return x, y, facing, src, dst, d, heading, link_facing, 10, 0.5
+
+
+def relax_map_run(x, y, facing, *args):
+    x, y, facing = x.copy(), y.copy(), facing.copy()
+    kernels.relax_map(x, y, facing, *args)
+    return np.stack([x, y, facing])
+
+
+def path_integrate_case(rng):
+    cells = rng.random((PC_DIM_XY, PC_DIM_XY, PC_DIM_TH))
+    return cells / np.sum(cells), 0.37
+
+
+def path_integrate_run(cells, vtrans):
+    return kernels.path_integrate_xy(cells.copy(), vtrans)
+
+
+CASES = [
+    ('compare_segments', kernels.compare_segments, compare_segments_case),
+    ('shift_distances', kernels.shift_distances, shift_distances_case),
+    ('relax_map', relax_map_run, relax_map_case),
+    ('path_integrate_xy', path_integrate_run, path_integrate_case),
+]
+
+
+def main():
+    rng = np.random.default_rng(0)
+    backends = ['numpy'] + (['numba'] if kernels.numba is not None else [])
+
+    for name, func, case in CASES:
+        args = case(rng)
+        results = {}
+        for backend in backends:
+            kernels.set_backend(backend)
+            results[backend] = timed(func, *args)
+
+        ref, t_ref = results['numpy']
+        line = f"{name:18s} numpy {t_ref*1e3:8.2f} ms"
+        if 'numba' in results:
+            out, t = results['numba']
+            if not np.allclose(np.asarray(out, dtype=float), np.asarray(ref, dtype=float)):
+                raise AssertionError(f"{name}: numba and numpy backends disagree")
+            line += f"   numba {t*1e3:8.2f} ms ({t_ref/t:.1f}x)"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
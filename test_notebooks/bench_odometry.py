@@ -0,0 +1,65 @@
+"""Compares the pyramid and exhaustive odometry shift searches on a video.
+
+    python test_notebooks/bench_odometry.py data/oxford_newcollege_sample.mp4
+
+Reports the time per frame of each matcher and how often the pyramid
+search finds the same shift as the exhaustive one.
+"""
+import argparse
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, './src')
+from ratslam.util import compare_shifts, compare_shifts_pyramid
+
+
+def read_profiles(video_path, max_frames):
+    video = cv2.VideoCapture(video_path)
+    profiles = []
+    while len(profiles) < max_frames:
+        ok, frame = video.read()
+        if not ok:
+            break
+        img_1d = np.sum(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), axis=0, dtype=float)
+        profiles.append(img_1d / np.sum(img_1d))
+    return profiles
+
+
+def run(matcher, profiles):
+    offsets = []
+    start = time.perf_counter()
+    for prev, cur in zip(profiles, profiles[1:]):
+        offsets.append(matcher(cur, prev)[0])
+    return np.array(offsets), (time.perf_counter() - start) / (len(profiles) - 1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('video_path')
+    parser.add_argument('--frames', type=int, default=500)
+    parser.add_argument('--max-shift', type=int, default=80)
+    parser.add_argument('--levels', type=int, default=3)
+    args = parser.parse_args()
+
+    profiles = read_profiles(args.video_path, args.frames)
+    print(f"{len(profiles)} frames, {profiles[0].size} columns")
+
+    exhaustive, t_ex = run(
+        lambda a, b: compare_shifts(a, b, args.max_shift), profiles)
+    pyramid, t_py = run(
+        lambda a, b: compare_shifts_pyramid(a, b, args.max_shift, args.levels), profiles)
+    subpixel, t_sub = run(
+        lambda a, b: compare_shifts_pyramid(a, b, args.max_shift, args.levels, subpixel=True), profiles)
+
+    print(f"exhaustive: {t_ex*1e3:.2f} ms/frame")
+    print(f"pyramid:    {t_py*1e3:.2f} ms/frame ({t_ex/t_py:.1f}x), "
+          f"same shift on {np.mean(pyramid == exhaustive)*100:.1f}% of frames")
+    print(f"subpixel:   {t_sub*1e3:.2f} ms/frame, "
+          f"within 1 column on {np.mean(np.abs(subpixel - exhaustive) <= 1)*100:.1f}% of frames")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Frames per second of the fused and distributed RatSLAM topologies.
+
+    python test_notebooks/bench_pipeline.py data/oxford_newcollege_sample.mp4 \
+        --shape 120 160 --frames 200
+
+Both topologies run through Lava for the same number of frames. The
+'stages' line times the stage classes in a plain loop, without Lava, which
+is what the pipeline costs without any channel or synchronization overhead.
+"""
+import argparse
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, './src')
+from ratslam.pipeline import FusedPipeline, build_pipeline
+
+
+def run_lava(topology, args):
+    from lava.magma.core.run_conditions import RunSteps
+    from lava.magma.core.run_configs import Loihi1SimCfg
+
+    procs = build_pipeline(tuple(args.shape), video_path=args.video,
+                           topology=topology)
+    source = procs['source']
+    start = time.perf_counter()
+    # the distributed network needs a few time steps per frame, run until
+    # the source has sent the requested number of frames
+    sent = 0
+    while sent < args.frames:
+        source.run(condition=RunSteps(num_steps=args.frames - sent),
+                   run_cfg=Loihi1SimCfg(select_tag="floating_pt"))
+        prev, sent = sent, int(np.ravel(source.frames_sent.get())[0])
+        if sent == prev:
+            break
+    elapsed = time.perf_counter() - start
+    source.stop()
+    return sent / elapsed
+
+
+def run_stages(args):
+    video = cv2.VideoCapture(args.video)
+    frames = []
+    while len(frames) < args.frames:
+        ok, frame = video.read()
+        if not ok:
+            break
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        frames.append(cv2.resize(frame, tuple(args.shape[::-1]),
+                                 interpolation=cv2.INTER_AREA))
+    pipeline = FusedPipeline()
+    start = time.perf_counter()
+    for frame in frames:
+        pipeline.step(frame)
+    return len(frames) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('video')
+    parser.add_argument('--shape', type=int, nargs=2, default=[120, 160],
+                        metavar=('HEIGHT', 'WIDTH'))
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--topologies', nargs='+',
+                        default=['stages', 'fused', 'distributed'])
+    args = parser.parse_args()
+
+    for topology in args.topologies:
+        fps = run_stages(args) if topology == 'stages' else run_lava(topology, args)
+        print(f"{topology:12s} {fps:8.2f} frames/s")
+
+
+if __name__ == '__main__':
+    main()
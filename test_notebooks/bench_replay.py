@@ -0,0 +1,72 @@
+"""Records the stage traffic of a video once, then times single stages on it.
+
+    python test_notebooks/bench_replay.py data/oxford_newcollege_sample.mp4 \
+        --log /tmp/ratslam_log --frames 500
+
+The fused pipeline runs over the video with a TrafficRecorder (skipped with
+--replay-only if the log exists), then the pose cells and the experience
+map are replayed from the log with every kernel backend, so implementations
+of one stage can be compared on the same real traffic. The pose cell poses
+are checked against the recorded ones.
+"""
+import argparse
+import sys
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, './src')
+from ratslam.experience_map import ExperienceGraph
+from ratslam.kernels import BACKENDS, set_backend
+from ratslam.pipeline import FusedPipeline
+from ratslam.pose_cells import PoseCellNetwork
+from ratslam.replay import (TrafficLog, TrafficRecorder, replay_experience_map,
+                            replay_pose_cells)
+
+
+def record(args):
+    recorder = TrafficRecorder(args.log)
+    pipeline = FusedPipeline(recorder=recorder)
+    video = cv2.VideoCapture(args.video)
+    n = 0
+    while n < args.frames:
+        ok, frame = video.read()
+        if not ok:
+            break
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        pipeline.step(cv2.resize(frame, tuple(args.shape[::-1]),
+                                 interpolation=cv2.INTER_AREA))
+        n += 1
+    recorder.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('video')
+    parser.add_argument('--log', default='ratslam_log')
+    parser.add_argument('--shape', type=int, nargs=2, default=[120, 160],
+                        metavar=('HEIGHT', 'WIDTH'))
+    parser.add_argument('--frames', type=int, default=500)
+    parser.add_argument('--replay-only', action='store_true')
+    args = parser.parse_args()
+
+    if not args.replay_only:
+        record(args)
+    log = TrafficLog.load(args.log)
+    print(f"{len(log)} frames")
+
+    for backend in BACKENDS:
+        try:
+            set_backend(backend)
+        except Exception as e:
+            print(f"{backend}: {e}")
+            continue
+        poses, t_pc = replay_pose_cells(log, PoseCellNetwork())
+        _, t_em = replay_experience_map(log, ExperienceGraph())
+        print(f"{backend:6s} pose cells {t_pc*1e3:8.3f} ms/frame "
+              f"(max pose diff {np.abs(poses - log.pose).max():.2e})  "
+              f"experience map {t_em*1e3:8.3f} ms/frame")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Throughput and accuracy of FusedPipeline schedules.
+
+    python test_notebooks/bench_schedule.py data/oxford_newcollege_sample.mp4 \
+        --frames 500
+
+Each schedule runs over the same frames. The accuracy is against the
+schedule that runs every stage on every frame: the rms distance between the
+map positions of the two runs frame by frame (current experience plus the
+odometry integrated since), and the number of experiences and relaxations.
+"""
+import argparse
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, './src')
+from ratslam.pipeline import FusedPipeline, StageSchedule
+
+SCHEDULES = {
+    'every frame': {},
+    'templates /3': {'view_cells_every': 3},
+    'map /3': {'experience_map_every': 3},
+    'relax /10': {'relax_every': 10},
+    'templates /3, map /3, relax /10': {
+        'view_cells_every': 3, 'experience_map_every': 3, 'relax_every': 10},
+    # match templates every 5 frames, or whenever the robot turns
+    'templates /5 or turning': {
+        'schedule': {'view_cells': StageSchedule(
+            every=5, trigger=lambda p: abs(p.vtrans_vrot[1]) > 0.01)}},
+}
+
+
+def read_frames(args):
+    video = cv2.VideoCapture(args.video)
+    frames = []
+    while len(frames) < args.frames:
+        ok, frame = video.read()
+        if not ok:
+            break
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        frames.append(cv2.resize(frame, tuple(args.shape[::-1]),
+                                 interpolation=cv2.INTER_AREA))
+    return frames
+
+
+def run(frames, params):
+    pipeline = FusedPipeline(**params)
+    graph = pipeline.experience_map
+    positions = np.zeros((len(frames), 2))
+    relaxations = 0
+    start = time.perf_counter()
+    for k, frame in enumerate(frames):
+        update = pipeline.step(frame)
+        if update is not None and len(update.moved):
+            relaxations += 1
+        positions[k] = (graph.current_exp.x_m + graph.accum_delta_x,
+                        graph.current_exp.y_m + graph.accum_delta_y)
+    fps = len(frames) / (time.perf_counter() - start)
+    return fps, positions, len(graph.exps), relaxations
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('video')
+    parser.add_argument('--shape', type=int, nargs=2, default=[120, 160],
+                        metavar=('HEIGHT', 'WIDTH'))
+    parser.add_argument('--frames', type=int, default=500)
+    args = parser.parse_args()
+
+    frames = read_frames(args)
+    print(f"{len(frames)} frames")
+    reference = None
+    for name, params in SCHEDULES.items():
+        fps, positions, n_exps, relaxations = run(frames, params)
+        if reference is None:
+            reference = positions
+        rms = np.sqrt(np.mean(np.sum((positions - reference)**2, axis=1)))
+        print(f"{name:32s} {fps:8.2f} frames/s  rms {rms:8.3f}  "
+              f"{n_exps:5d} experiences  {relaxations:4d} relaxations")
+
+
+if __name__ == '__main__':
+    main()
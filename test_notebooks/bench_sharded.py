@@ -0,0 +1,67 @@
+"""Times sharded template matching against a single process TemplateStore.
+
+    python test_notebooks/bench_sharded.py --templates 10000 --workers 1 2 4 8
+
+Uses synthetic profiles so no dataset is needed. Checks that every worker
+count finds the same template as the single process search.
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, './src')
+from ratslam.sharded_matcher import ShardedTemplateMatcher
+from ratslam.view_cells import TemplateStore
+
+VT_SHIFT_MATCH = 25
+
+
+def profiles(rng, n, width):
+    p = np.abs(np.cumsum(rng.normal(size=(n, width)), axis=1)) + 1
+    return p / p.sum(axis=1, keepdims=True)
+
+
+def timed_matches(matcher, queries):
+    results = []
+    start = time.perf_counter()
+    for q in queries:
+        results.append(matcher.match(q, VT_SHIFT_MATCH)[0])
+    return results, (time.perf_counter() - start) / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--templates', type=int, default=10000)
+    parser.add_argument('--width', type=int, default=512)
+    parser.add_argument('--queries', type=int, default=5)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    templates = profiles(rng, args.templates, args.width)
+    picks = rng.integers(0, args.templates, args.queries)
+    queries = templates[picks] * (1 + rng.normal(0, 0.01, (args.queries, args.width)))
+
+    store = TemplateStore(args.width)
+    for t in templates:
+        store.add(t)
+    reference, t_ref = timed_matches(store, queries)
+    print(f"{args.templates} templates of {args.width} columns")
+    print(f"single process: {t_ref*1e3:9.1f} ms/frame")
+
+    for workers in args.workers:
+        matcher = ShardedTemplateMatcher(args.width, workers)
+        try:
+            for t in templates:
+                matcher.add(t)
+            found, t = timed_matches(matcher, queries)
+        finally:
+            matcher.close()
+        status = "ok" if found == reference else "MISMATCH"
+        print(f"{workers:3d} workers:    {t*1e3:9.1f} ms/frame ({t_ref/t:.1f}x) {status}")
+
+
+if __name__ == '__main__':
+    main()
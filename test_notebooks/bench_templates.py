@@ -0,0 +1,85 @@
+"""Measures how template quantization changes view cell decisions.
+
+    python test_notebooks/bench_templates.py data/oxford_newcollege_sample.mp4
+
+Replays the view cell recognition of PyViewCellsModel on the frames of a
+video for every storage setting, and reports how many frames get the same
+decision as the full resolution float64 path, along with the template
+memory and time per frame. Template ids drift apart after the first
+different decision, so the share of frames with the same new/matched
+decision is the more telling number.
+"""
+import argparse
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, './src')
+from ratslam.view_cells import TemplateStore, create_template
+
+VT_SHIFT_MATCH = 25
+VT_MATCH_THRESHOLD = .3
+
+SETTINGS = [
+    ('float64', 1), ('float16', 1), ('uint8', 1),
+    ('float64', 2), ('float16', 2), ('uint8', 2),
+    ('float16', 4), ('uint8', 4),
+]
+
+
+def read_profiles(video_path, max_frames):
+    video = cv2.VideoCapture(video_path)
+    profiles = []
+    while len(profiles) < max_frames:
+        ok, frame = video.read()
+        if not ok:
+            break
+        profiles.append(create_template(
+            cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY).astype(float)))
+    return profiles
+
+
+def recognize(profiles, dtype, downsample, cold_after):
+    """The template id matched or created for each frame, new templates are
+    marked with -1 so runs can be compared frame by frame."""
+    store = TemplateStore(profiles[0].size, dtype, downsample, cold_after)
+    decisions = []
+    start = time.perf_counter()
+    for img_1d in profiles:
+        i, _, dist = store.match(img_1d, VT_SHIFT_MATCH,
+                                 threshold=VT_MATCH_THRESHOLD/img_1d.size)
+        if i < 0 or dist*img_1d.size > VT_MATCH_THRESHOLD:
+            store.add(img_1d)
+            i = -1
+        decisions.append(i)
+    elapsed = (time.perf_counter() - start) / len(profiles)
+    return np.array(decisions), store, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('video_path')
+    parser.add_argument('--frames', type=int, default=1000)
+    parser.add_argument('--cold-after', type=int, default=0)
+    args = parser.parse_args()
+
+    profiles = read_profiles(args.video_path, args.frames)
+    print(f"{len(profiles)} frames, {profiles[0].size} columns")
+
+    reference = None
+    for dtype, downsample in SETTINGS:
+        decisions, store, elapsed = recognize(profiles, dtype, downsample, args.cold_after)
+        if reference is None:
+            reference = decisions
+        same_new = np.mean((decisions < 0) == (reference < 0)) * 100
+        same_id = np.mean(decisions == reference) * 100
+        print(f"{dtype:8s} /{downsample}: {len(store):5d} templates, "
+              f"{store.hot.itemsize*store.n_cols/1024:6.2f} KB each, "
+              f"{elapsed*1e3:7.2f} ms/frame, same new/matched decision on "
+              f"{same_new:5.1f}% and same template on {same_id:5.1f}% of frames")
+
+
+if __name__ == '__main__':
+    main()
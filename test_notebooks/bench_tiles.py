@@ -0,0 +1,103 @@
+"""Level of detail tile export of a large experience map.
+
+    python test_notebooks/bench_tiles.py --exps 200000 --out /tmp/ratslam_tiles
+
+A made-up map of laps around a loop, with loop closure links between laps,
+is fed to a TileExporter as MapUpdates and exported. Then a relaxation
+that moves the experiences of one area is applied, and only the tiles it
+touched are rewritten. The tiles are checked against a fresh export of the
+final map, and a viewport is read back at a coarse and the finest level.
+"""
+import argparse
+import filecmp
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, './src')
+from ratslam.map_stream import MapUpdate
+from ratslam.map_tiles import TileExporter, read_tiles
+
+
+def made_up_map(n, laps=5, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(n)
+    angle = t / (n // laps) * 2 * np.pi
+    radius = 2000 + 300 * np.sin(5 * angle)
+    exps = np.column_stack([t, radius * np.cos(angle) + rng.normal(0, 2, n),
+                            radius * np.sin(angle) + rng.normal(0, 2, n), angle])
+    chain = np.column_stack([t[:-1], t[1:]])
+    # every 20th experience of a lap closes a loop with the first lap
+    later = t[n // laps::20]
+    closures = np.column_stack([later, later % (n // laps)])
+    return exps, np.concatenate([chain, closures])
+
+
+def updates(exps, links, batch):
+    for start in range(0, len(exps), batch):
+        stop = start + batch
+        new_links = links[(links.max(axis=1) >= start) & (links.max(axis=1) < stop)]
+        yield MapUpdate(0, stop - 1, exps[start:stop], new_links, np.zeros((0, 4)))
+
+
+def export(path, exps, links, batch=10000):
+    exporter = TileExporter(path)
+    for update in updates(exps, links, batch):
+        exporter.update(update)
+    start = time.perf_counter()
+    written = exporter.flush()
+    return exporter, written, time.perf_counter() - start
+
+
+def same_tiles(a, b):
+    for root, _, files in os.walk(b):
+        for name in files:
+            other = os.path.join(a, os.path.relpath(os.path.join(root, name), b))
+            if name.endswith('.npz'):
+                x, y = np.load(other), np.load(os.path.join(root, name))
+                if any(not np.array_equal(np.unique(x[k], axis=0), np.unique(y[k], axis=0))
+                       for k in ('nodes', 'segments')):
+                    return False
+            elif not filecmp.cmp(other, os.path.join(root, name), shallow=False):
+                return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--exps', type=int, default=200000)
+    parser.add_argument('--out', default='ratslam_tiles')
+    args = parser.parse_args()
+
+    exps, links = made_up_map(args.exps)
+    exporter, written, elapsed = export(os.path.join(args.out, 'incremental'), exps, links)
+    print(f"{len(exps)} experiences, {len(links)} links: "
+          f"{written} tiles in {elapsed:.2f} s")
+
+    # a relaxation that pulls the experiences near one place together
+    near = np.flatnonzero(np.hypot(exps[:, 1] - 2000, exps[:, 2]) < 150)
+    moved = exps[near].copy()
+    moved[:, 1:3] += np.random.default_rng(1).normal(0, 5, (len(near), 2))
+    exporter.update(MapUpdate(1, 0, np.zeros((0, 4)), np.zeros((0, 2), dtype=int), moved))
+    start = time.perf_counter()
+    written = exporter.flush()
+    print(f"relaxation moved {len(near)} experiences: "
+          f"{written} tiles rewritten in {time.perf_counter() - start:.3f} s")
+
+    exps[near] = moved
+    export(os.path.join(args.out, 'fresh'), exps, links)
+    print("same as a fresh export:",
+          same_tiles(os.path.join(args.out, 'incremental'), os.path.join(args.out, 'fresh')))
+
+    for level in (exporter.n_levels - 1, 0):
+        start = time.perf_counter()
+        nodes, segments = read_tiles(os.path.join(args.out, 'incremental'), level,
+                                     1500, -500, 2500, 500)
+        print(f"level {level} viewport: {len(nodes)} nodes, {len(segments)} segments "
+              f"in {(time.perf_counter() - start)*1e3:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Accuracy against throughput of RatSLAM configurations.
+
+    python test_notebooks/eval_accuracy.py data/oxford_newcollege_sample.mp4 \
+        --reference data/oxford_newcollege_gps.csv --frames 2000
+
+Each configuration runs the fused pipeline over the video in its own
+process, so the peak memory reported is its own, and its trajectory is
+evaluated against the reference (one row per frame, x,y or lat,lon
+columns). The metrics themselves are checked on made-up runs in
+tests/test_evaluation.py.
+"""
+import argparse
+import multiprocessing
+import sys
+
+import cv2
+
+sys.path.insert(0, './src')
+from ratslam.evaluation import evaluate, load_reference, peak_rss_mb, run_pipeline
+from ratslam.pipeline import FusedPipeline
+
+CONFIGS = {
+    'default': {},
+    'templates /3': {'view_cells_every': 3},
+    'templates /3, map /3, relax /10': {
+        'view_cells_every': 3, 'experience_map_every': 3, 'relax_every': 10},
+    'uint8 templates /2': {'template_dtype': 'uint8', 'template_downsample': 2},
+    'odometry cache': {'cache_size': 4096},
+}
+
+
+def read_frames(video_path, shape, n_frames):
+    video = cv2.VideoCapture(video_path)
+    frames = []
+    while len(frames) < n_frames:
+        ok, frame = video.read()
+        if not ok:
+            break
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        frames.append(cv2.resize(frame, tuple(shape[::-1]), interpolation=cv2.INTER_AREA))
+    return frames
+
+
+def run_config(video_path, shape, n_frames, params):
+    frames = read_frames(video_path, shape, n_frames)
+    pipeline = FusedPipeline(**params)
+    trajectory, fps = run_pipeline(pipeline, frames)
+    return trajectory, fps, peak_rss_mb(), len(pipeline.view_cells.cells)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('video')
+    parser.add_argument('--reference', required=True)
+    parser.add_argument('--shape', type=int, nargs=2, default=[120, 160],
+                        metavar=('HEIGHT', 'WIDTH'))
+    parser.add_argument('--frames', type=int, default=2000)
+    parser.add_argument('--radius', type=float, default=5.,
+                        help='distance of a true loop closure, reference units')
+    parser.add_argument('--min-gap', type=int, default=50)
+    parser.add_argument('--configs', nargs='+', default=list(CONFIGS))
+    args = parser.parse_args()
+
+    ref = load_reference(args.reference)
+    context = multiprocessing.get_context('spawn')
+    for name in args.configs:
+        with context.Pool(1) as pool:
+            trajectory, fps, peak, n_templates = pool.apply(
+                run_config, (args.video, args.shape, args.frames, CONFIGS[name]))
+        result = evaluate(trajectory, ref, radius=args.radius, min_gap=args.min_gap,
+                          n_templates=n_templates, fps=fps, peak_rss_mb=peak)
+        print(f"{name:32s} {result}")
+
+
+if __name__ == '__main__':
+    main()
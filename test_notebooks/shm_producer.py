@@ -0,0 +1,62 @@
+"""Plays a video into a FrameRing so SharedFrameSource can be fed live.
+
+    python test_notebooks/shm_producer.py data/oxford_newcollege_sample.mp4 \
+        --name ratslam_frames --fps 20
+
+Start this first, then create ratslam.SharedFrameSource(video_shape,
+ring_name='ratslam_frames') in the notebook instead of ImageGenerator.
+"""
+import argparse
+import sys
+import time
+
+import cv2
+
+sys.path.insert(0, './src')
+from ratslam.frame_ring import FrameRing
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('video_path')
+    parser.add_argument('--name', default='ratslam_frames')
+    parser.add_argument('--slots', type=int, default=8)
+    parser.add_argument('--fps', type=float, default=0,
+                        help='playback rate, 0 uses the rate of the video')
+    parser.add_argument('--loop', action='store_true')
+    args = parser.parse_args()
+
+    video = cv2.VideoCapture(args.video_path)
+    fps = args.fps or video.get(cv2.CAP_PROP_FPS) or 30
+    shape = (int(video.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+             int(video.get(cv2.CAP_PROP_FRAME_WIDTH)))
+
+    ring = FrameRing.create(shape, args.slots, name=args.name)
+    print(f"ring {ring.name}: {shape[1]}x{shape[0]}, {args.slots} slots, {fps:.1f} fps")
+
+    period = 1.0 / fps
+    next_t = time.perf_counter()
+    try:
+        while True:
+            ok, frame = video.read()
+            if not ok:
+                if not args.loop:
+                    break
+                video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                continue
+            seq = ring.write(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+            if seq % 100 == 0:
+                print(f"frame {seq}")
+
+            next_t += period
+            time.sleep(max(0, next_t - time.perf_counter()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # keep the ring alive until readers are done with the last frames
+        input("done, press enter to release the ring")
+        ring.close()
+
+
+if __name__ == '__main__':
+    main()
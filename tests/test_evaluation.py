@@ -0,0 +1,76 @@
+import sys
+
+import numpy as np
+import pytest
+
+from ratslam.evaluation import evaluate, peak_rss_mb, revisits, umeyama
+
+
+def rotation(th):
+    return np.array([[np.cos(th), -np.sin(th)], [np.sin(th), np.cos(th)]])
+
+
+def synthetic_run(n=20000, seed=0):
+    """A run of n frames around 5 laps of a loop. The estimate is the
+    reference rotated, scaled and shifted, with random walk drift, and 1%
+    of the frames at a random experience."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(n)
+    lap = max(n // 5, 1)
+    angle = t / lap * 2 * np.pi
+    ref = np.stack([50 * np.cos(angle), 30 * np.sin(2 * angle) + 50 * np.sin(angle)], axis=1)
+    R = rotation(0.3)
+    drift = np.cumsum(rng.normal(0, 0.01, (n, 2)), axis=0)
+    est = 2.5 * ref @ R.T + [10, -4] + drift
+    exp_ids = (t % lap) // 10
+    wrong = rng.random(n) < 0.01
+    exp_ids[wrong] = rng.integers(0, exp_ids.max() + 1, np.count_nonzero(wrong))
+    trajectory = np.column_stack([t, exp_ids, est, np.zeros(n)])
+    return trajectory, ref, drift, R
+
+
+def test_umeyama_recovers_the_similarity():
+    trajectory, ref, drift, R = synthetic_run()
+    s, R_est, t = umeyama(trajectory[:, 2:4] - drift, ref)
+    assert np.isclose(s, 1 / 2.5)
+    assert np.allclose(R_est, R.T)
+    assert np.allclose(s * (trajectory[:, 2:4] - drift) @ R_est.T + t, ref)
+
+
+def test_ate_is_bounded_by_the_drift():
+    trajectory, ref, drift, _ = synthetic_run()
+    result = evaluate(trajectory, ref, radius=2., min_gap=100)
+    assert result.ate_rmse < 5 * np.abs(drift).max()
+
+    trajectory[:, 2:4] -= drift
+    assert evaluate(trajectory, ref, radius=2., min_gap=100).ate_max < 1e-9
+
+
+def test_loop_closures():
+    trajectory, ref, _, _ = synthetic_run()
+    result = evaluate(trajectory, ref, radius=2., min_gap=100)
+    # every frame after the first lap revisits, all but the wrong ones close
+    assert result.precision > 0.9
+    assert result.recall > 0.75
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_revisits_against_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    ref = np.cumsum(rng.normal(0, 1, (1500, 2)), axis=0)
+    radius, min_gap = 2., 30
+
+    d2 = np.sum((ref[:, None] - ref[None]) ** 2, axis=2)
+    i, j = np.indices(d2.shape)
+    expected = ((d2 < radius**2) & (j <= i - min_gap)).any(axis=1)
+
+    found = revisits(ref, radius, min_gap, chunk=64)
+    assert expected.any()
+    assert np.array_equal(found, expected)
+
+
+def test_peak_rss_without_resource(monkeypatch):
+    assert peak_rss_mb() > 0
+    # like on windows, where there is no resource module
+    monkeypatch.setitem(sys.modules, 'resource', None)
+    assert np.isnan(peak_rss_mb())
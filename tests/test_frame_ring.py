@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+
+from ratslam.frame_ring import FrameRing, PySharedFrameSourceModel
+
+
+class Port:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, data):
+        self.sent.append(data)
+
+
+def frame(k):
+    return np.full((4, 6), k, dtype=np.uint8)
+
+
+@pytest.fixture
+def ring():
+    ring = FrameRing.create((4, 6), n_slots=4)
+    yield ring
+    ring.close()
+
+
+
+def test_create_attach_read(ring):
+    reader = FrameRing.attach(ring.name, (4, 6), n_slots=4)
+    assert reader.read(-1) is None
+
+    for k in range(3):
+        assert ring.write(frame(k)) == k
+    seq, img, skipped = reader.read(-1)
+    assert (seq, img[0, 0], skipped) == (2, 2, 2)
+    seq, img, skipped = reader.read(-1, latest=False)
+    assert (seq, img[0, 0], skipped) == (0, 0, 0)
+    assert reader.read(2) is None
+    reader.close()
+
+
+def test_lapped_reader(ring):
+    for k in range(6):
+        ring.write(frame(k))
+    # frames 0 and 1 are overwritten, the oldest one left is 2
+    seq, img, skipped = ring.read(-1, latest=False)
+    assert (seq, img[0, 0], skipped) == (2, 2, 2)
+
+    assert ring.valid(seq)
+    for k in range(6, 10):
+        ring.write(frame(k))
+    assert not ring.valid(seq)
+    assert img[0, 0] == 6  # the view now shows the frame that replaced it
+
+    # a slot that is being written is not returned
+    ring.slot_seq[9 % 4] = -1
+    assert ring.read(5) is None
+
+
+def source(ring, latest=True):
+    model = PySharedFrameSourceModel.__new__(PySharedFrameSourceModel)
+    model.ring = FrameRing.attach(ring.name, (4, 6), n_slots=4)
+    model.latest = latest
+    model._frame = None
+    model.last_seq = -1
+    model.frames_dropped = 0
+    model.img_out = Port()
+    return model
+
+
+def test_source_counts_dropped_frames(ring):
+    model = source(ring)
+    assert not model.post_guard()
+
+    for k in range(3):
+        ring.write(frame(k))
+    assert model.post_guard()
+    model.run_post_mgmt()
+    assert (model.last_seq, model.frames_dropped) == (2, 2)
+
+    ring.write(frame(3))
+    assert model.post_guard()
+    model.run_post_mgmt()
+    assert (model.last_seq, model.frames_dropped) == (3, 2)
+    assert [img[0, 0] for img in model.img_out.sent] == [2, 3]
+    model.ring.close()
+
+
+def test_source_drops_a_frame_lapped_while_copying(ring):
+    model = source(ring, latest=False)
+    for k in range(2):
+        ring.write(frame(k))
+
+    valid = model.ring.valid
+    lapped = [True]
+
+    def lap_once(seq):
+        if lapped.pop() if lapped else False:
+            return False
+        return valid(seq)
+
+    model.ring.valid = lap_once
+    assert model.post_guard()
+    model.run_post_mgmt()
+    # frame 0 was lapped and dropped, frame 1 was read again and sent
+    assert model.img_out.sent[0][0, 0] == 1
+    assert (model.last_seq, model.frames_dropped) == (1, 1)
+    # what was sent is a copy, not a view into the ring
+    ring.write(frame(7))
+    ring.write(frame(8))
+    ring.write(frame(9))
+    assert model.img_out.sent[0][0, 0] == 1
+    model.ring.close()
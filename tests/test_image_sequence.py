@@ -0,0 +1,52 @@
+import cv2
+import numpy as np
+
+from ratslam.image_sequence import ImageSequence
+
+
+def image_dir(tmp_path, n=5):
+    rng = np.random.default_rng(0)
+    frames = rng.integers(0, 255, (n, 12, 16), dtype=np.uint8)
+    lines = []
+    for k, frame in enumerate(frames):
+        cv2.imwrite(str(tmp_path / f'{k}.png'), frame)
+        lines.append(f'{k}.png {k * 0.5}')
+    (tmp_path / 'data.txt').write_text('\n'.join(lines))
+    return frames
+
+
+def test_frames_in_order(tmp_path):
+    frames = image_dir(tmp_path)
+    seq = ImageSequence(str(tmp_path), workers=2, prefetch=3)
+    try:
+        out = list(seq)
+    finally:
+        seq.close()
+    assert seq._pool is None
+    assert np.array_equal(np.stack([img for img, _ in out]), frames)
+    assert [m[0] for _, m in out] == [0, 0.5, 1, 1.5, 2]
+
+
+def test_cache_is_reused_and_rebuilt_on_a_new_shape(tmp_path):
+    frames = image_dir(tmp_path)
+    cache_path = str(tmp_path / 'frames.cache')
+
+    seq = ImageSequence(str(tmp_path), cache_path=cache_path, workers=2)
+    assert np.array_equal(np.stack([img for img, _ in seq]), frames)
+    seq.close()
+
+    seq = ImageSequence(str(tmp_path), cache_path=cache_path, workers=0)
+    assert seq.cached.all()
+    assert np.array_equal(seq.get(3), frames[3])
+    seq.close()
+
+    # same number of bytes per frame, transposed
+    seq = ImageSequence(str(tmp_path), image_shape=(16, 12), cache_path=cache_path, workers=0)
+    assert not seq.cached.any()
+    assert seq.get(0).shape == (16, 12)
+    seq.close()
+
+    seq = ImageSequence(str(tmp_path), image_shape=(6, 8), cache_path=cache_path, workers=0)
+    assert not seq.cached.any()
+    assert seq.cache.shape == (5, 6, 8)
+    seq.close()
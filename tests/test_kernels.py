@@ -0,0 +1,126 @@
+import numpy as np
+import pytest
+
+from ratslam import kernels
+from ratslam.constants import PC_DIM_TH, PC_DIM_XY
+
+
+@pytest.fixture(params=kernels.BACKENDS)
+def backend(request):
+    if request.param == 'numba' and kernels.numba is None:
+        pytest.skip("numba is not installed")
+    previous = kernels.get_backend()
+    kernels.set_backend(request.param)
+    yield request.param
+    kernels.set_backend(previous)
+
+
+def with_numpy(func, *args):
+    previous = kernels.get_backend()
+    kernels.set_backend('numpy')
+    try:
+        return func(*args)
+    finally:
+        kernels.set_backend(previous)
+
+
+def segments(shift=12, width=200, seed=0):
+    rng = np.random.default_rng(seed)
+    base = np.convolve(rng.random(width + 2 * shift), np.ones(9) / 9, 'same')
+    seg1 = base[shift:width + shift]
+    seg2 = base[:width]
+    return seg1 / seg1.sum(), seg2 / seg2.sum()
+
+
+def test_compare_segments(backend):
+    seg1, seg2 = segments()
+    offset, dist = kernels.compare_segments(seg1, seg2, 50)
+
+    # the original double slicing loop
+    best_dist, best_offset = np.inf, -1
+    for i in range(len(seg1) - 50):
+        j = len(seg2) - 50 - 2 - i
+        d = np.sum(np.abs(seg1[i:][:50] - seg2[j:][:50]))
+        if d < best_dist:
+            best_dist, best_offset = d, j - i
+    assert offset == best_offset == 12
+    assert np.isclose(dist, best_dist)
+
+
+def test_compare_segments_many(backend):
+    seg, _ = segments()
+    templates = np.stack([segments(seed=k)[1] for k in range(5)] + [seg])
+    offsets, dists = kernels.compare_segments_many(seg, templates, 50)
+
+    expected = [with_numpy(kernels.compare_segments, seg, t, 50) for t in templates]
+    assert offsets.tolist() == [o for o, _ in expected]
+    assert np.allclose(dists, [d for _, d in expected])
+    assert np.argmin(dists) == len(templates) - 1
+
+
+def test_compare_segments_many_empty(backend):
+    offsets, dists = kernels.compare_segments_many(segments()[0], np.zeros((0, 200)), 50)
+    assert len(offsets) == len(dists) == 0
+
+
+def test_shift_distances(backend):
+    seg1, seg2 = segments()
+    shifts = np.arange(-30, 31)
+    dists = kernels.shift_distances(seg1, seg2, shifts)
+
+    expected = [np.mean(np.abs(seg1[max(s, 0):len(seg1) + min(s, 0)]
+                               - seg2[max(-s, 0):len(seg2) - max(s, 0)]))
+                for s in shifts]
+    assert np.allclose(dists, expected)
+    # seg1[i + s] == seg2[i] at s = -12
+    assert shifts[np.argmin(dists)] == -12
+
+
+def relax_case(seed=0, n_exps=200, n_loops=20):
+    rng = np.random.default_rng(seed)
+    x = np.cumsum(rng.normal(size=n_exps))
+    y = np.cumsum(rng.normal(size=n_exps))
+    facing = rng.uniform(-np.pi, np.pi, n_exps)
+    src = np.concatenate([np.arange(n_exps - 1), rng.integers(0, n_exps, n_loops)])
+    dst = np.concatenate([np.arange(1, n_exps), rng.integers(0, n_exps, n_loops)])
+    d = rng.uniform(0, 2, len(src))
+    heading = rng.uniform(-np.pi, np.pi, len(src))
+    link_facing = rng.uniform(-0.3, 0.3, len(src))
+    return x, y, facing, src, dst, d, heading, link_facing
+
+
+def relaxed(x, y, facing, *links, loops=10, cf=0.5):
+    x, y, facing = x.copy(), y.copy(), facing.copy()
+    kernels.relax_map(x, y, facing, *links, loops, cf)
+    return np.stack([x, y, facing])
+
+
+def test_relax_map(backend):
+    case = relax_case()
+    out = relaxed(*case)
+    assert np.allclose(out, with_numpy(relaxed, *case))
+    assert np.all(np.abs(out[2]) <= np.pi)
+
+
+def test_relax_map_keeps_consistent_map(backend):
+    # links that agree with the positions leave the map where it is
+    x, y, facing, src, dst, _, _, _ = relax_case(n_loops=0)
+    dx, dy = x[dst] - x[src], y[dst] - y[src]
+    d = np.hypot(dx, dy)
+    heading = np.arctan2(dy, dx) - facing[src]
+    link_facing = facing[dst] - facing[src]
+    out = relaxed(x, y, facing, src, dst, d, heading, link_facing)
+    assert np.allclose(out[:2], [x, y])
+    assert np.allclose(np.exp(1j * out[2]), np.exp(1j * facing))
+
+
+@pytest.mark.parametrize('vtrans', [0., 0.37, 1.])
+def test_path_integrate_xy(backend, vtrans):
+    rng = np.random.default_rng(0)
+    cells = rng.random((PC_DIM_XY, PC_DIM_XY, PC_DIM_TH))
+    cells /= cells.sum()
+
+    out = kernels.path_integrate_xy(cells.copy(), vtrans)
+    assert np.allclose(out, with_numpy(kernels.path_integrate_xy, cells.copy(), vtrans))
+    if vtrans == 0.:
+        assert np.allclose(out, cells)
@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+import pytest
+
+from ratslam.map_stream import MapUpdate
+from ratslam.map_tiles import TileExporter, read_tiles
+
+
+def square_map(step=0):
+    exps = np.array([[0, 0., 0., 0.], [1, 60., 0., 0.], [2, 60., 60., 0.], [3, 0., 60., 0.]])
+    links = np.array([[0, 1], [1, 2], [2, 3], [3, 0]])
+    return MapUpdate(step, 3, exps, links, np.zeros((0, 4)))
+
+
+def test_export_and_read_back(tmp_path):
+    exporter = TileExporter(str(tmp_path), n_levels=3)
+    exporter.update(square_map())
+    assert exporter.flush() > 0
+    nodes, segments = read_tiles(str(tmp_path), 0, -1, -1, 100, 100)
+    assert sorted(nodes[:, 0].astype(int).tolist()) == [0, 1, 2, 3]
+    # links between tiles are in both tiles
+    assert len(segments) == 8
+
+
+def test_refuses_a_foreign_directory(tmp_path):
+    (tmp_path / 'notes.txt').write_text('keep me')
+    with pytest.raises(Exception):
+        TileExporter(str(tmp_path))
+    assert (tmp_path / 'notes.txt').exists()
+
+
+def test_replaces_only_its_own_export(tmp_path):
+    exporter = TileExporter(str(tmp_path), n_levels=2)
+    exporter.update(square_map())
+    exporter.flush()
+    (tmp_path / 'zoo').mkdir()
+    (tmp_path / 'z0' / 'stale.npz').write_bytes(b'')
+
+    TileExporter(str(tmp_path), n_levels=2)
+    assert (tmp_path / 'zoo').exists()
+    assert os.listdir(tmp_path / 'z0') == []
+    nodes, _ = read_tiles(str(tmp_path), 0, -1, -1, 100, 100)
+    assert len(nodes) == 0
+
+
+def test_graph_flushes_tiles_on_close(tmp_path):
+    from ratslam.experience_map import ExperienceGraph
+    from ratslam.view_cells import ViewCell
+
+    graph = ExperienceGraph(tiles_path=str(tmp_path), tiles_every=1000)
+    for k in range(20):
+        graph.step(ViewCell(k, 0., 0., 0., 1.), 1., 0., float(k), 0., 0.)
+    assert len(read_tiles(str(tmp_path), 0, -1e3, -1e3, 1e3, 1e3)[0]) == 0
+    graph.close()
+    assert len(read_tiles(str(tmp_path), 0, -1e3, -1e3, 1e3, 1e3)[0]) == graph.size
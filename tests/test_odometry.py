@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+from ratslam.util import compare_segments, compare_shifts, compare_shifts_pyramid
+
+
+def shifted_profiles(shift, width=160, seed=0):
+    """A smooth column profile and the same profile with the camera turned
+    so everything moved shift columns to the right."""
+    rng = np.random.default_rng(seed)
+    prev = np.convolve(rng.random(width + 40), np.ones(9) / 9, mode='same')[20:-20]
+    cur = np.roll(prev, shift)
+    return cur / cur.sum(), prev / prev.sum()
+
+
+@pytest.mark.parametrize('shift', [-10, -4, 4, 10])
+def test_shift_sign_matches_compare_segments(shift):
+    cur, prev = shifted_profiles(shift)
+    offset, _ = compare_segments(cur, prev, 80)
+    assert offset == -shift
+
+    assert compare_shifts(cur, prev, 80)[0] == offset
+    assert compare_shifts_pyramid(cur, prev, 80)[0] == offset
+    assert round(compare_shifts_pyramid(cur, prev, 80, subpixel=True)[0]) == offset
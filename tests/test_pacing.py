@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from ratslam.image_generator import AbstractPyFrameSourceModel
+
+
+class Port:
+    def __init__(self, connected=True):
+        self.csp_ports = [object()] if connected else []
+        self.queue = []
+        self.sent = []
+
+    def probe(self):
+        return bool(self.queue) or not self.csp_ports
+
+    def recv(self):
+        return self.queue.pop(0) if self.queue else np.zeros(1)
+
+    def send(self, data):
+        self.sent.append(data)
+
+
+class Frames(AbstractPyFrameSourceModel):
+    def __init__(self, proc_params, connected=True):
+        super().__init__(proc_params)
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.img_out = Port()
+        self.ready_in = Port(connected)
+
+    def read_frame(self):
+        return np.zeros((2, 2))
+
+    def skip_frame(self):
+        return True
+
+
+def test_adaptive_pacing_waits_for_ready():
+    source = Frames({'pacing': 'adaptive', 'max_in_flight': 2})
+    for _ in range(5):
+        if source.post_guard():
+            source.run_post_mgmt()
+    assert source.frames_sent == 2
+
+    source.ready_in.queue.append(np.ones(1))
+    assert source.post_guard()
+    source.run_post_mgmt()
+    assert source.frames_sent == 3 and source.in_flight == 2
+
+
+def test_adaptive_pacing_needs_ready_in():
+    source = Frames({'pacing': 'adaptive'}, connected=False)
+    with pytest.raises(Exception, match='ready_in'):
+        source.post_guard()
@@ -0,0 +1,21 @@
+from ratslam.pose_cells import HierarchicalPoseCellNetwork, PoseCellNetwork
+from ratslam.view_cells import ViewCell
+
+
+def stand_still(network, steps=60):
+    cell = ViewCell(0, 0., 0., 0., 1., first=True)
+    for _ in range(steps):
+        network.step(cell, 0., 0.)
+
+
+def test_flat_network_skips_at_rest():
+    network = PoseCellNetwork()
+    stand_still(network)
+    assert network.skipped_steps > 0
+
+
+def test_hierarchical_network_counts_both_grids():
+    network = HierarchicalPoseCellNetwork(scale=2)
+    stand_still(network)
+    assert network.coarse.skipped_steps > 0 and network.fine.skipped_steps > 0
+    assert network.skipped_steps == network.coarse.skipped_steps + network.fine.skipped_steps
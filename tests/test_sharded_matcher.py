@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from ratslam.sharded_matcher import ShardedTemplateMatcher
+from ratslam.view_cells import TemplateStore
+
+
+def profiles(n, width=120, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = np.apply_along_axis(np.convolve, 1, rng.random((n, width + 8)), np.ones(9) / 9, 'valid')
+    return rows / rows.sum(axis=1, keepdims=True)
+
+
+@pytest.fixture
+def matcher():
+    matcher = ShardedTemplateMatcher(120, workers=3, capacity=4)
+    yield matcher
+    matcher.close()
+
+
+def test_same_match_as_template_store(matcher):
+    store = TemplateStore(120)
+    templates = profiles(40)
+    for t in templates:
+        assert matcher.add(t) == store.add(t)
+    # the shards stay balanced, and grew past their capacity
+    assert sorted(len(s.ids) for s in matcher.shards) == [13, 13, 14]
+
+    queries = np.concatenate([templates[[0, 17, 39]], profiles(10, seed=1)])
+    for q in queries:
+        tid, offset, dist = matcher.match(q, 25)
+        expected = store.match(q, 25)
+        assert (tid, offset) == expected[:2]
+        assert dist == pytest.approx(expected[2])
+
+
+def test_empty(matcher):
+    assert matcher.match(profiles(1)[0], 25) == (-1, 0, np.inf)
+    assert len(matcher) == 0
+
+
+def test_cached_match(matcher):
+    from ratslam.util import ShiftCache
+
+    cache = ShiftCache(8)
+    templates = profiles(6)
+    for t in templates[:5]:
+        matcher.add(t)
+    first = matcher.match(templates[2], 25, cache=cache)
+    assert matcher.match(templates[2] * 1.001, 25, cache=cache) == first
+    assert cache.hits == 1
+
+    # a new template invalidates the cached result
+    matcher.add(templates[5])
+    assert matcher.match(templates[2], 25, cache=cache) == matcher.match(templates[2], 25)
+    assert cache.hits == 1
@@ -0,0 +1,89 @@
+import os
+
+import numpy as np
+import pytest
+
+from ratslam.view_cells import TemplateRegistry, TemplateStore, ViewCell
+
+
+def profiles(n, width=64, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = rng.random((n, width)) + 0.1
+    return rows / rows.sum(axis=1, keepdims=True)
+
+
+def test_cold_rows_are_reused():
+    store = TemplateStore(64, cold_after=2, capacity=4)
+    frames = profiles(6)
+    for p in frames:
+        store.add(p)
+    for cycle in range(20):
+        # everything else goes cold, the matched template comes back hot
+        for _ in range(4):
+            store.match(frames[0], 8)
+        tid, _, dist = store.match(frames[cycle % 6], 8, threshold=1e-9)
+        assert tid == cycle % 6 and dist == 0
+    assert store.n_cold_rows <= len(frames)
+    assert np.allclose(store.profiles(), frames)
+
+
+def test_close_removes_temporary_cold_file():
+    store = TemplateStore(64, cold_after=1)
+    for p in profiles(3):
+        store.add(p)
+    for _ in range(3):
+        store.match(profiles(1, seed=1)[0], 8)
+    path = store.cold_path
+    assert os.path.exists(path)
+    store.close()
+    assert not os.path.exists(path)
+
+
+def test_ids_grow_past_capacity():
+    store = TemplateStore(64, capacity=2)
+    frames = profiles(9)
+    assert [store.add(p) for p in frames] == list(range(9))
+    assert len(store) == 9
+    assert store.match(frames[7], 8)[0] == 7
+
+
+def test_cached_match_is_the_match(monkeypatch):
+    from ratslam import view_cells
+    from ratslam.util import ShiftCache
+
+    store, cached = TemplateStore(64), TemplateStore(64)
+    cache = ShiftCache(4)
+    frames = profiles(8)
+    for p in frames[:4]:
+        store.add(p)
+        cached.add(p)
+
+    calls = []
+    compare = view_cells.compare_segments_many
+    monkeypatch.setattr(view_cells, 'compare_segments_many',
+                        lambda *args: calls.append(1) or compare(*args))
+    for p in [frames[5], frames[5] * 1.001, frames[6], frames[5]]:
+        assert cached.match(p, 8, cache=cache) == store.match(p, 8)
+    # the near-duplicate and the repeated frame were not matched again
+    assert len(calls) == 4 + 2 and cache.hits == 2
+
+    # a new template can be the better match, the cached result is stale
+    store.add(frames[5])
+    cached.add(frames[5])
+    assert cached.match(frames[5], 8, cache=cache) == store.match(frames[5], 8) == (4, 0, 0.)
+
+
+def test_registry_attach_reads_capacity():
+    registry = TemplateRegistry.create(capacity=3)
+    reader = TemplateRegistry.attach(registry.name)
+    try:
+        assert reader.capacity == 3
+        registry.put(ViewCell(2, 1., 2., 3., 1.))
+        assert len(reader) == 3 and reader.get(2).th_pc == 3.
+        with pytest.raises(Exception):
+            registry.put(ViewCell(3, 0., 0., 0., 1.))
+    finally:
+        reader.close()
+        registry.close()
+    with pytest.raises(FileNotFoundError):
+        TemplateRegistry.attach(registry.name)